@@ -0,0 +1,452 @@
+import os
+import json
+import hashlib
+import numpy as np
+from sparse_index import CompressedIndex
+from instrumentation import span, count
+
+
+DIMENSIONS = 128 # the default number of dimensions of the reduced document vectors
+NPROBE = 8 # the default number of clusters searched per query, more clusters find more of the exact results but take longer
+RERANK = 100 # the default number of candidates of a query whose exact scores are calculated
+KMEANS_ITERATIONS = 10 # the number of refinements of the clusters when the index is built
+CHUNK_ROWS = 4096 # the number of document vectors compared with the centroids at a time, so the similarity matrix stays small
+
+
+def ann_path(index_path='index.vsm'):
+    """
+    This function returns the path of the ANN index that goes with an index file, e.g. 'index.ann' for 'index.vsm'.
+    """
+
+    return os.path.splitext(index_path)[0] + '.ann'
+
+
+def index_signature(index):
+    """
+    This function identifies the TF-IDF weights an ANN index was built from, by the documents, the IDF weights and the norms of the document vectors.
+
+    Returns:
+        signature (str): A hex digest, which changes whenever the index is rebuilt from different documents.
+    """
+
+    digest = hashlib.sha1()
+    for array in (index.docIDs, index.idf, index.norms):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def vocabulary_signature(terms):
+    """
+    This function identifies the vocabulary of an index, the terms in term ID order, so an ANN index can tell whether its projection still applies.
+
+    Returns:
+        signature (str): A hex digest, which changes whenever a term is added or removed.
+    """
+
+    digest = hashlib.sha1()
+    for term in terms:
+        digest.update(term.encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+def _product(rows, columns, weights, matrix, size):
+    """
+    This function multiplies a sparse matrix, given as the row, column and weight of each of its non-zero entries, by a dense matrix.
+
+    Every column of the product is a single bincount over the non-zero entries, so the product takes no more memory than the entries and the result.
+
+    Args:
+        rows, columns (ndarray): The row and column of every non-zero entry of the sparse matrix.
+        weights (ndarray): The value of every non-zero entry.
+        matrix (ndarray): The dense matrix, with a row per column of the sparse matrix.
+        size (int): The number of rows of the sparse matrix.
+
+    Returns:
+        product (ndarray): The size x matrix.shape[1] product.
+    """
+
+    columns_first = np.ascontiguousarray(matrix.T) # a contiguous row per column of the dense matrix, gathered once per column of the product
+    product = np.empty((matrix.shape[1], size))
+    for j, column in enumerate(columns_first):
+        product[j] = np.bincount(rows, weights=weights * column[columns], minlength=size)
+    return product.T
+
+
+def truncated_svd(terms, doc_index, weights, shape, dimensions, oversampling=10, power_iterations=2, seed=0):
+    """
+    This function calculates the truncated SVD of the document-term matrix with a randomized range finder (Halko, Martinsson and Tropp), i.e. Latent Semantic Analysis.
+
+    The matrix is only multiplied by dense matrices of dimensions + oversampling columns (see _product), and the SVD itself is calculated
+    on a small dense matrix, so neither the document-term matrix nor its Gram matrix is ever formed.
+
+    Args:
+        terms, doc_index (ndarray): The term ID and the document position of every posting.
+        weights (ndarray): The weight of every posting.
+        shape (tuple): The number of documents and the number of terms.
+        dimensions (int): The number of singular vectors to keep.
+        oversampling (int): The number of extra random directions, which make the kept singular vectors more accurate.
+        power_iterations (int): The number of power iterations, which make the kept singular vectors more accurate when the singular values decay slowly, as they do for text.
+        seed (int): The seed of the random directions.
+
+    Returns:
+        projection (ndarray): The terms x dimensions matrix of the right singular vectors, which projects a term vector to the reduced space.
+        vectors (ndarray): The documents x dimensions reduced document vectors, the projections of the rows of the matrix.
+    """
+
+    documents, vocabulary = shape
+    rank = min(dimensions + oversampling, documents, vocabulary)
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(_product(doc_index, terms, weights, rng.standard_normal((vocabulary, rank)), documents))[0] # an orthonormal basis of the range of the matrix
+    for _ in range(power_iterations):
+        basis = np.linalg.qr(_product(terms, doc_index, weights, basis, vocabulary))[0]
+        basis = np.linalg.qr(_product(doc_index, terms, weights, basis, documents))[0]
+    small = _product(terms, doc_index, weights, basis, vocabulary).T # the rank x terms projection of the matrix onto the basis
+    u, s, vt = np.linalg.svd(small, full_matrices=False)
+    dimensions = min(dimensions, rank)
+    return vt[:dimensions].T, (basis @ u[:, :dimensions]) * s[:dimensions]
+
+
+def random_projection(terms, doc_index, weights, shape, dimensions, seed=0):
+    """
+    This function projects the document vectors to a random subspace, which preserves their dot products in expectation (Johnson-Lindenstrauss).
+
+    It is much cheaper to build than truncated_svd, but needs more dimensions for the same recall. The arguments and the results are the same as truncated_svd's.
+    """
+
+    documents, vocabulary = shape
+    projection = np.random.default_rng(seed).standard_normal((vocabulary, dimensions)) / np.sqrt(dimensions)
+    return projection, _product(doc_index, terms, weights, projection, documents)
+
+
+def _normalize_rows(vectors):
+    """
+    This function divides every row by its L2 norm, rows of zeros are left as they are.
+    """
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def _assign(vectors, centroids):
+    """
+    This function returns the most similar centroid of every vector, comparing CHUNK_ROWS vectors at a time.
+    """
+
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), CHUNK_ROWS):
+        assignment[start:start + CHUNK_ROWS] = np.argmax(vectors[start:start + CHUNK_ROWS] @ centroids.T, axis=1)
+    return assignment
+
+
+def spherical_kmeans(vectors, clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    This function clusters normalized vectors by cosine similarity with k-means.
+
+    The centroids start as randomly chosen vectors. Every iteration assigns each vector to its most similar centroid, and replaces each centroid
+    by the normalized sum of its vectors. A centroid left without vectors starts again from a random vector.
+
+    Args:
+        vectors (ndarray): The normalized vectors, one per row.
+        clusters (int): The number of clusters, at most the number of vectors.
+        iterations (int): The number of iterations.
+        seed (int): The seed of the initial centroids.
+
+    Returns:
+        centroids (ndarray): The normalized centroid of every cluster.
+        assignment (ndarray): The cluster of every vector.
+    """
+
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        sizes = np.bincount(assignment, minlength=clusters)
+        starts = np.cumsum(sizes) - sizes
+        filled = sizes > 0
+        centroids[filled] = _normalize_rows(np.add.reduceat(vectors[order], starts[filled], axis=0)) # the sum of the vectors of every cluster that has any
+        empty = np.flatnonzero(~filled)
+        centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids, _assign(vectors, centroids)
+
+
+def _inverted_lists(assignment, clusters):
+    """
+    This function groups the documents by cluster.
+
+    Returns:
+        order (ndarray): The positions of the documents of each cluster stored together, in docID order within a cluster.
+        list_offsets (ndarray): The documents of cluster c are at positions list_offsets[c] to list_offsets[c + 1] of the order.
+    """
+
+    order = np.argsort(assignment, kind='stable')
+    list_offsets = np.zeros(clusters + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=clusters), out=list_offsets[1:])
+    return order, list_offsets
+
+
+def _document_vectors(index):
+    """
+    This function returns the normalized TF-IDF postings of an index and the term ID of every posting, the document-term matrix an ANN index reduces.
+    """
+
+    if isinstance(index, CompressedIndex):
+        index = index.decompress()
+    index = index.normalize() # the reduced vectors approximate the cosine similarities
+    return index, np.repeat(np.arange(len(index.terms)), index.df)
+
+
+class ANNIndex:
+    """
+    An approximate nearest neighbour index of the document vectors, for long queries (e.g. a whole document, 'more like this').
+
+    The TF-IDF document vectors are reduced to a few dimensions, with a truncated SVD (Latent Semantic Analysis) or a random projection, and
+    clustered with spherical k-means into an inverted file (IVF): the reduced vectors of the documents of each cluster are stored together.
+    A query vector is reduced with the same projection, compared with the centroids, and only the documents of the nprobe most similar
+    clusters are scored, with a dense matrix-vector product. The rerank best of those candidates are then scored exactly, by looking them up
+    in the postings lists of the query terms of the TF-IDF index, which are memory-mapped, so the ANN index holds no second copy of the weights. The cost of a query depends on the number of dimensions and the number of documents
+    probed and reranked, instead of on the postings lists of its terms, so it stays flat as queries get longer.
+
+    The nprobe and rerank of a query trade recall against latency, see benchmark.evaluate_ann.
+
+    Attributes:
+        projection (ndarray): The terms x dimensions matrix that reduces a TF-IDF vector, by term ID.
+        centroids (ndarray): The normalized centroid of every cluster.
+        list_offsets (ndarray): The documents of cluster c are stored at positions list_offsets[c] to list_offsets[c + 1] of the lists.
+        list_documents (ndarray): The position in the docIDs array of the documents of every cluster, cluster by cluster.
+        vectors (ndarray): The normalized reduced vector of the documents of every cluster, in the same order as list_documents.
+        docIDs (ndarray): The sorted document IDs of the index.
+        settings (dict): How the index was built: 'dimensions', 'method', 'clusters', the 'signature' of the TF-IDF weights (see index_signature) and the signature of the 'vocabulary' (see vocabulary_signature).
+    """
+
+    def __init__(self, projection, centroids, list_offsets, list_documents, vectors, docIDs, settings):
+        self.projection = np.asarray(projection, dtype=np.float32)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_documents = np.asarray(list_documents, dtype=np.int32)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.docIDs = np.asarray(docIDs, dtype=np.int64)
+        self.settings = settings
+
+    @classmethod
+    def build(cls, index, dimensions=DIMENSIONS, method='svd', clusters=None, iterations=KMEANS_ITERATIONS, seed=0):
+        """
+        This function builds the ANN index of a TF-IDF index.
+
+        Args:
+            index (SparseIndex or CompressedIndex): The TF-IDF postings, including the IDF weights. The document vectors are normalized first if they are not.
+            dimensions (int): The number of dimensions of the reduced vectors, at most the number of documents and of terms.
+            method (str): 'svd' for a truncated SVD, or 'random' for a random projection.
+            clusters (int): The number of clusters, None for the square root of the number of documents.
+            iterations (int): The number of k-means iterations.
+            seed (int): The seed of the random directions and of the initial centroids.
+
+        Returns:
+            ann (ANNIndex): The ANN index.
+        """
+
+        if method not in ('svd', 'random'):
+            raise ValueError("the reduction method must be 'svd' or 'random', not {!r}".format(method))
+        signature = index_signature(index)
+        index, terms = _document_vectors(index)
+        shape = (len(index.docIDs), len(index.terms))
+
+        with span('ann_reduction'):
+            reduce = truncated_svd if method == 'svd' else random_projection
+            projection, vectors = reduce(terms, index.doc_index, index.weights, shape, min(dimensions, *shape), seed=seed)
+            vectors = _normalize_rows(vectors).astype(np.float32)
+        with span('ann_clustering'):
+            clusters = min(max(1, int(round(np.sqrt(shape[0])))) if clusters is None else clusters, shape[0])
+            centroids, assignment = spherical_kmeans(vectors, clusters, iterations, seed)
+            order, list_offsets = _inverted_lists(assignment, clusters)
+        count('ann_clusters', clusters)
+
+        settings = {'dimensions': dimensions, 'method': method, 'clusters': clusters, 'signature': signature, 'vocabulary': vocabulary_signature(index.terms)}
+        return cls(projection, centroids, list_offsets, order, vectors[order], index.docIDs, settings)
+
+    def can_refresh(self, index):
+        """
+        This function tells whether refresh can bring the ANN index up to date with a TF-IDF index, i.e. whether the index has the vocabulary the projection was built for.
+        """
+
+        return self.settings.get('vocabulary') == vocabulary_signature(index.terms) # ANN indexes of earlier versions do not record their vocabulary
+
+    def refresh(self, index):
+        """
+        This function brings the ANN index up to date with a TF-IDF index of the same vocabulary, e.g. after documents were added, changed or deleted.
+
+        The projection and the centroids are kept: the document vectors are only reduced with the projection and assigned to their most
+        similar centroid, a single product of the postings with the projection, without the power iterations of the truncated SVD or the
+        iterations of k-means. The clusters are not adjusted to the new documents, so the recall slowly drops as the documents drift
+        away from the ones the index was built from, until the ANN index is built again.
+
+        Args:
+            index (SparseIndex or CompressedIndex): The TF-IDF postings, including the IDF weights, see can_refresh.
+
+        Returns:
+            ann (ANNIndex): The refreshed ANN index.
+        """
+
+        signature = index_signature(index)
+        index, terms = _document_vectors(index)
+        with span('ann_reduction'):
+            vectors = _normalize_rows(_product(index.doc_index, terms, index.weights, self.projection.astype(np.float64), len(index.docIDs))).astype(np.float32)
+        with span('ann_clustering'):
+            order, list_offsets = _inverted_lists(_assign(vectors, self.centroids), len(self.centroids))
+        return ANNIndex(self.projection, self.centroids, list_offsets, order, vectors[order], index.docIDs, dict(self.settings, signature=signature))
+
+    def embed(self, term_ids, query_vector):
+        """
+        This function reduces a query vector with the projection of the index.
+
+        Args:
+            term_ids (list): The term IDs of the query terms, as returned by search.calculate_QueryVector.
+            query_vector (ndarray): The weight of each of those terms.
+
+        Returns:
+            vector (ndarray): The normalized reduced query vector, None if the query has no terms with a weight.
+        """
+
+        if len(term_ids) == 0:
+            return None
+        vector = np.asarray(query_vector, dtype=np.float32) @ self.projection[np.asarray(term_ids, dtype=np.int64)]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    @staticmethod
+    def exact_scores(term_ids, query_vector, documents, index):
+        """
+        This function calculates the cosine similarities of a query with some documents, from the postings of the query terms in the TF-IDF index.
+
+        The documents are looked up in the postings list of every query term by binary search (see SparseIndex.find_documents), so only
+        the postings lists of the query terms are read, and of a compressed index only the blocks that may hold one of the documents.
+
+        Args:
+            term_ids (list): The term IDs of the query terms.
+            query_vector (ndarray): The normalized weight of each of those terms.
+            documents (ndarray): The positions of the documents in the docIDs array.
+            index (SparseIndex or CompressedIndex): The TF-IDF index the ANN index was built from, normalized or not. The scores of a compressed index are calculated from its quantized weights.
+
+        Returns:
+            scores (ndarray): The score of every document.
+        """
+
+        order = np.argsort(documents, kind='stable') # find_documents looks up sorted documents
+        lookups = np.asarray(documents, dtype=np.int64)[order]
+        scores = np.zeros(len(documents))
+        for t, weight in zip(term_ids, query_vector):
+            ranks = index.find_documents(t, lookups)
+            found = ranks >= 0
+            scores[order[found]] += weight * index.posting_weights(t, ranks[found])
+        if not index.normalized: # divide by the norms of the document vectors, as ANNIndex.build does
+            norms = index.norms[documents]
+            scores /= np.where(norms > 0, norms, 1.0)
+        return scores
+
+    def search(self, term_ids, query_vector, index, k=10, nprobe=NPROBE, rerank=RERANK):
+        """
+        This function finds approximately the k documents most similar to a query.
+
+        The documents of the nprobe clusters closest to the query are scored by the similarity of their reduced vectors to the reduced query vector,
+        and the rerank best of them are scored exactly, with exact_scores. With a rerank of 0 the scores of the reduced vectors are returned instead.
+
+        Args:
+            term_ids (list): The term IDs of the query terms, as returned by search.calculate_QueryVector.
+            query_vector (ndarray): The normalized weight of each of those terms.
+            index (SparseIndex or CompressedIndex): The TF-IDF index the ANN index was built from, whose postings the candidates are reranked with.
+            k (int): The number of documents to return.
+            nprobe (int): The number of clusters to search, every cluster searches every document exhaustively.
+            rerank (int): The number of candidates to score exactly, at least k unless it is 0.
+
+        Returns:
+            results (list): (docID, score) tuples of at most k documents with a positive score, ranked by score.
+        """
+
+        vector = self.embed(term_ids, query_vector)
+        if vector is None or k <= 0:
+            return []
+        clusters = len(self.centroids)
+        nprobe = min(max(1, nprobe), clusters)
+        centroid_scores = self.centroids @ vector
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < clusters else np.arange(clusters)
+
+        lengths = self.list_offsets[probed + 1] - self.list_offsets[probed]
+        starts = np.zeros(len(probed), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=starts[1:])
+        rows = np.repeat(self.list_offsets[probed] - starts, lengths) + np.arange(lengths.sum()) # the positions of the documents of the probed clusters in the lists
+        scores = self.vectors[rows] @ vector
+        count('ann_clusters_probed', nprobe)
+        count('ann_candidates', len(rows))
+
+        candidates = max(k, rerank) if rerank else k
+        if candidates < len(rows):
+            best = np.argpartition(-scores, candidates - 1)[:candidates]
+            rows, scores = rows[best], scores[best]
+        documents = self.list_documents[rows]
+        if rerank:
+            scores = self.exact_scores(term_ids, query_vector, documents, index)
+            count('ann_reranked', len(documents))
+            if k < len(documents):
+                best = np.argpartition(-scores, k - 1)[:k]
+                documents, scores = documents[best], scores[best]
+        docIDs = self.docIDs[documents]
+        order = np.lexsort((docIDs, -scores)) # by descending score, ties by docID
+        return [(int(docIDs[i]), float(scores[i])) for i in order if scores[i] > 0]
+
+    def save(self, path='index.ann'):
+        """
+        This function saves the ANN index, under a temporary name first so a crash never leaves a partial file behind.
+        """
+
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, projection=self.projection, centroids=self.centroids, list_offsets=self.list_offsets, list_documents=self.list_documents,
+                     vectors=self.vectors, docIDs=self.docIDs, settings=np.array(json.dumps(self.settings)))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path='index.ann'):
+        """
+        This function loads an ANN index saved by save. The weights stored by document in the files of earlier versions are not read.
+        """
+
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['projection'], data['centroids'], data['list_offsets'], data['list_documents'], data['vectors'], data['docIDs'],
+                       json.loads(str(data['settings'])))
+
+
+def read_settings(path='index.ann'):
+    """
+    This function returns how a saved ANN index was built, see ANNIndex.settings, None if there is no ANN index.
+    """
+
+    if not os.path.isfile(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(str(data['settings']))
+
+
+def load_ann(path, index):
+    """
+    This function loads the ANN index built from a TF-IDF index.
+
+    Args:
+        path (str): The path of the ANN index.
+        index (SparseIndex or CompressedIndex): The TF-IDF index being searched.
+
+    Returns:
+        ann (ANNIndex): The ANN index, None if there is none or if it was built from other TF-IDF weights.
+    """
+
+    if not os.path.isfile(path):
+        return None
+    ann = ANNIndex.load(path)
+    return ann if ann.settings['signature'] == index_signature(index) else None
+
+
+def delete_ann(path='index.ann'):
+    """
+    This function deletes an ANN index, which would be out of date once its index is rebuilt without one.
+    """
+
+    if os.path.isfile(path):
+        os.remove(path)
@@ -0,0 +1,136 @@
+import time
+import asyncio
+from search import Searcher
+
+
+class AsyncSearcher:
+    """
+    An asyncio interface to a Searcher, that shares work between concurrent queries.
+
+    Identical queries (with the same stemmed terms and parameters) that are in flight at the same time are coalesced into a
+    single computation, whose results are given to all of them. Distinct queries arriving within batch_window seconds of each
+    other are grouped, up to max_batch_size queries, and scored together with one Searcher.search_batch call in a worker thread,
+    so the event loop is never blocked by scoring. A batch is sent as soon as it is full, or when the oldest query in it would
+    otherwise run out of its latency budget.
+
+    Attributes:
+        searcher (Searcher): The searcher scoring the batches.
+        batch_window (float): The number of seconds to wait for more queries before sending a batch.
+        max_batch_size (int): The largest number of distinct queries in a batch.
+        latency_budget (float): The number of seconds a query may wait in total, None for no limit. A query that takes longer raises asyncio.TimeoutError.
+        coalesced (int): The number of queries that were answered by another query's computation.
+        batches (int): The number of batches scored.
+    """
+
+    def __init__(self, searcher=None, batch_window=0.005, max_batch_size=64, latency_budget=1.0):
+        self.searcher = searcher if searcher is not None else Searcher()
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.latency_budget = latency_budget
+        self.coalesced = 0
+        self.batches = 0
+        self._in_flight = {} # key -> future of the results, for the queries being computed
+        self._pending = {} # (k, threshold) -> [(key, query, future, deadline)], the queries waiting for their batch to be sent
+        self._timers = {} # (k, threshold) -> the timer that sends the pending batch
+
+    async def search(self, query, k=None, threshold=None):
+        """
+        This function answers a query, sharing the computation with the other concurrent queries.
+
+        Args:
+            query (str): The query string to be processed.
+            k (int): The number of documents to return, None to return every document with a score greater than or equal to the threshold.
+            threshold (float): The minimum similarity score of a document to be returned, None for the default threshold of the searcher.
+
+        Returns:
+            results (list): (docID, score) tuples ranked by score, the same as Searcher.search_batch returns for the query.
+
+        Raises:
+            asyncio.TimeoutError: If the query is not answered within the latency budget.
+        """
+
+        terms, constraints = self.searcher.analyze(query, self.searcher.index)
+        key = (tuple(sorted(terms)), constraints, k, threshold) # queries with the same terms and operators have the same results
+        future = self._in_flight.get(key)
+        if future is not None: # the same query is already being answered
+            self.coalesced += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[key] = future
+            self._enqueue(key, query, future, k, threshold)
+
+        if self.latency_budget is None:
+            return await asyncio.shield(future)
+        return await asyncio.wait_for(asyncio.shield(future), self.latency_budget) # shielded, so a timed out query does not cancel the shared computation
+
+    def _enqueue(self, key, query, future, k, threshold):
+        """
+        This function adds a query to the pending batch of its parameters, and schedules the batch to be sent.
+        """
+
+        loop = asyncio.get_running_loop()
+        group = (k, threshold)
+        deadline = loop.time() + (self.latency_budget if self.latency_budget is not None else float('inf'))
+        self._pending.setdefault(group, []).append((key, query, future, deadline))
+
+        if len(self._pending[group]) >= self.max_batch_size: # a full batch is sent right away
+            self._flush(group)
+        elif group not in self._timers:
+            oldest_deadline = self._pending[group][0][3]
+            delay = min(self.batch_window, max(0.0, (oldest_deadline - loop.time()) / 2)) # leave at least half of the budget for scoring
+            self._timers[group] = loop.call_later(delay, self._flush, group)
+
+    def _flush(self, group):
+        """
+        This function sends the pending batch of a group of queries to a worker thread.
+        """
+
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(group, [])
+        if batch:
+            self.batches += 1
+            asyncio.get_running_loop().create_task(self._run_batch(group, batch))
+
+    async def _run_batch(self, group, batch):
+        """
+        This function scores a batch of queries in a worker thread, and gives each query its results.
+        """
+
+        k, threshold = group
+        queries = [query for _, query, _, _ in batch]
+        try:
+            results = await asyncio.to_thread(self.searcher.search_batch, queries, k, threshold)
+        except Exception as error: # every query of the batch fails with the error
+            results = [error] * len(batch)
+
+        for (key, _, future, _), result in zip(batch, results):
+            self._in_flight.pop(key, None)
+            if future.done(): # cancelled
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+async def search_all(queries, k=None, threshold=None, **options):
+    """
+    This function answers many concurrent queries with an AsyncSearcher, e.g. to replay a query log.
+
+    Args:
+        queries (list): The query strings.
+        k (int): The number of documents to return for each query.
+        threshold (float): The minimum similarity score of a document to be returned, None for the default threshold of the searcher.
+        options: The options of the AsyncSearcher.
+
+    Returns:
+        results (list): The results of each query.
+        elapsed (float): The number of seconds it took to answer all the queries.
+    """
+
+    searcher = AsyncSearcher(**options)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(searcher.search(query, k, threshold) for query in queries))
+    return results, time.perf_counter() - start
@@ -0,0 +1,431 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import contextlib
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+import weights_calculation as wc
+from sparse_index import write_index
+from search import Searcher, find_sim, get_searcher, calculate_QueryVector, topk_maxscore
+from ann_index import ANNIndex, RERANK
+
+try:
+    import resource # not available on Windows
+except ImportError:
+    resource = None
+
+
+SYLLABLES = [consonant + vowel for consonant in 'bcdfghjklmnprstvz' for vowel in 'aeiou'] # the building blocks of the synthetic words
+STOPWORDS = ['a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'with'] # used when there is no 'Stopword-List.txt' to copy
+
+
+def make_word(rank):
+    """
+    This function returns the synthetic word of a vocabulary rank, made of at least two syllables so it survives the text analysis.
+    """
+
+    syllables = []
+    rank += len(SYLLABLES) # every word has at least two syllables
+    while rank:
+        rank, syllable = divmod(rank, len(SYLLABLES))
+        syllables.append(SYLLABLES[syllable])
+    return ''.join(reversed(syllables))
+
+
+def zipf_probabilities(vocabulary, exponent=1.1):
+    """
+    This function returns the probability of each rank of a Zipfian vocabulary, where the word of rank r occurs in proportion to 1 / r ** exponent.
+    """
+
+    weights = 1.0 / np.arange(1, vocabulary + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_corpus(directory, documents=1000, vocabulary=20000, length=300, exponent=1.1, stopword_rate=0.3, seed=0):
+    """
+    This function generates a synthetic corpus laid out like the real one: a 'ResearchPapers' directory of '<docID>.txt' files and a 'Stopword-List.txt' file.
+
+    The words of the documents are drawn from a Zipfian vocabulary of synthetic words, mixed with stopwords, punctuation and numbers
+    so that every step of the text analysis has work to do. The document lengths are drawn from an exponential distribution.
+
+    Args:
+        directory (str): The directory to generate the corpus in.
+        documents (int): The number of documents.
+        vocabulary (int): The number of distinct words.
+        length (int): The average number of words of a document.
+        exponent (float): The exponent of the Zipfian distribution of the words.
+        stopword_rate (float): The fraction of the words that are stopwords.
+        seed (int): The seed of the random number generator, the same seed always generates the same corpus.
+
+    Returns:
+        stats (dict): The number of documents and words, and the size of the corpus in bytes.
+    """
+
+    rng = np.random.default_rng(seed)
+    papers = os.path.join(directory, 'ResearchPapers')
+    os.makedirs(papers, exist_ok=True)
+    if os.path.isfile('Stopword-List.txt'): # the stopwords of the real corpus, if there is one in the current working directory
+        shutil.copy('Stopword-List.txt', directory)
+        stopwords = [word for word in wc.get_stopwords() if word]
+    else:
+        stopwords = STOPWORDS
+        with open(os.path.join(directory, 'Stopword-List.txt'), 'w') as f:
+            f.write('\n'.join(stopwords) + '\n')
+
+    words = np.array([make_word(rank) for rank in range(vocabulary)])
+    probabilities = zipf_probabilities(vocabulary, exponent)
+    total_words = 0
+    total_bytes = 0
+    for docID in range(1, documents + 1):
+        n = max(1, int(rng.exponential(length)))
+        text = words[rng.choice(vocabulary, size=n, p=probabilities)].astype(object)
+        stop = rng.random(n) < stopword_rate
+        text[stop] = rng.choice(stopwords, size=int(stop.sum()))
+        decorated = rng.random(n) < 0.05 # a few tokens get punctuation or numbers around them
+        text[decorated] = [word + rng.choice(['.', ',', '2', ')']) for word in text[decorated]]
+        lines = [' '.join(text[i:i + 12]) for i in range(0, n, 12)]
+        data = '\n'.join(lines) + '\n'
+        with open(os.path.join(papers, '{}.txt'.format(docID)), 'w') as f:
+            f.write(data)
+        total_words += n
+        total_bytes += len(data)
+    return {'documents': documents, 'vocabulary': vocabulary, 'words': total_words, 'bytes': total_bytes}
+
+
+def generate_queries(count, vocabulary, exponent=1.1, max_terms=4, seed=1):
+    """
+    This function generates queries of 1 to max_terms words, drawn from the same Zipfian vocabulary as the corpus.
+    """
+
+    rng = np.random.default_rng(seed)
+    probabilities = zipf_probabilities(vocabulary, exponent)
+    return [' '.join(make_word(int(rank)) for rank in rng.choice(vocabulary, size=int(rng.integers(1, max_terms + 1)), p=probabilities)) for _ in range(count)]
+
+
+def generate_document_queries(count, words=100, seed=2):
+    """
+    This function generates long queries from the corpus in the current working directory: the first words of randomly chosen documents, as a 'more like this' search would.
+    """
+
+    rng = np.random.default_rng(seed)
+    docIDs = wc.get_docIDs()
+    queries = []
+    for docID in rng.choice(docIDs, size=count):
+        with open(os.path.join('ResearchPapers', '{}.txt'.format(docID)), 'r') as f:
+            queries.append(' '.join(f.read().split()[:words]))
+    return queries
+
+
+def time_indexing(processes=None):
+    """
+    This function times each stage of save_weights on the corpus in the current working directory, then save_weights as a whole.
+
+    Returns:
+        timings (dict): The number of seconds taken by preprocessing, TF, IDF, TF-IDF, serialization and the whole of save_weights, and the size of the index file.
+    """
+
+    timings = {}
+    start = time.perf_counter()
+    counts = wc.collect_counts(wc.preprocessing(processes), wc.get_docIDs())
+    timings['preprocessing'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tf = wc.calculate_TF(counts)
+    timings['tf'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    idf = wc.calculate_IDF(tf)
+    timings['idf'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tf_idf = wc.calculate_TFIDF(tf, idf).normalize()
+    timings['tf_idf'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    write_index(tf_idf, 'index.vsm')
+    timings['serialization'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    wc.save_weights()
+    timings['save_weights'] = time.perf_counter() - start
+    timings['index_bytes'] = os.path.getsize('index.vsm')
+    timings['terms'] = len(tf_idf.terms)
+    timings['postings'] = int(len(tf_idf.weights))
+    return timings
+
+
+def latency_stats(latencies, queries):
+    """
+    This function summarizes the latencies of a run of queries.
+
+    Args:
+        latencies (list): The number of seconds taken by each call.
+        queries (int): The number of queries answered by all the calls.
+
+    Returns:
+        stats (dict): The mean and the 50th, 90th, 99th percentile and largest latency in milliseconds, and the number of queries answered per second.
+    """
+
+    latencies = np.array(latencies) * 1000
+    return {'calls': len(latencies), 'mean_ms': float(latencies.mean()), 'p50_ms': float(np.percentile(latencies, 50)),
+            'p90_ms': float(np.percentile(latencies, 90)), 'p99_ms': float(np.percentile(latencies, 99)), 'max_ms': float(latencies.max()),
+            'queries_per_second': float(queries / (latencies.sum() / 1000))}
+
+
+def time_queries(queries, batch_size=64):
+    """
+    This function measures the latency and throughput of find_sim and of the Searcher, one query at a time and in batches.
+
+    'find_sim' goes through the shared searcher, with its query cache, so repeated queries are answered from the cache like they would be
+    in use. The other runs use a searcher without a cache: 'search' scores every query exhaustively, 'search_topk' finds the 10 best
+    documents with MaxScore, and 'search_batch' scores batch_size queries per call. Every run uses the default threshold of the searcher,
+    which depends on the kind of scores (see search.Searcher).
+
+    Returns:
+        results (dict): The latency_stats of every run.
+    """
+
+    results = {}
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        find_sim(query)
+        latencies.append(time.perf_counter() - start)
+    results['find_sim'] = latency_stats(latencies, len(queries))
+    results['find_sim']['cache'] = get_searcher().cache.stats()
+
+    searcher = Searcher(cache_bytes=0)
+    for name, call in (('search', lambda query: searcher.search(query)), ('search_topk', lambda query: searcher.search_topk(query, 10))):
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            call(query)
+            latencies.append(time.perf_counter() - start)
+        results[name] = latency_stats(latencies, len(queries))
+
+    latencies = []
+    for i in range(0, len(queries), batch_size):
+        start = time.perf_counter()
+        searcher.search_batch(queries[i:i + batch_size], 10)
+        latencies.append(time.perf_counter() - start)
+    results['search_batch'] = latency_stats(latencies, len(queries))
+    results['search_batch']['batch_size'] = batch_size
+    return results
+
+
+def evaluate_ann(queries, k=10, dimensions=128, methods=('svd', 'random'), nprobes=(1, 2, 4, 8, 16, 32), reranks=(0, RERANK)):
+    """
+    This function measures the recall and the latency of the ANN index (see ann_index.py) against the exact top-k search, for every reduction method, number of probed clusters and number of reranked candidates.
+
+    The recall@k of a query is the fraction of its k exact best documents, as found by topk_maxscore, that the ANN search returns as well.
+    Both searches are timed from the query vector, so the time spent analyzing the query is left out of either.
+
+    Args:
+        queries (list): The query strings, see generate_document_queries.
+        k (int): The number of documents of each search.
+        dimensions (int): The number of dimensions of the reduced vectors.
+        methods (tuple): The reduction methods to build an ANN index with, see ANNIndex.build.
+        nprobes (tuple): The numbers of clusters to search.
+        reranks (tuple): The numbers of candidates to score exactly, 0 to rank them by the similarity of the reduced vectors.
+
+    Returns:
+        results (dict): The latency_stats of the exact search, and for every method its build time, its size, and the mean recall@k and the latency_stats of every nprobe and rerank.
+    """
+
+    searcher = Searcher(cache_bytes=0)
+    index = searcher.index
+    vectors = [calculate_QueryVector(searcher.analyze(query, index)[0], index) for query in queries]
+
+    exact = []
+    latencies = []
+    for term_ids, query_vector in vectors:
+        start = time.perf_counter()
+        results = topk_maxscore(term_ids, query_vector, index, k, 0.0)[0]
+        latencies.append(time.perf_counter() - start)
+        exact.append({docID for docID, _ in results})
+    results = {'k': k, 'dimensions': dimensions, 'queries': len(queries), 'exact': latency_stats(latencies, len(queries))}
+
+    for method in methods:
+        start = time.perf_counter()
+        ann = ANNIndex.build(index, dimensions, method)
+        build_seconds = time.perf_counter() - start
+        results[method] = {'build_seconds': build_seconds, 'clusters': ann.settings['clusters'],
+                           'bytes': sum(array.nbytes for name, array in vars(ann).items() if isinstance(array, np.ndarray))}
+        for nprobe in [nprobe for nprobe in nprobes if nprobe <= ann.settings['clusters']]:
+            for rerank in reranks:
+                recalls = []
+                latencies = []
+                for (term_ids, query_vector), expected in zip(vectors, exact):
+                    start = time.perf_counter()
+                    found = ann.search(term_ids, query_vector, index, k, nprobe, rerank)
+                    latencies.append(time.perf_counter() - start)
+                    recalls.append(len(expected.intersection(docID for docID, _ in found)) / len(expected) if expected else 1.0)
+                results[method]['nprobe_{}_rerank_{}'.format(nprobe, rerank)] = dict(latency_stats(latencies, len(queries)), recall=float(np.mean(recalls)))
+    return results
+
+
+def peak_memory(function, *args):
+    """
+    This function returns the peak memory allocated while a function runs, as traced by tracemalloc (numpy arrays included, worker processes excluded).
+    """
+
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_memory(queries, batch_size=64):
+    """
+    This function measures the peak memory of indexing and of answering the queries one at a time and in batches, in a separate run
+    from the timings since tracing the allocations slows everything down.
+
+    Returns:
+        memory (dict): The peak traced bytes of each run, and the peak resident set size of the process where available.
+    """
+
+    searcher = Searcher(cache_bytes=0)
+    memory = {
+        'indexing_bytes': peak_memory(lambda: wc.build_index(wc.collect_counts(wc.preprocessing(1), wc.get_docIDs()), 'index.vsm')),
+        'single_query_bytes': peak_memory(lambda: [searcher.search(query) for query in queries]),
+        'batch_query_bytes': peak_memory(lambda: [searcher.search_batch(queries[i:i + batch_size], 10) for i in range(0, len(queries), batch_size)]),
+    }
+    if resource is not None:
+        scale = 1 if sys.platform == 'darwin' else 1024 # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        memory['max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return memory
+
+
+def git_commit():
+    """
+    This function returns the commit the benchmark runs on, None outside of a git checkout.
+    """
+
+    try:
+        output = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(documents=1000, vocabulary=20000, length=300, exponent=1.1, queries=500, batch_size=64, processes=None, directory=None, seed=0, ann_queries=0):
+    """
+    This function generates a synthetic corpus, indexes it and answers queries on it, and returns every measurement.
+
+    Args:
+        documents, vocabulary, length, exponent: The size of the corpus, see generate_corpus.
+        queries (int): The number of queries.
+        batch_size (int): The number of queries of a batch.
+        processes (int): The number of preprocessing processes, None for one per CPU.
+        directory (str): The directory to generate the corpus in, None for a temporary directory that is deleted afterwards.
+        seed (int): The seed of the corpus and the queries.
+        ann_queries (int): The number of long queries to evaluate the ANN index with, see evaluate_ann, 0 to leave it out.
+
+    Returns:
+        results (dict): The configuration, the environment and the measurements, ready to be saved as JSON.
+    """
+
+    temporary = directory is None
+    directory = tempfile.mkdtemp(prefix='vsm-benchmark-') if temporary else directory
+    cwd = os.getcwd()
+    try:
+        corpus = generate_corpus(directory, documents, vocabulary, length, exponent, seed=seed)
+        query_list = generate_queries(queries, vocabulary, exponent, seed=seed + 1)
+        os.chdir(directory) # the indexer and the searcher work in the current working directory
+        for name in ('index.vsm', 'index.stems'):
+            if os.path.isfile(name):
+                os.remove(name)
+        shutil.rmtree('segments', ignore_errors=True)
+
+        with contextlib.redirect_stdout(sys.stderr): # keep the progress messages of the indexer out of the JSON results
+            indexing = time_indexing(processes)
+            query_results = time_queries(query_list, batch_size)
+            memory = measure_memory(query_list, batch_size)
+            ann = evaluate_ann(generate_document_queries(ann_queries, seed=seed + 2)) if ann_queries else None
+    finally:
+        os.chdir(cwd)
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'commit': git_commit(),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {'documents': documents, 'vocabulary': vocabulary, 'length': length, 'exponent': exponent, 'queries': queries,
+                   'batch_size': batch_size, 'processes': processes, 'seed': seed, 'ann_queries': ann_queries},
+        'corpus': corpus,
+        'indexing': indexing,
+        'queries': query_results,
+        'memory': memory,
+        'ann': ann,
+    }
+
+
+def compare(baseline, results, tolerance=0.1):
+    """
+    This function compares the timings and memory of two benchmark runs and prints the ones that got worse by more than the tolerance.
+
+    Args:
+        baseline (dict): The results of the earlier run.
+        results (dict): The results of the current run.
+        tolerance (float): The relative change that is reported.
+
+    Returns:
+        regressions (list): (metric, baseline value, current value) tuples of the metrics that got worse.
+    """
+
+    def metrics(results): # the measurements where lower is better, as flat 'section.name' keys
+        flat = {'indexing.' + name: value for name, value in results['indexing'].items() if name not in ('terms', 'postings')}
+        for run_name, stats in results['queries'].items():
+            flat.update({'queries.{}.{}'.format(run_name, name): value for name, value in stats.items() if name.endswith('_ms')})
+        flat.update({'memory.' + name: value for name, value in results['memory'].items()})
+        return flat
+
+    if baseline['config'] != results['config']:
+        print("The runs have different configurations, the comparison is not meaningful")
+    before, after = metrics(baseline), metrics(results)
+    regressions = [(name, before[name], after[name]) for name in sorted(before) if name in after and after[name] > before[name] * (1 + tolerance)]
+    for name, old, new in regressions:
+        print("{}: {:.4g} -> {:.4g} ({:+.0%})".format(name, old, new, new / old - 1))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark indexing and searching on a synthetic corpus.')
+    parser.add_argument('--documents', type=int, default=1000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--length', type=int, default=300, help='the average number of words of a document')
+    parser.add_argument('--exponent', type=float, default=1.1, help='the exponent of the Zipfian word distribution')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--processes', type=int, default=None, help='the number of preprocessing processes')
+    parser.add_argument('--directory', default=None, help='generate the corpus in this directory and keep it')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ann-queries', type=int, default=0, help='also report the recall@10 and the latency of the ANN index on this many long queries')
+    parser.add_argument('--output', default=None, help='save the results to this JSON file instead of printing them')
+    parser.add_argument('--baseline', default=None, help='a JSON file of earlier results to report regressions against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='the relative slowdown or memory growth reported as a regression')
+    args = parser.parse_args()
+
+    results = run(args.documents, args.vocabulary, args.length, args.exponent, args.queries, args.batch_size, args.processes, args.directory, args.seed, args.ann_queries)
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main() # execute the main function
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+
+
+TRACE_ENV = 'VSM_TRACE' # the path of the trace log, '-' for stderr, e.g. VSM_TRACE=traces.jsonl python search_service.py
+PROFILE_ENV = 'VSM_PROFILE' # 'cprofile' or 'tracemalloc', e.g. VSM_PROFILE=cprofile python weights_calculation.py --rebuild
+
+_logger = logging.getLogger('vsm.trace')
+_tracing = False # checked first by every hook, so instrumentation costs a single global lookup when it is disabled
+_profile_mode = None
+_local = threading.local() # the trace of the current thread
+_totals_lock = threading.Lock()
+_totals = {'spans': {}, 'counters': {}} # aggregated over every trace, see summary
+_profilers = {} # name -> cProfile.Profile, accumulated over every profiled call
+_profiler_lock = threading.Lock() # held by the thread being profiled, only one thread can be profiled at a time (see _Profiled)
+_unprofiled = {} # name -> the number of calls that ran without the profiler, as another thread was being profiled
+
+
+class _NullContext:
+    """
+    The context returned by the hooks when there is nothing to record. Entering and leaving it does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_CONTEXT = _NullContext()
+
+
+class Trace:
+    """
+    The record of one traced operation, e.g. a query or an indexing run.
+
+    While a trace is active, span and count record into it the time taken by each stage and the counters of the operation.
+    When it ends, it is written to the trace log as one JSON object per line, and added to the totals returned by summary.
+
+    Attributes:
+        name (str): The name of the operation.
+        fields (dict): Extra information written with the trace, e.g. the query.
+        spans (dict): The number of seconds spent in each stage.
+        counters (dict): The counters of the operation.
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.spans = {}
+        self.counters = {}
+
+    def __enter__(self):
+        _local.trace = self
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        _local.trace = None
+        record = {'trace': self.name, 'timestamp': self.timestamp, 'total_ms': elapsed * 1000,
+                  'spans_ms': {name: seconds * 1000 for name, seconds in self.spans.items()}, 'counters': self.counters}
+        record.update(self.fields)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        _logger.info(json.dumps(record, default=str))
+
+        with _totals_lock:
+            for name, seconds in list(self.spans.items()) + [(self.name, elapsed)]:
+                calls, total = _totals['spans'].get(name, (0, 0.0))
+                _totals['spans'][name] = (calls + 1, total + seconds)
+            for name, value in self.counters.items():
+                _totals['counters'][name] = _totals['counters'].get(name, 0) + value
+        return False
+
+
+class _Span:
+    """
+    The timing of one stage of the current trace. The time of stages with the same name is added up.
+    """
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.spans[self.name] = self.trace.spans.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+def enable_tracing(path='-'):
+    """
+    This function turns tracing on and sends the trace log to a file.
+
+    Args:
+        path (str): The path of the trace log, appended to, or '-' for stderr.
+    """
+
+    global _tracing
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stderr) if path == '-' else logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    _logger.addHandler(handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+    _tracing = True
+
+
+def disable_tracing():
+    """
+    This function turns tracing off.
+    """
+
+    global _tracing
+    _tracing = False
+
+
+def tracing_enabled():
+    """
+    This function returns True if tracing is turned on.
+    """
+
+    return _tracing
+
+
+def tracing():
+    """
+    This function returns True if a trace is active in the current thread, so that counters that take work to calculate are only calculated when they are recorded.
+    """
+
+    return _tracing and getattr(_local, 'trace', None) is not None
+
+
+def trace(name, **fields):
+    """
+    This function starts tracing an operation, see Trace.
+
+    A trace started while another one is active in the same thread is part of the outer one: its spans and counters are recorded in the outer trace.
+
+    Args:
+        name (str): The name of the operation.
+        fields: Extra information to write with the trace.
+
+    Returns:
+        context: A context manager for the duration of the operation.
+    """
+
+    if not _tracing or getattr(_local, 'trace', None) is not None:
+        return NULL_CONTEXT
+    return Trace(name, fields)
+
+
+def span(name):
+    """
+    This function times a stage of the current trace.
+
+    Args:
+        name (str): The name of the stage.
+
+    Returns:
+        context: A context manager for the duration of the stage.
+    """
+
+    if not _tracing:
+        return NULL_CONTEXT
+    current = getattr(_local, 'trace', None)
+    return NULL_CONTEXT if current is None else _Span(current, name)
+
+
+def count(name, value=1):
+    """
+    This function adds a value to a counter of the current trace.
+    """
+
+    if _tracing:
+        current = getattr(_local, 'trace', None)
+        if current is not None:
+            current.counters[name] = current.counters.get(name, 0) + value
+
+
+def summary():
+    """
+    This function returns the totals of every trace so far.
+
+    Returns:
+        totals (dict): {'spans': {name: {'calls': calls, 'total_ms': milliseconds}}, 'counters': {name: total}}, the traced operations are included as spans.
+    """
+
+    with _totals_lock:
+        return {'spans': {name: {'calls': calls, 'total_ms': seconds * 1000} for name, (calls, seconds) in _totals['spans'].items()},
+                'counters': dict(_totals['counters'])}
+
+
+class _Profiled:
+    """
+    The context of a profiled call, see profile.
+
+    A cProfile profiler only sees the thread that enabled it, and since Python 3.12 only one profiler can be enabled at a time in the
+    whole interpreter. So with 'cprofile' a single thread is profiled at a time: a call made while another thread is being profiled
+    runs without the profiler, instead of waiting for it or failing, and is only counted.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.outer = not getattr(_local, 'profiling', False) # nested calls are part of the outer one
+        self.profiler = None
+        if self.outer:
+            _local.profiling = True
+            if _profile_mode == 'cprofile':
+                if _profiler_lock.acquire(blocking=False):
+                    if not _profilers:
+                        atexit.register(_report_profiles)
+                    self.profiler = _profilers.setdefault(self.name, cProfile.Profile())
+                    self.profiler.enable()
+                else: # another thread is being profiled
+                    with _totals_lock:
+                        _unprofiled[self.name] = _unprofiled.get(self.name, 0) + 1
+            elif not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                atexit.register(_report_memory)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.outer:
+            if self.profiler is not None:
+                self.profiler.disable()
+                _profiler_lock.release()
+            _local.profiling = False
+        return False
+
+
+def set_profile_mode(mode):
+    """
+    This function sets the profiling mode of the profile hooks.
+
+    Args:
+        mode (str): 'cprofile' to profile the calls with cProfile, 'tracemalloc' to trace their memory allocations, None to stop profiling.
+    """
+
+    global _profile_mode
+    if mode not in (None, 'cprofile', 'tracemalloc'):
+        raise ValueError("the profiling mode must be 'cprofile' or 'tracemalloc', not {!r}".format(mode))
+    _profile_mode = mode
+
+
+def profile(name):
+    """
+    This function profiles a call, when a profiling mode is set.
+
+    With 'cprofile' the calls with the same name are profiled by the same profiler, one thread at a time (see _Profiled), and when the program exits
+    the profile of every name is saved to '<name>.prof' (for pstats or snakeviz) and its slowest functions are printed to stderr. With 'tracemalloc' the memory allocations are traced
+    from the first profiled call, and the peak memory and the lines that allocated the most memory are printed to stderr when the program exits.
+
+    Args:
+        name (str): The name of the profiled operation.
+
+    Returns:
+        context: A context manager for the duration of the call.
+    """
+
+    if _profile_mode is None:
+        return NULL_CONTEXT
+    return _Profiled(name)
+
+
+def _report_profiles():
+    """
+    This function saves and prints the cProfile profiles when the program exits.
+    """
+
+    for name, profiler in _profilers.items():
+        profiler.dump_stats(name + '.prof')
+        print("Profile of {} saved to {}.prof".format(name, name), file=sys.stderr)
+        if _unprofiled.get(name):
+            print("{} calls of {} ran in other threads while one was being profiled, and are not in the profile".format(_unprofiled[name], name), file=sys.stderr)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(15)
+
+
+def _report_memory():
+    """
+    This function prints the peak traced memory and the lines that allocated the most memory when the program exits.
+    """
+
+    current, peak = tracemalloc.get_traced_memory()
+    print("Traced memory: {:.1f} MiB current, {:.1f} MiB peak".format(current / 2 ** 20, peak / 2 ** 20), file=sys.stderr)
+    for statistic in tracemalloc.take_snapshot().statistics('lineno')[:15]:
+        print(statistic, file=sys.stderr)
+
+
+if os.environ.get(TRACE_ENV):
+    enable_tracing(os.environ[TRACE_ENV])
+if os.environ.get(PROFILE_ENV):
+    set_profile_mode(os.environ[PROFILE_ENV])
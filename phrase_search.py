@@ -0,0 +1,144 @@
+import re
+import numpy as np
+
+
+OPERAND = r'("[^"]*"|[^\s"]+)' # a quoted phrase or a word
+NEAR = re.compile(r'(?<![^\s])(?=' + OPERAND + r'\s+NEAR/(\d+)\s+' + OPERAND + ')') # 'a NEAR/k b' at the start of a word, a lookahead so that chained operators ('a NEAR/3 b NEAR/3 c') all match
+NEAR_OPERATOR = re.compile(r'\s+NEAR/\d+\s+')
+PHRASE = re.compile(r'"([^"]*)"')
+
+
+def parse_query(query):
+    """
+    This function finds the phrase and proximity operators of a query.
+
+    A phrase is written between double quotes, e.g. '"vector space model"', and matches the documents containing its words next to each other, in order.
+    'a NEAR/k b' matches the documents where the words a and b occur at most k positions apart, in either order. Either side may also be a quoted phrase.
+    The words of the operators are also free text words of the query, so the matching documents are ranked by the similarity of all the words of the query.
+
+    Args:
+        query (str): The query string.
+
+    Returns:
+        text (str): The query without the operators, i.e. without the quotes and the NEAR/k.
+        phrases (list): The text of every phrase.
+        nears (list): (left, right, distance) tuples, one per NEAR/k operator, where left and right are the text on each side, without quotes.
+    """
+
+    nears = [(left.strip('"'), right.strip('"'), int(distance)) for left, distance, right in NEAR.findall(query)]
+    phrases = PHRASE.findall(query)
+    text = PHRASE.sub(lambda match: ' ' + match.group(1) + ' ', NEAR_OPERATOR.sub(' ', query))
+    return text, phrases, nears
+
+
+def intersect_postings(index, term_ids):
+    """
+    This function finds the documents containing all the given terms.
+
+    The postings lists are intersected from the shortest one: every document of the shortest list that is still a candidate is looked up
+    in the next shortest list, by binary search over its postings or its skip data (see find_documents of the index), so the cost grows with
+    the length of the shortest list and only logarithmically with the length of the others, like a galloping intersection.
+
+    Args:
+        index (SparseIndex or CompressedIndex): The index.
+        term_ids (list): The term IDs of the terms.
+
+    Returns:
+        doc_index (ndarray): The sorted positions of the documents containing all the terms in the docIDs array.
+        ranks (list): For each term, in the given order, the position of each of those documents in the postings list of the term.
+    """
+
+    order = sorted(range(len(term_ids)), key=lambda i: index.offsets[term_ids[i] + 1] - index.offsets[term_ids[i]]) # the shortest postings list first
+    doc_index = np.asarray(index.term_postings(term_ids[order[0]])[0], dtype=np.int64)
+    ranks = {order[0]: np.arange(len(doc_index))}
+    for i in order[1:]:
+        term_ranks = index.find_documents(term_ids[i], doc_index)
+        found = term_ranks >= 0
+        doc_index = doc_index[found]
+        ranks = {j: previous[found] for j, previous in ranks.items()} # the candidates that were dropped are dropped from the other lists too
+        ranks[i] = term_ranks[found]
+    return doc_index, [ranks[i] for i in range(len(term_ids))]
+
+
+def phrase_occurrences(index, term_ids):
+    """
+    This function finds every occurrence of a phrase, i.e. of the terms at consecutive positions, in order.
+
+    The documents containing all the terms are found by intersect_postings, and only the positions of the terms in those documents are decoded.
+    The positions of the i-th term are shifted back by i, so the occurrences of the phrase are the shifted positions all the terms share in a document.
+
+    Args:
+        index (SparseIndex or CompressedIndex): The index, with the positions of the terms.
+        term_ids (list): The term IDs of the terms of the phrase, in order. A single term is a phrase of one term.
+
+    Returns:
+        doc_index (ndarray): The position in the docIDs array of the document of every occurrence.
+        starts (ndarray): The position of the first term of every occurrence in its document. The occurrences are sorted by document, then by start.
+    """
+
+    doc_index, ranks = intersect_postings(index, term_ids)
+    keys = None # an occurrence is identified by its candidate number in the high 32 bits and its start in the low 32 bits
+    for i, (t, term_ranks) in enumerate(zip(term_ids, ranks)):
+        position_offsets, positions = index.positions.term_positions(t, term_ranks)
+        candidate = np.repeat(np.arange(len(doc_index), dtype=np.int64), np.diff(position_offsets))
+        starts = positions - i
+        term_keys = (candidate[starts >= 0] << 32) | starts[starts >= 0] # a phrase cannot start before the start of the document
+        keys = term_keys if keys is None else np.intersect1d(keys, term_keys, assume_unique=True) # a term occurs at most once at a position
+        if len(keys) == 0:
+            break
+    return doc_index[keys >> 32], keys & 0xFFFFFFFF
+
+
+def near_documents(index, left, right, distance):
+    """
+    This function finds the documents where two phrases (or terms) occur at most distance positions apart, in either order.
+
+    Args:
+        index (SparseIndex or CompressedIndex): The index, with the positions of the terms.
+        left, right (list): The term IDs of the terms of each phrase, the distance is measured between the first terms of the phrases.
+        distance (int): The largest number of positions between the phrases.
+
+    Returns:
+        doc_index (ndarray): The sorted positions of the matching documents in the docIDs array.
+    """
+
+    left_docs, left_starts = phrase_occurrences(index, left)
+    right_docs, right_starts = phrase_occurrences(index, right)
+    left_keys = (left_docs << 32) | left_starts
+    right_keys = (right_docs << 32) | right_starts # sorted, as the occurrences are sorted by document and start
+    if len(left_keys) == 0 or len(right_keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    following = np.searchsorted(right_keys, left_keys) # the first occurrence of the right phrase at or after each occurrence of the left one
+    near = np.zeros(len(left_keys), dtype=bool)
+    for neighbour in (following - 1, following, following + 1): # the closest occurrences on either side, the one at the same position is only itself when both phrases are the same
+        valid = (neighbour >= 0) & (neighbour < len(right_keys))
+        other = right_keys[np.clip(neighbour, 0, len(right_keys) - 1)]
+        gap = np.abs(other - left_keys) # the positions between the occurrences, when they are in the same document
+        near |= valid & (other >> 32 == left_docs) & (gap > 0) & (gap <= distance)
+    return np.unique(left_docs[near])
+
+
+def matching_documents(index, constraints):
+    """
+    This function finds the documents matching all the phrase and proximity constraints of a query.
+
+    Args:
+        index (SparseIndex or CompressedIndex): The index, with the positions of the terms.
+        constraints (tuple): ('phrase', terms) and ('near', left terms, right terms, distance) tuples, with the stemmed terms of the operators.
+
+    Returns:
+        doc_index (ndarray): The sorted positions of the matching documents in the docIDs array.
+    """
+
+    matches = None
+    for constraint in constraints:
+        terms = constraint[1] if constraint[0] == 'phrase' else constraint[1] + constraint[2]
+        if any(term not in index for term in terms): # a term that is not in the vocabulary matches no document
+            return np.zeros(0, dtype=np.int64)
+        if constraint[0] == 'phrase':
+            documents = np.unique(phrase_occurrences(index, [index.terms.index(term) for term in constraint[1]])[0])
+        else:
+            documents = near_documents(index, [index.terms.index(term) for term in constraint[1]], [index.terms.index(term) for term in constraint[2]], constraint[3])
+        matches = documents if matches is None else np.intersect1d(matches, documents, assume_unique=True)
+    return matches if matches is not None else np.arange(len(index.docIDs))
@@ -0,0 +1,265 @@
+import numpy as np
+
+
+BLOCK_SIZE = 128 # the number of postings in a block, the unit of the skip data
+
+
+def varint_encode(values):
+    """
+    This function encodes non-negative integers as variable byte integers (LEB128).
+
+    Every value is stored in 7 bit groups, the lowest group first, one group per byte. The high bit of a byte is set
+    when more bytes of the same value follow, so small values (like the gaps between the documents of a postings list) take a single byte.
+
+    Args:
+        values (ndarray): The non-negative integers to encode, less than 2 ** 35.
+
+    Returns:
+        encoded (ndarray): The uint8 encoded bytes.
+    """
+
+    values = np.asarray(values, dtype=np.int64)
+    lengths = varint_lengths(values) # the number of bytes of each value
+    starts = np.cumsum(lengths) - lengths
+    group = np.arange(int(lengths.sum())) - np.repeat(starts, lengths) # the 7 bit group each byte holds
+    last = group == np.repeat(lengths, lengths) - 1 # the last byte of each value has its high bit clear
+    encoded = (np.repeat(values, lengths) >> (7 * group)) & 0x7F
+    return (encoded | np.where(last, 0, 0x80)).astype(np.uint8)
+
+
+def varint_lengths(values):
+    """
+    This function returns the number of bytes varint_encode takes to encode each value.
+    """
+
+    return 1 + sum((values >= 1 << (7 * i)).astype(np.int64) for i in range(1, 5))
+
+
+def varint_decode(encoded):
+    """
+    This function decodes variable byte integers encoded by varint_encode, all at once.
+
+    Args:
+        encoded (ndarray): The uint8 encoded bytes.
+
+    Returns:
+        values (ndarray): The int64 decoded values.
+    """
+
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.zeros(0, dtype=np.int64)
+    last = encoded < 0x80 # the bytes that end a value
+    ends = np.flatnonzero(last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1) # the 7 bit group each byte holds
+    return np.add.reduceat((encoded & 0x7F).astype(np.int64) << (7 * group), starts)
+
+
+def block_offsets(offsets, block_size=BLOCK_SIZE):
+    """
+    This function returns where the blocks of every postings list start, which only depends on the lengths of the postings lists.
+
+    Args:
+        offsets (ndarray): The postings of term t are at positions offsets[t] to offsets[t + 1].
+        block_size (int): The number of postings in a full block.
+
+    Returns:
+        block_offsets (ndarray): The blocks of term t are blocks block_offsets[t] to block_offsets[t + 1].
+    """
+
+    blocks = -(-np.diff(offsets) // block_size) # the number of blocks of each term, the last one may not be full
+    block_offsets = np.zeros(len(blocks) + 1, dtype=np.int64)
+    np.cumsum(blocks, out=block_offsets[1:])
+    return block_offsets
+
+
+def encode_postings(doc_index, offsets, block_size=BLOCK_SIZE):
+    """
+    This function compresses the document positions of the postings lists, in blocks of block_size postings.
+
+    Every postings list is cut into blocks. The skip data records the first document position of every block and where the block
+    starts in the encoded bytes, and the other document positions of the block are stored as their gaps from the previous one,
+    as variable byte integers. Every block can therefore be decoded on its own, and any run of blocks can be decoded at once by decode_blocks.
+
+    Args:
+        doc_index (ndarray): The document positions of all the postings, in docID order within each postings list.
+        offsets (ndarray): The postings of term t are at positions offsets[t] to offsets[t + 1].
+        block_size (int): The number of postings in a block.
+
+    Returns:
+        encoded (ndarray): The uint8 encoded gaps.
+        block_first (ndarray): The first document position of each block.
+        block_bytes (ndarray): Block b is stored at bytes block_bytes[b] to block_bytes[b + 1] of encoded.
+    """
+
+    doc_index = np.asarray(doc_index, dtype=np.int64)
+    df = np.diff(offsets)
+    rank = np.arange(len(doc_index)) - np.repeat(offsets[:-1], df) # the position of every posting in its postings list
+    block = np.repeat(block_offsets(offsets, block_size)[:-1], df) + rank // block_size # the block of every posting
+    block_start = rank % block_size == 0 # the postings that start a block
+
+    gaps = np.diff(doc_index, prepend=0)[~block_start]
+    byte_lengths = varint_lengths(gaps) # the number of bytes of each gap
+    block_bytes = np.zeros(int(np.count_nonzero(block_start)) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(block[~block_start], weights=byte_lengths, minlength=len(block_bytes) - 1).astype(np.int64), out=block_bytes[1:])
+    return varint_encode(gaps), doc_index[block_start].astype(np.int32), block_bytes
+
+
+def decode_blocks(encoded, block_first, block_bytes, first, last, count, block_size=BLOCK_SIZE):
+    """
+    This function decodes the document positions of a run of consecutive blocks of one postings list.
+
+    Args:
+        encoded, block_first, block_bytes (ndarray): The encoded postings and their skip data, as returned by encode_postings.
+        first (int): The first block to decode.
+        last (int): The block after the last block to decode.
+        count (int): The number of postings in those blocks.
+        block_size (int): The number of postings in a full block.
+
+    Returns:
+        doc_index (ndarray): The document positions of the postings of the blocks.
+    """
+
+    data = encoded[block_bytes[first]:block_bytes[last]]
+    gaps = data.astype(np.int64) if len(data) == 0 or data.max() < 0x80 else varint_decode(data) # when every gap fits in a byte the bytes are the gaps
+    doc_index = np.empty(count, dtype=np.int64)
+    if last - first == 1: # a single block, the common case for the short postings lists of rare terms
+        doc_index[0] = 0
+        np.cumsum(gaps, out=doc_index[1:])
+        return doc_index + block_first[first]
+
+    block_start = np.arange(count) % block_size == 0
+    doc_index[block_start] = 0 # every block is decoded from its first document, independently of the others
+    doc_index[~block_start] = gaps
+    totals = np.cumsum(doc_index)
+    block = np.arange(count) // block_size # the block of each posting, relative to the first one
+    return block_first[first:last][block] + totals - totals[block * block_size]
+
+
+def decode_postings(encoded, block_first, offsets, block_size=BLOCK_SIZE):
+    """
+    This function decodes the document positions of all the postings lists at once, e.g. to decompress a whole index.
+
+    Args:
+        encoded, block_first (ndarray): The encoded postings and their skip data, as returned by encode_postings.
+        offsets (ndarray): The postings of term t are at positions offsets[t] to offsets[t + 1].
+        block_size (int): The number of postings in a full block.
+
+    Returns:
+        doc_index (ndarray): The document positions of all the postings.
+    """
+
+    df = np.diff(offsets)
+    rank = np.arange(int(offsets[-1])) - np.repeat(offsets[:-1], df) # the position of every posting in its postings list
+    block = np.repeat(block_offsets(offsets, block_size)[:-1], df) + rank // block_size # the block of every posting
+    block_start = rank % block_size == 0
+
+    gaps = np.zeros(len(rank), dtype=np.int64)
+    gaps[~block_start] = varint_decode(encoded)
+    totals = np.cumsum(gaps)
+    return block_first[block] + totals - totals[block_start][block]
+
+
+def quantize(weights, offsets, bits=8, scales=None):
+    """
+    This function quantizes the weights of the postings lists to unsigned integers, with a scale per term.
+
+    The weights of a term are divided by its scale, the largest weight of the term over the largest integer, and rounded,
+    so multiplying a quantized weight by the scale of its term gives back the weight within half a scale. Weights must not be negative.
+
+    Args:
+        weights (ndarray): The weights of all the postings.
+        offsets (ndarray): The postings of term t are at positions offsets[t] to offsets[t + 1].
+        bits (int): 8 or 16, the number of bits of a quantized weight.
+        scales (ndarray): The scale of each term, None to calculate them from the weights. Given scales must not be smaller than the calculated ones.
+
+    Returns:
+        quantized (ndarray): The uint8 or uint16 quantized weights.
+        scales (ndarray): The scale of each term.
+    """
+
+    if bits not in (8, 16):
+        raise ValueError("weights can only be quantized to 8 or 16 bits, not {}".format(bits))
+    df = np.diff(offsets)
+    if scales is None:
+        largest = np.zeros(len(df))
+        nonempty = df > 0
+        if nonempty.any():
+            largest[nonempty] = np.maximum.reduceat(weights, offsets[:-1][nonempty])
+        scales = largest / (2 ** bits - 1)
+    divisors = np.repeat(np.where(scales > 0, scales, 1.0), df) # a term whose weights are all zero keeps zeros
+    quantized = np.rint(weights / divisors).astype(np.uint8 if bits == 8 else np.uint16)
+    return quantized, scales
+
+
+def _block_bytes(values, value_block, blocks):
+    """
+    This function returns where the varint encoded values of every block start: block b is stored at bytes block_bytes[b] to block_bytes[b + 1].
+    """
+
+    block_bytes = np.zeros(blocks + 1, dtype=np.int64)
+    np.cumsum(np.bincount(value_block, weights=varint_lengths(values), minlength=blocks).astype(np.int64), out=block_bytes[1:])
+    return block_bytes
+
+
+def encode_positions(positions, counts, offsets, block_size=BLOCK_SIZE):
+    """
+    This function compresses the positions of the terms in the documents, in the same blocks of block_size postings as encode_postings.
+
+    Every posting holds the positions (the token numbers) at which its term occurs in its document, in increasing order. The number of positions
+    of every posting and the positions themselves are stored as two streams of variable byte integers: the first position of a posting as is,
+    and the others as their gaps from the previous one. The byte offsets of every block in both streams are the skip data, so the positions
+    of a run of blocks can be decoded on their own by decode_positions.
+
+    Args:
+        positions (ndarray): The positions of all the postings, back to back in postings order.
+        counts (ndarray): The number of positions of each posting, i.e. the number of times its term occurs in its document.
+        offsets (ndarray): The postings of term t are at positions offsets[t] to offsets[t + 1].
+        block_size (int): The number of postings in a block.
+
+    Returns:
+        encoded_counts (ndarray): The uint8 encoded numbers of positions.
+        count_bytes (ndarray): The numbers of positions of block b are stored at bytes count_bytes[b] to count_bytes[b + 1] of encoded_counts.
+        encoded_positions (ndarray): The uint8 encoded position gaps.
+        position_bytes (ndarray): The positions of block b are stored at bytes position_bytes[b] to position_bytes[b + 1] of encoded_positions.
+    """
+
+    positions = np.asarray(positions, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    df = np.diff(offsets)
+    rank = np.arange(len(counts)) - np.repeat(offsets[:-1], df) # the position of every posting in its postings list
+    block = np.repeat(block_offsets(offsets, block_size)[:-1], df) + rank // block_size # the block of every posting
+    blocks = int(block_offsets(offsets, block_size)[-1])
+
+    first = np.zeros(len(positions), dtype=bool)
+    first[(np.cumsum(counts) - counts)[counts > 0]] = True # the first position of every posting
+    gaps = np.diff(positions, prepend=0)
+    gaps[first] = positions[first]
+
+    count_bytes = _block_bytes(counts, block, blocks)
+    position_bytes = _block_bytes(gaps, np.repeat(block, counts), blocks)
+    return varint_encode(counts), count_bytes, varint_encode(gaps), position_bytes
+
+
+def decode_positions(encoded_counts, count_bytes, encoded_positions, position_bytes, first, last):
+    """
+    This function decodes the positions of the postings of a run of consecutive blocks.
+
+    Args:
+        encoded_counts, count_bytes, encoded_positions, position_bytes (ndarray): The encoded positions and their skip data, as returned by encode_positions.
+        first (int): The first block to decode.
+        last (int): The block after the last block to decode.
+
+    Returns:
+        position_offsets (ndarray): The positions of the i-th posting of the blocks are positions[position_offsets[i]:position_offsets[i + 1]].
+        positions (ndarray): The positions of the postings of the blocks, back to back.
+    """
+
+    counts = varint_decode(encoded_counts[count_bytes[first]:count_bytes[last]])
+    gaps = varint_decode(encoded_positions[position_bytes[first]:position_bytes[last]])
+    position_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=position_offsets[1:])
+    totals = np.cumsum(gaps)
+    before = np.concatenate(([0], totals))[position_offsets[:-1]] # the running total before the first position of each posting
+    return position_offsets, totals - np.repeat(before, counts)
@@ -0,0 +1,148 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    A cache of query results, bounded by memory and optionally by age.
+
+    The results are cached under the multiset of the stemmed query terms (plus the search parameters), so queries that
+    only differ in word order, case or punctuation share one entry. The least recently used entries are evicted when the
+    estimated size of the cached results goes over max_bytes, and entries older than ttl seconds are never returned.
+    The cache belongs to one index generation: when it is asked for the results of another generation, every entry is dropped.
+
+    Attributes:
+        max_bytes (int): The memory budget of the cached results.
+        ttl (float): The time to live of an entry in seconds, None for no limit.
+        generation (int): The index generation of the cached results.
+        hits, misses, evictions, expirations, invalidations (int): The counts of the cache events.
+    """
+
+    def __init__(self, max_bytes=16 * 2 ** 20, ttl=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict() # key -> (results, size, expiry), the least recently used entry is first
+        self._bytes = 0
+        self._lock = threading.Lock() # the searcher may be shared by several threads
+
+    @staticmethod
+    def make_key(terms, *parameters):
+        """
+        This function returns the cache key of a query.
+
+        Args:
+            terms (list): The stemmed query terms.
+            parameters: The search parameters that change the results, e.g. k and the threshold.
+
+        Returns:
+            key (tuple): The sorted terms, so that the key only depends on the multiset of the terms, followed by the parameters.
+        """
+
+        return (tuple(sorted(terms)),) + parameters
+
+    def get(self, key, generation):
+        """
+        This function returns the cached results of a query.
+
+        Args:
+            key (tuple): The key returned by make_key.
+            generation (int): The generation of the index the query is answered with.
+
+        Returns:
+            results (list): The cached results, None if they are not cached.
+        """
+
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic(): # the entry is too old
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key) # the entry is now the most recently used one
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, generation, results):
+        """
+        This function caches the results of a query, evicting the least recently used entries to stay within the memory budget.
+
+        Args:
+            key (tuple): The key returned by make_key.
+            generation (int): The generation of the index the results were calculated with.
+            results (list): The (docID, score) results of the query.
+        """
+
+        size = _estimate_size(key, results)
+        if size > self.max_bytes: # the results alone would not fit
+            return
+        expiry = None if self.ttl is None else time.monotonic() + self.ttl
+
+        with self._lock:
+            self._check_generation(generation)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (results, size, expiry)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """
+        This function drops every cached entry.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        This function returns the counts of the cache events, the number of entries and their estimated size in bytes.
+        """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'expirations': self.expirations,
+                    'invalidations': self.invalidations, 'entries': len(self._entries), 'bytes': self._bytes}
+
+    def _check_generation(self, generation):
+        """
+        This function drops every entry if the index generation changed. Must be called with the lock held.
+        """
+
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self.generation = generation
+
+    def _remove(self, key):
+        """
+        This function removes an entry. Must be called with the lock held.
+        """
+
+        self._bytes -= self._entries.pop(key)[1]
+
+
+def _estimate_size(key, results):
+    """
+    This function estimates the memory used by a cache entry, the key and the list of (docID, score) tuples.
+    """
+
+    size = sys.getsizeof(key) + sum(sys.getsizeof(term) for term in key[0]) + sys.getsizeof(results)
+    if results:
+        size += len(results) * (sys.getsizeof(results[0]) + sys.getsizeof(results[0][0]) + sys.getsizeof(results[0][1]))
+    return size
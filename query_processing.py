@@ -1,170 +1,83 @@
-import os
-import math as m
-import numpy as np
-import pandas as pd
+import json
+import queue
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
 import tkinter as tk
 from pathlib import Path
-from nltk.stem import PorterStemmer
 from tkinter import Tk, Canvas, Entry, Text, Button, PhotoImage
 
 
-def extract_weights():
+def request_search(query):
     """
-    This function is used to extract the TF-IDF and the IDF weights from their respective csv files.
+    This function asks the search service for the documents matching a query. It is run in a background thread, so the GUI never waits for the service.
 
-    Returns:
-        TF-IDF (DataFrame): The extracted TF-IDF weights.
-        IDF (DataFrame): The extracted IDF weights.
-    """
-
-    TF_IDF = pd.read_csv('tf-idf.csv', index_col=0)  # read TF-IDF DataFrame from CSV
-    IDF = pd.read_csv('idf.csv', index_col=0) # read IDF DataFrame from CSV
-
-    return TF_IDF, IDF
-
-
-def get_docIDs():
-    """
-    This function is used to extract document IDs based on the names of the files in the 'ResearchPapers' directory.
-
-    It gets the current working directory and lists all the files in the 'ResearchPapers' directory. 
-    It then extracts the document IDs from the names of these files, sorts them, and returns the sorted list.
-    Assumes the 'ResearchPapers' folder is in your current working directory.
+    Args:
+        query (str): The query string.
 
     Returns:
-        docID (list): A sorted list of document IDs extracted from the file names in the 'ResearchPapers' directory.
+        result (str): The ranked document IDs separated by spaces, or a message explaining why the search failed.
     """
 
-    curr_dir = os.getcwd() # get the current directory
-    docID = [int(c.rstrip('.txt')) for c in os.listdir(curr_dir + '\ResearchPapers')] # extract the docIDs from the names of the files in the ResearchPapers directory
-    docID.sort()
-    return docID
+    url = SERVICE_URL + '/search?' + urllib.parse.urlencode({'q': query})
+    try:
+        with urllib.request.urlopen(url, timeout=REQUEST_TIMEOUT) as response:
+            results = json.load(response)['results']
+    except urllib.error.HTTPError as error: # the service answered with an error, e.g. a timeout
+        try:
+            message = json.load(error).get('error', str(error))
+        except (ValueError, AttributeError, OSError): # the body is not an error of the service, e.g. the page of a proxy
+            message = str(error.reason)
+        return 'Search failed: ' + message
+    except (urllib.error.URLError, OSError): # the service is not running
+        return 'Search service is not available at ' + SERVICE_URL
+
+    result = ' '.join(str(item['docID']) for item in results)
+    if result == '': # if no documents are found
+        result = 'No documents found'
+    return result
 
 
-def get_stopwords():
+def show_result(result):
     """
-    This function is used to extract stopwords from 'Stopword-List.txt' file.
-
-    It reads each line from the file, and if the line is not empty, it appends the line to the stopwords list.
-    The function continues this process until it reaches the end of the file. Assumes the file is in your current working directory.
-
-    Returns:
-        stopwords (list): A list of stopwords extracted from the file.
+    This function displays a result in the output label.
     """
 
-    stopwords = []
-    with open('Stopword-List.txt', 'r') as f: # the 'Stopword-List.txt' file is opened in read mode
-        while True:
-            text = f.readline() # each line from the file is read one by one
-            if not text: # if the line read is empty (which means end of file), the loop is broken
-                break
-            stopwords.append(text) # else append the read line to the stopwords list
-
-    stopwords = [c.rstrip(' \n') for c in stopwords if c != '\n'] # a new list is created from stopwords, excluding any newline characters. Newline characters are also removed from the strings.
-    return stopwords
+    output_label.configure(state='normal') # enable the output label
+    output_label.delete(0.0, tk.END) # clear the output label
+    output_label.insert(0.0, result) # insert the result into the output label
+    output_label.configure(state='disabled') # again disable the output label
 
 
-def calculate_QueryVector(query, IDF):
+def poll_results():
     """
-    This function calculates the query vector based on the query terms and the IDF weights.
-
-    Args:
-        query (list): A list of query terms.
-        IDF (DataFrame): The Inverse Document Frequency weights.
-
-    Returns:
-        query_vector (dictionary): The query vector based on the query terms and the IDF weights.
+    This function displays the results of the finished searches. Tkinter widgets may only be used from the GUI thread, so the search threads hand their results over through a queue.
     """
 
-    query_vector = {} # create a list of zeros with the length of the columns in the IDF DataFrame
-
-    for term in IDF.columns: # loop through each term in the IDF columns
-        if term in query: # if the term is in the query
-            query_vector[term] = 1 + m.log(query.count(term), 10) # calculate the log term frequency weight
-            query_vector[term] *= IDF.loc[0, term] # multiply the log term frequency weight by the IDF weight
-        else:
-            query_vector[term] = 0 # if the term is not in the query, set the weight to zero
-
-    norm = sum([query_vector[x] ** 2 for x in query_vector.keys()]) ** 0.5 # calculate the norm of the query vector
-
-    if norm != 0: # if the norm is not zero
-        for term in query_vector:
-            query_vector[term] = query_vector[term] / norm # normalize the query vector
-
-    return query_vector
-
-
-def QueryProcessing(query):
-    '''
-    This function processes the query by stemming the words, removing stopwords, and calculating the TF-IDF weights of the terms.
-    
-    Args:
-        query (str): The query string to be processed.
-    
-    Returns:
-        vectors (DataFrame): The DataFrame containing the TF-IDF weights of all the terms.
-        query_vector (DataFrame): The DataFrame containing TF-IDF weights the query terms.
-    '''
-
-    vectors, IDF = extract_weights() # # read the TF-IDF and IDF DataFrames from CSV
-
-    query_vector = calculate_QueryVector(query, IDF) # calculate the query vector
-    query_vector = pd.DataFrame(query_vector, index=[0]) # create a DataFrame from the query vector
-
-    return vectors, query_vector
-
-
-def find_sim(query):
-    '''
-    This function calculates the similarity scores between the query vector and the document vectors.
-
-    Args:
-        query (string): The query string to be processed.
-
-    Returns:
-        scores (string): a string containing the document IDs with similarity scores greater than or equal to 0.05, sorted and ranked with respect to their scores.
-    '''
-
-    query = query.split() # split the query into words
-    porter_stemmer = PorterStemmer() # initialize the stemmer
-    stopwords = get_stopwords() # get the stopwords
-    doc = get_docIDs() # get the document IDs
-
-    query = [porter_stemmer.stem(word).rstrip("'").casefold() for word in query if word not in stopwords] # stem the words in the query and remove the stopwords
-    
-    vectors , query_vector = QueryProcessing(query) # calculate the query vector
-
-    score = {} # create a dictionary to store the similarity scores
-    for docID in doc:
-        score[docID] = np.dot(vectors[str(docID)], query_vector.transpose()) # calculate the similarity score for each document
-
-    score = {k: v for k, v in sorted(score.items(), key=lambda item: item[1], reverse=True)} # sort the similarity scores in descending order
-    score = {k: score[k] for k in score if score[k] >= 0.05} # remove any documents with a similarity score less than 0.05
-
-    score = [k for k in score.keys()]
-    score = ' '.join(map(str, score))
-
-    return score
+    try:
+        while True:
+            show_result(results.get_nowait())
+    except queue.Empty:
+        pass
+    window.after(50, poll_results) # check again in 50 milliseconds
 
 
 def process_query():
     """
 
-    This function retrieves a user's query from a GUI text entry field, processes the query, and displays the result in a GUI label.
+    This function retrieves a user's query from a GUI text entry field, sends it to the search service in a background thread, and displays the result in a GUI label once it arrives.
     
     """
 
     query = enter_query.get() # get the query from the text entry field
-    result = find_sim(query)
+    show_result('Searching...')
+    threading.Thread(target=lambda: results.put(request_search(query)), daemon=True).start() # the event loop keeps running while the service answers
 
-    if result == '': # if no documents are found
-        result = 'No documents found'
-
-    output_label.configure(state='normal') # enable the output label
-    output_label.delete(0.0, tk.END) # clear the output label
-    output_label.insert(0.0, result) # insert the result into the output label
-    output_label.configure(state='disabled') # again disable the output label
 
+SERVICE_URL = 'http://127.0.0.1:8000' # the address of the search service started by search_service.py
+REQUEST_TIMEOUT = 10 # seconds to wait for the search service
+results = queue.Queue() # the results of the background searches, displayed by poll_results
 
 OUTPUT_PATH = Path(__file__).parent # get the output path
 ASSETS_PATH = OUTPUT_PATH / Path(r"C:\Users\Hp\Desktop\Information Retrieval\Assignment 2\build\assets\frame0") # get the assets path
@@ -324,4 +237,5 @@ window.resizable(False, False) # make the window non-resizable
 
 
 if __name__ == "__main__":
+    poll_results() # start displaying the search results
     window.mainloop() # run the window
\ No newline at end of file
@@ -0,0 +1,669 @@
+import os
+import re
+import time
+import threading
+import math as m
+import numpy as np
+from sparse_index import SparseIndex, open_index
+from text_analysis import PUNCTUATION, Analyzer, get_stopwords, load_stem_table
+from query_cache import QueryCache
+from instrumentation import trace, span, count, tracing, profile
+from phrase_search import parse_query, matching_documents
+from ann_index import DIMENSIONS, NPROBE, RERANK, ann_path, load_ann
+
+
+WILDCARD = re.compile(r'[^\s"]*\*[^\s"]*') # a word holding a '*', e.g. 'retriev*'
+MAX_EXPANSIONS = 64 # the largest number of terms a wildcard word is expanded to
+COSINE_THRESHOLD = 0.002 # the default minimum cosine similarity, on the ResearchPapers corpus it keeps 99% of the documents the legacy threshold keeps, and about as many
+LEGACY_THRESHOLD = 0.05 # the default minimum score with the unnormalized document vectors
+
+
+def extract_weights(path='index.vsm'):
+    """
+    This function is used to extract the TF-IDF postings and the IDF weights from the 'index.vsm' index file.
+
+    Args:
+        path (str): The path of the index file.
+
+    Returns:
+        index (SparseIndex or CompressedIndex): The extracted TF-IDF postings, including the IDF weight of each term.
+    """
+
+    return open_index(path) # memory-map the postings and the IDF weights
+
+
+def calculate_QueryVector(query, index):
+    """
+    This function calculates the query vector based on the query terms and the IDF weights.
+
+    Only the query terms that are in the vocabulary get a weight, every other term of the vocabulary has a weight of zero and is left out.
+
+    Args:
+        query (list): A list of query terms.
+        index (SparseIndex): The TF-IDF postings, including the IDF weights.
+
+    Returns:
+        term_ids (list): The term IDs of the query terms found in the vocabulary.
+        query_vector (ndarray): The normalized weight of each of those terms.
+    """
+
+    term_ids = []
+    query_vector = []
+
+    for term in dict.fromkeys(query): # loop through each distinct query term, in the order they appear in the query
+        t = index.terms.lookup(term)
+        if t is not None: # terms that are not in the vocabulary cannot match any document
+            term_ids.append(t)
+            query_vector.append((1 + m.log(query.count(term), 10)) * index.idf[t]) # multiply the log term frequency weight by the IDF weight
+
+    query_vector = np.array(query_vector, dtype=np.float64)
+    norm = np.sqrt(np.sum(query_vector ** 2)) # calculate the norm of the query vector
+
+    if norm != 0: # if the norm is not zero
+        query_vector = query_vector / norm # normalize the query vector
+
+    return term_ids, query_vector
+
+
+def score_documents(term_ids, query_vector, index):
+    """
+    This function calculates the similarity score of every document term-at-a-time.
+
+    Only the postings of the query terms are read: the contribution of each posting, its weight times the query weight of its term,
+    is added to the score of its document. Documents that contain none of the query terms keep a score of zero.
+
+    Args:
+        term_ids (list): The term IDs of the query terms.
+        query_vector (ndarray): The weight of each of those terms.
+        index (SparseIndex): The TF-IDF postings.
+
+    Returns:
+        scores (ndarray): The similarity score of each document, in docIDs order.
+    """
+
+    scores = np.zeros(len(index.docIDs)) # the score accumulator, one entry per document
+    for t, weight in zip(term_ids, query_vector):
+        doc_index, weights = index.term_postings(t) # decoded if the postings are compressed
+        scores[doc_index] += weight * weights # a document appears at most once in a postings list
+    return scores
+
+
+def score_batch(query_vectors, index):
+    """
+    This function calculates the similarity scores of several queries at once, as the product of a sparse query matrix and the postings.
+
+    Every non-zero entry of the query matrix (a query, one of its terms and the weight of that term) is expanded into the postings of
+    its term, and the contributions of all the postings of all the queries are added into a dense queries x documents score matrix
+    with a single bincount. The contributions of each query are added in query term order, so the scores are exactly the ones
+    score_documents calculates for each query on its own.
+
+    Args:
+        query_vectors (list): (term_ids, query_vector) tuples, as returned by calculate_QueryVector, one per query.
+        index (SparseIndex or CompressedIndex): The TF-IDF postings.
+
+    Returns:
+        scores (ndarray): A len(query_vectors) x len(index.docIDs) array holding the similarity score of each document for each query.
+    """
+
+    D = len(index.docIDs)
+    rows = np.concatenate([np.full(len(term_ids), q, dtype=np.int64) for q, (term_ids, _) in enumerate(query_vectors)] + [np.zeros(0, dtype=np.int64)]) # the query of each entry of the query matrix
+    terms = np.concatenate([np.asarray(term_ids, dtype=np.int64) for term_ids, _ in query_vectors] + [np.zeros(0, dtype=np.int64)]) # the term of each entry
+    values = np.concatenate([query_vector for _, query_vector in query_vectors] + [np.zeros(0)]) # the query weight of each entry
+
+    if isinstance(index, SparseIndex):
+        lengths = index.offsets[terms + 1] - index.offsets[terms] # the length of the postings list of each entry
+        starts = np.repeat(index.offsets[terms] - (np.cumsum(lengths) - lengths), lengths) # the position of each expanded posting is its entry's start plus its rank in the expansion
+        postings = starts + np.arange(int(lengths.sum()))
+        doc_index, weights = index.doc_index[postings], index.weights[postings]
+    else: # compressed postings are decoded once per distinct term of the batch
+        decoded = {int(t): index.term_postings(t) for t in np.unique(terms)}
+        lengths = np.array([len(decoded[t][0]) for t in terms.tolist()], dtype=np.int64)
+        doc_index = np.concatenate([decoded[t][0] for t in terms.tolist()] + [np.zeros(0, dtype=np.int64)])
+        weights = np.concatenate([decoded[t][1] for t in terms.tolist()] + [np.zeros(0)])
+
+    cells = np.repeat(rows, lengths) * D + doc_index # the cell of the score matrix each posting contributes to
+    contributions = np.repeat(values, lengths) * weights
+    return np.bincount(cells, weights=contributions, minlength=len(query_vectors) * D).reshape(len(query_vectors), D)
+
+
+def topk_maxscore(term_ids, query_vector, index, k, threshold=0.05):
+    """
+    This function finds the k best scoring documents with MaxScore dynamic pruning, without scoring every posting.
+
+    The upper bound of the contribution of a query term to any score is its query weight times the largest weight in its postings list.
+    The k-th best contribution of the term with the largest upper bound is a lower bound of the k-th best score, since the weights are not
+    negative, and with the threshold it gives the cutoff a document must reach to be returned. The query terms whose upper bounds add up
+    to less than the cutoff are non-essential: a document that only contains them cannot be returned. The candidates are the documents in
+    the postings of the essential terms, and they are only looked up in the postings of the non-essential terms (by binary search over the
+    postings or the skip data, see find_documents), so the long postings lists of the frequent, low IDF terms are never read. Every step
+    works on whole postings lists with numpy. When every term is essential there is nothing to skip, and the documents are scored with
+    score_documents instead, which is cheaper than collecting the candidates.
+
+    The contributions are added in query term order, as score_documents adds them, so the results are exactly the first k results of
+    exhaustive scoring, except that documents that contain none of the query terms are never returned, even with a threshold of zero.
+
+    Args:
+        term_ids (list): The term IDs of the query terms.
+        query_vector (ndarray): The weight of each of those terms.
+        index (SparseIndex or CompressedIndex): The TF-IDF postings.
+        k (int): The number of documents to return, None to return every document with a score greater than or equal to the threshold. No document is returned if k is 0 or less.
+        threshold (float): The minimum similarity score of a document to be returned.
+
+    Returns:
+        results (list): (docID, score) tuples sorted by score in descending order, documents with equal scores are in docID order.
+        counters (dict): The number of postings of the query terms, how many of them were scored and skipped, and the number of documents fully scored.
+    """
+
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    query_vector = np.asarray(query_vector, dtype=np.float64)
+    counters = {'postings': 0, 'postings_scored': 0, 'postings_skipped': 0, 'docs_scored': 0}
+    if (k is not None and k <= 0) or len(term_ids) == 0: # nothing to score
+        return [], counters
+    counters['postings'] = int((index.offsets[term_ids + 1] - index.offsets[term_ids]).sum())
+    bounds = query_vector * index.max_weights[term_ids] # the largest contribution each term can make
+
+    cutoff = threshold
+    decoded = {} # the postings lists decoded so far, by query term
+    if k is not None:
+        best = int(np.argmax(bounds))
+        decoded[best] = index.term_postings(term_ids[best])
+        contributions = query_vector[best] * decoded[best][1]
+        if len(contributions) >= k: # the k-th best contribution of a single term is a lower bound of the k-th best score
+            cutoff = max(cutoff, float(np.partition(contributions, len(contributions) - k)[len(contributions) - k]))
+
+    order = np.argsort(bounds, kind='stable') # the query terms by increasing upper bound
+    prefix = np.cumsum(bounds[order]) # prefix[j] bounds the score of a document that only contains the terms order[0] to order[j]
+    non_essential = set(order[:np.count_nonzero(prefix + 1e-9 < cutoff)].tolist()) # a little slack, so that rounding in the sums never prunes a document that should be returned
+
+    if len(non_essential) == len(term_ids): # even a document containing every query term scores less than the threshold, e.g. terms with an IDF of zero
+        counters['postings_skipped'] = counters['postings']
+        return [], counters
+    if not non_essential: # every term is essential, score every document
+        scores = score_documents(term_ids, query_vector, index)
+        if threshold > 0:
+            candidates = np.flatnonzero(scores >= threshold)
+        else: # a document that contains none of the query terms has a score of zero, but is not returned
+            touched = np.zeros(len(scores), dtype=bool)
+            for t in term_ids.tolist():
+                touched[index.term_postings(t)[0]] = True
+            candidates = np.flatnonzero(touched)
+        scores = scores[candidates]
+        counters['postings_scored'] = counters['postings']
+    else:
+        for i in range(len(term_ids)):
+            if i not in non_essential and i not in decoded:
+                decoded[i] = index.term_postings(term_ids[i])
+        candidates = np.unique(np.concatenate([decoded[i][0] for i in range(len(term_ids)) if i not in non_essential]))
+        scores = np.zeros(len(candidates))
+        for i, (t, weight) in enumerate(zip(term_ids.tolist(), query_vector)): # in query term order, so the scores are exactly the ones score_documents calculates
+            if i in non_essential:
+                ranks = index.find_documents(t, candidates)
+                found = np.flatnonzero(ranks >= 0)
+                scores[found] += weight * index.posting_weights(t, ranks[found])
+                counters['postings_scored'] += len(found)
+            else:
+                doc_index, weights = decoded[i]
+                scores[np.searchsorted(candidates, doc_index)] += weight * weights # every document of an essential term is a candidate
+                counters['postings_scored'] += len(doc_index)
+    counters['postings_skipped'] = counters['postings'] - counters['postings_scored']
+    counters['docs_scored'] = len(candidates)
+
+    kept = np.flatnonzero(scores >= threshold)
+    if k is not None and k < len(kept): # only the documents scoring at least the k-th best score, ties included, need to be sorted
+        kth = np.partition(scores[kept], len(kept) - k)[len(kept) - k]
+        kept = kept[scores[kept] >= kth]
+    kept = kept[np.argsort(-scores[kept], kind='stable')][:k] # by score in descending order, then by docID
+    return [(int(index.docIDs[candidates[i]]), float(scores[i])) for i in kept], counters
+
+
+def constrain_scores(scores, index, constraints):
+    """
+    This function drops the documents that do not match the phrase and proximity constraints of a query from its scores, see phrase_search.py.
+
+    Args:
+        scores (ndarray): The similarity score of each document, in docIDs order.
+        index (SparseIndex or CompressedIndex): The index the scores were calculated with, with the positions of the terms.
+        constraints (tuple): The constraints of the query, as returned by Searcher.analyze. If empty, the scores are returned as they are.
+
+    Returns:
+        scores (ndarray): The scores, with a score of -inf for the documents that do not match, so rank_documents never returns them.
+    """
+
+    if not constraints:
+        return scores
+    matches = np.zeros(len(scores), dtype=bool)
+    matches[matching_documents(index, constraints)] = True
+    count('phrase_matches', int(np.count_nonzero(matches)))
+    return np.where(matches, scores, -np.inf)
+
+
+def rank_documents(scores, index, threshold=0.05):
+    """
+    This function ranks the documents with a similarity score greater than or equal to the threshold.
+
+    Args:
+        scores (ndarray): The similarity score of each document, in docIDs order.
+        index (SparseIndex): The index the scores were calculated with.
+        threshold (float): The minimum similarity score of a document to be returned.
+
+    Returns:
+        results (list): (docID, score) tuples sorted by score in descending order, documents with equal scores are in docID order.
+    """
+
+    candidates = np.flatnonzero(scores >= threshold) # remove any documents with a similarity score less than the threshold
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')] # sort the remaining documents by their scores in descending order
+    return [(int(index.docIDs[i]), float(scores[i])) for i in candidates]
+
+
+class Searcher:
+    """
+    A long-lived searcher that answers queries from memory.
+
+    The index, the stopwords and the stemmer are loaded once when the searcher is created, instead of once per query.
+    Queries are analyzed by the same text_analysis.Analyzer pipeline as the documents, using the stem table saved with the index if there is one.
+    Before answering a query the searcher checks, at most once every check_interval seconds, if the index file was replaced
+    on disk (e.g. by running weights_calculation.py again), and if so it reopens it and increments its generation number.
+    The results are cached in a QueryCache, which drops its entries whenever the generation changes.
+    Words holding a '*' are wildcards, expanded to the (stemmed) terms of the vocabulary they match, e.g. 'retriev*', see expand.
+    If the index records the positions of the terms, queries may hold quoted phrases and NEAR/k operators (see phrase_search.parse_query):
+    only the documents matching them are returned, ranked by the similarity of all the words of the query. Without positions the operators are ignored.
+    If an ANN index was built with the index (see ann_index.py), search_ann finds approximate results for long queries from the reduced document vectors.
+    When tracing is enabled (see instrumentation.py) every query is traced, with the time taken by each stage and its counters.
+
+    By default the scores are cosine similarities: the query vector and the document vectors are both L2 normalized, the document
+    vectors once when the index is built. With cosine set to False the documents are scored with their raw TF-IDF weights, as
+    earlier versions of the searcher did, which reproduces their scores (up to floating point rounding) for compatibility.
+    The cosine similarities of long documents are much smaller than their raw scores, so each kind of score has its own default threshold,
+    COSINE_THRESHOLD or LEGACY_THRESHOLD, used whenever a search is given a threshold of None.
+
+    Attributes:
+        index (SparseIndex): The TF-IDF postings currently being searched.
+        generation (int): The number of times the index has been loaded, changes every time the index is reloaded.
+        analyzer (Analyzer): The text analysis pipeline of the queries.
+        cache (QueryCache): The cache of the query results, None if caching is disabled.
+        cosine (bool): Score the documents with cosine similarity, or with the unnormalized document vectors if False.
+        threshold (float): The default minimum score of a document to be returned, which depends on the kind of scores.
+        ann (ANNIndex): The approximate nearest neighbour index of the loaded index, None if there is none.
+    """
+
+    def __init__(self, index_path='index.vsm', check_interval=1.0, cache_bytes=16 * 2 ** 20, cache_ttl=None, cosine=True):
+        self.index_path = index_path
+        self.cosine = cosine
+        self.threshold = COSINE_THRESHOLD if cosine else LEGACY_THRESHOLD
+        self.check_interval = check_interval
+        with span('load_stopwords'):
+            self.analyzer = Analyzer(get_stopwords())
+        self.cache = QueryCache(cache_bytes, cache_ttl) if cache_bytes > 0 else None # a cache_bytes of 0 disables the cache
+        self._loaded = (None, 0, None) # the index, its generation and its ANN index, replaced together so a query always sees a matching set
+        self._file_signature = None # identifies the version of the index file that is loaded
+        self._last_check = 0.0
+        self._lock = threading.Lock() # a searcher may be shared by several threads, see search_service.py
+        self.counters = {'postings': 0, 'postings_scored': 0, 'postings_skipped': 0, 'docs_scored': 0} # totals over all the top-k queries
+        self.reload()
+
+    def reload(self, force=False):
+        """
+        This function reopens the index file if it changed since it was last loaded.
+
+        Args:
+            force (bool): Reopen the index file even if it did not change.
+
+        Returns:
+            reloaded (bool): True if the index was reopened.
+        """
+
+        with self._lock: # only one thread reopens the index
+            stat = os.stat(self.index_path)
+            signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns) # a rebuilt index is written to a new file and renamed, which changes all of these
+            if os.path.isfile(ann_path(self.index_path)): # the ANN index is saved after the index, it may be replaced after the index was reloaded
+                ann_stat = os.stat(ann_path(self.index_path))
+                signature += (ann_stat.st_ino, ann_stat.st_size, ann_stat.st_mtime_ns)
+            self._last_check = time.monotonic()
+            if signature == self._file_signature and not force:
+                return False
+
+            with span('load_stems'):
+                self.analyzer.stem_table = load_stem_table(os.path.splitext(self.index_path)[0] + '.stems') # the stems of the tokens of the indexed documents
+            with span('load_index'):
+                index = extract_weights(self.index_path)
+                index = index.normalize() if self.cosine else index.denormalize() # an index saved the other way is converted once, when it is loaded
+            with span('load_ann'):
+                ann = load_ann(ann_path(self.index_path), index) # None if it was built from an older version of the index
+            self._loaded = (index, self.generation + 1, ann) # replace the index in a single assignment, so concurrent queries see either the old or the new one
+            self._file_signature = signature
+            return True
+
+    @property
+    def index(self):
+        return self._loaded[0]
+
+    @property
+    def generation(self):
+        return self._loaded[1]
+
+    @property
+    def ann(self):
+        return self._loaded[2]
+
+    def preprocess(self, query):
+        """
+        This function turns a query string into query terms, with the same text analysis pipeline as the documents.
+
+        Args:
+            query (str): The query string to be processed.
+
+        Returns:
+            terms (list): The stemmed query terms.
+        """
+
+        return self.analyzer.terms(query)
+
+    def expand(self, pattern, index, max_expansions=MAX_EXPANSIONS):
+        """
+        This function expands a wildcard word to the terms of the vocabulary it matches, see term_dictionary.TermDictionary.expand.
+
+        The pattern is matched against the stemmed terms, so 'retriev*' matches the stems of 'retrieval', 'retrieve' and 'retrieving'.
+
+        Args:
+            pattern (str): The wildcard word, e.g. 'retriev*'.
+            index (SparseIndex or CompressedIndex): The index the query is answered with.
+            max_expansions (int): The largest number of terms to expand to, the terms with the largest document frequencies are kept.
+
+        Returns:
+            terms (list): The matching terms, in sorted order.
+        """
+
+        term_ids = index.terms.expand(pattern.strip(PUNCTUATION.replace('*', '')).casefold())
+        if len(term_ids) > max_expansions:
+            term_ids = np.sort(term_ids[np.argsort(-index.df[term_ids], kind='stable')[:max_expansions]])
+        return [index.terms[t] for t in term_ids.tolist()]
+
+    def analyze(self, query, index):
+        """
+        This function turns a query string into query terms and phrase and proximity constraints.
+
+        Args:
+            query (str): The query string to be processed.
+            index (SparseIndex or CompressedIndex): The index the query is answered with. If it has no positions, the query has no constraints.
+
+        Returns:
+            terms (list): The stemmed query terms, including the terms of the operators and the expansions of the wildcard words.
+            constraints (tuple): ('phrase', terms) and ('near', left terms, right terms, distance) tuples, see phrase_search.matching_documents.
+        """
+
+        expanded = []
+        if '*' in query:
+            expanded = [term for pattern in WILDCARD.findall(query) for term in self.expand(pattern, index)]
+            query = WILDCARD.sub(' ', query) # the wildcard words are free text words, they are not part of the operators
+        if index.positions is None or ('"' not in query and 'NEAR/' not in query):
+            return self.preprocess(query) + expanded, ()
+        text, phrases, nears = parse_query(query)
+        constraints = [('phrase', tuple(self.preprocess(phrase))) for phrase in phrases]
+        constraints += [('near', tuple(self.preprocess(left)), tuple(self.preprocess(right)), distance) for left, right, distance in nears]
+        return self.preprocess(text) + expanded, tuple(constraint for constraint in constraints if all(constraint[1:3])) # an operator whose words are all stopwords does not constrain the query
+
+    def search(self, query, threshold=None):
+        """
+        This function calculates the similarity scores between a query and all the documents and ranks the documents.
+
+        Args:
+            query (str): The query string to be processed.
+            threshold (float): The minimum similarity score of a document to be returned, None for the default threshold of the searcher.
+
+        Returns:
+            results (list): (docID, score) tuples of the documents with a score greater than or equal to the threshold, ranked by score.
+        """
+
+        threshold = self.threshold if threshold is None else threshold
+        with trace('search', query=query, threshold=threshold):
+            index, generation = self._current_index()
+            with span('analysis'):
+                terms, constraints = self.analyze(query, index)
+            key = QueryCache.make_key(terms, 'search', threshold, constraints)
+            results = self._cached(key, generation)
+            if results is not None:
+                return results
+
+            with span('query_vector'):
+                term_ids, query_vector = calculate_QueryVector(terms, index) # calculate the query vector
+            with span('scoring'):
+                scores = score_documents(term_ids, query_vector, index) # only the postings of the query terms are scored
+            with span('positions'):
+                scores = constrain_scores(scores, index, constraints)
+            with span('ranking'):
+                results = rank_documents(scores, index, threshold)
+            if tracing(): # only calculated when they are recorded
+                count('postings', int(sum(index.offsets[t + 1] - index.offsets[t] for t in term_ids)))
+                count('docs_scored', int(np.count_nonzero(scores)))
+            self._cache(key, generation, results)
+            return results
+
+    def search_topk(self, query, k=10, threshold=None):
+        """
+        This function finds the k best scoring documents for a query with MaxScore dynamic pruning, see topk_maxscore.
+
+        The results are the same as the first k results of search, and the counters of the searcher are updated with the number of postings that were skipped.
+
+        Args:
+            query (str): The query string to be processed.
+            k (int): The number of documents to return, None to return every document with a score greater than or equal to the threshold.
+            threshold (float): The minimum similarity score of a document to be returned, None for the default threshold of the searcher.
+
+        Returns:
+            results (list): (docID, score) tuples of the k best documents with a score greater than or equal to the threshold, ranked by score.
+        """
+
+        threshold = self.threshold if threshold is None else threshold
+        k = None if k is None else max(k, 0) # a negative k returns no documents, like a k of 0, instead of slicing off the last ones
+        with trace('search_topk', query=query, k=k, threshold=threshold):
+            index, generation = self._current_index()
+            with span('analysis'):
+                terms, constraints = self.analyze(query, index)
+            key = QueryCache.make_key(terms, 'topk', k, threshold, constraints)
+            results = self._cached(key, generation)
+            if results is not None:
+                return results
+
+            with span('query_vector'):
+                term_ids, query_vector = calculate_QueryVector(terms, index) # calculate the query vector
+            if constraints: # MaxScore cannot skip the documents that do not match the constraints, the matching documents are scored exhaustively
+                with span('scoring'):
+                    scores = score_documents(term_ids, query_vector, index)
+                with span('positions'):
+                    scores = constrain_scores(scores, index, constraints)
+                with span('ranking'):
+                    results = rank_documents(scores, index, threshold)[:k]
+                self._cache(key, generation, results)
+                return results
+            with span('scoring'):
+                results, counters = topk_maxscore(term_ids, query_vector, index, k, threshold)
+            with self._lock:
+                for name, value in counters.items():
+                    self.counters[name] += value
+                    count(name, value)
+            self._cache(key, generation, results)
+            return results
+
+    def search_terms(self, terms, k=None, threshold=None):
+        """
+        This function answers a query that was already turned into terms, without the cache, e.g. for one shard of a sharded index (see shards.py).
+
+        Args:
+            terms (list): The stemmed query terms, as returned by preprocess.
+            k (int): The number of documents to return, None to return every document with a score greater than or equal to the threshold.
+            threshold (float): The minimum similarity score of a document to be returned, None for the default threshold of the searcher.
+
+        Returns:
+            results (list): (docID, score) tuples ranked by score, the same as search (or search_topk if k is given) returns for the query.
+        """
+
+        threshold = self.threshold if threshold is None else threshold
+        with trace('search_terms', terms=terms, k=k, threshold=threshold):
+            index, _ = self._current_index()
+            with span('query_vector'):
+                term_ids, query_vector = calculate_QueryVector(terms, index) # calculate the query vector
+            if k is None:
+                with span('scoring'):
+                    scores = score_documents(term_ids, query_vector, index)
+                with span('ranking'):
+                    return rank_documents(scores, index, threshold)
+
+            with span('scoring'):
+                results, counters = topk_maxscore(term_ids, query_vector, index, k, threshold)
+            with self._lock:
+                for name, value in counters.items():
+                    self.counters[name] += value
+                    count(name, value)
+            return results
+
+    def search_batch(self, queries, k=None, threshold=None, max_chunk_bytes=64 * 2 ** 20):
+        """
+        This function answers many queries at once, scoring them together with score_batch.
+
+        The queries are scored in chunks, so that the score matrix of a chunk takes at most max_chunk_bytes of memory (but holds at least one query).
+        The results of each query are the same as the ones search returns for it. Only the queries whose results are not cached are scored.
+
+        Args:
+            queries (list): The query strings to be processed.
+            k (int): The number of documents to return for each query, None to return every document with a score greater than or equal to the threshold.
+            threshold (float): The minimum similarity score of a document to be returned, None for the default threshold of the searcher.
+            max_chunk_bytes (int): The memory budget of the score matrix of a chunk of queries.
+
+        Returns:
+            results (list): For each query, (docID, score) tuples of its best documents, ranked by score.
+        """
+
+        threshold = self.threshold if threshold is None else threshold
+        k = None if k is None else max(k, 0) # a negative k returns no documents, like a k of 0, instead of slicing off the last ones
+        with trace('search_batch', queries=len(queries), k=k, threshold=threshold):
+            index, generation = self._current_index() # the whole batch is answered with the same index
+            with span('analysis'):
+                terms, constraints = zip(*[self.analyze(query, index) for query in queries]) if queries else ((), ()) # preprocess all the queries first
+            keys = [QueryCache.make_key(query_terms, 'batch', k, threshold, query_constraints) for query_terms, query_constraints in zip(terms, constraints)]
+            results = [self._cached(key, generation) for key in keys]
+            missing = [i for i, result in enumerate(results) if result is None]
+            chunk_size = max(1, max_chunk_bytes // (8 * max(1, len(index.docIDs)))) # the number of queries whose float64 scores fit the budget
+
+            for start in range(0, len(missing), chunk_size):
+                chunk = missing[start:start + chunk_size]
+                with span('query_vector'):
+                    query_vectors = [calculate_QueryVector(terms[i], index) for i in chunk]
+                with span('scoring'):
+                    scores = score_batch(query_vectors, index)
+                with span('ranking'):
+                    for i, row in zip(chunk, scores): # rank the documents of each query
+                        results[i] = rank_documents(constrain_scores(row, index, constraints[i]), index, threshold)[:k]
+                        self._cache(keys[i], generation, results[i])
+            count('queries_scored', len(missing))
+            return results
+
+    def _current_index(self):
+        """
+        This function returns the index to answer a query with and its generation, after looking for a rebuilt index every check_interval seconds.
+        """
+
+        return self._current_state()[:2]
+
+    def _current_state(self):
+        """
+        This function returns the index, its generation and its ANN index, after looking for a rebuilt index every check_interval seconds.
+        """
+
+        if time.monotonic() - self._last_check >= self.check_interval:
+            with span('reload_check'):
+                self.reload()
+        return self._loaded # the query keeps using the same index until it is answered, even if it is reloaded in the meantime
+
+    def search_ann(self, query, k=10, nprobe=NPROBE, rerank=RERANK):
+        """
+        This function finds approximately the k documents most similar to a query with the ANN index, see ann_index.ANNIndex.search.
+
+        This is meant for long queries, e.g. the text of a whole document, whose many postings lists make an exact search slow.
+        The phrase and proximity operators of the query are ignored, their words are free text words.
+
+        Args:
+            query (str): The query string to be processed.
+            k (int): The number of documents to return.
+            nprobe (int): The number of clusters to search, more clusters find more of the exact results but take longer.
+            rerank (int): The number of candidates to score exactly, 0 to rank the documents by the similarity of their reduced vectors instead.
+
+        Returns:
+            results (list): (docID, score) tuples of at most k documents, ranked by score. The exact scores are cosine similarities, whatever the cosine setting of the searcher.
+
+        Raises:
+            ValueError: If no ANN index was built from the current index.
+        """
+
+        with trace('search_ann', query=query, k=k, nprobe=nprobe, rerank=rerank):
+            index, generation, ann = self._current_state()
+            if ann is None:
+                raise ValueError("{} has no ANN index, build one with 'python weights_calculation.py --ann {}'".format(self.index_path, DIMENSIONS))
+            with span('analysis'):
+                terms = self.analyze(query, index)[0]
+            key = QueryCache.make_key(terms, 'ann', k, nprobe, rerank)
+            results = self._cached(key, generation)
+            if results is not None:
+                return results
+
+            with span('query_vector'):
+                term_ids, query_vector = calculate_QueryVector(terms, index) # calculate the query vector
+            with span('ann_search'):
+                results = ann.search(term_ids, query_vector, index, k, nprobe, rerank)
+            self._cache(key, generation, results)
+            return results
+
+    def _cached(self, key, generation):
+        """
+        This function returns the cached results of a query, None if they are not cached or caching is disabled.
+        """
+
+        if self.cache is None:
+            return None
+        results = self.cache.get(key, generation)
+        count('cache_hits' if results is not None else 'cache_misses')
+        return results
+
+    def _cache(self, key, generation, results):
+        """
+        This function caches the results of a query, if caching is enabled.
+        """
+
+        if self.cache is not None:
+            self.cache.put(key, generation, results)
+
+
+_searcher = None # the searcher shared by all the calls to find_sim, created by the first call
+
+
+def get_searcher():
+    """
+    This function returns the searcher shared by all the calls to find_sim, and creates it when it is first needed.
+
+    Returns:
+        searcher (Searcher): The shared searcher.
+    """
+
+    global _searcher
+    if _searcher is None:
+        _searcher = Searcher()
+    return _searcher
+
+
+def find_sim(query):
+    '''
+    This function calculates the similarity scores between the query vector and the document vectors.
+
+    Args:
+        query (string): The query string to be processed.
+
+    Returns:
+        scores (string): a string containing the document IDs with similarity scores greater than or equal to the default threshold of the searcher (see COSINE_THRESHOLD), sorted and ranked with respect to their scores.
+    '''
+
+    with trace('find_sim', query=query), profile('find_sim'): # the stages of the search are recorded in this trace, see instrumentation.py
+        score = get_searcher().search(query) # the ranked documents with a similarity score of at least the default threshold
+
+    score = [k for k, v in score]
+    score = ' '.join(map(str, score))
+
+    return score
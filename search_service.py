@@ -0,0 +1,221 @@
+import os
+import json
+import argparse
+import traceback
+import concurrent.futures
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from search import Searcher
+from ann_index import DIMENSIONS
+from instrumentation import TRACE_ENV, PROFILE_ENV, enable_tracing, set_profile_mode, tracing_enabled, summary, profile
+
+
+class NoANNIndex(Exception):
+    """
+    Raised when a query asks for an approximate search (nprobe) but the index has no ANN index.
+    """
+
+
+class SearchService:
+    """
+    A headless search service answering queries from a pool of workers.
+
+    With a thread pool all the workers share a single Searcher. With a process pool every worker process opens its own
+    Searcher, and since the index file is memory-mapped the processes share its pages instead of holding a copy each.
+    A request that is not answered within the timeout fails, but its worker finishes the search in the background.
+
+    Attributes:
+        searcher (Searcher): The searcher shared by the thread pool, None with a process pool.
+        timeout (float): The number of seconds a request may take.
+    """
+
+    def __init__(self, index_path='index.vsm', workers=4, processes=False, timeout=5.0, cosine=True):
+        self.timeout = timeout
+        if processes:
+            self.searcher = None
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_process, initargs=(index_path, cosine))
+        else:
+            self.searcher = Searcher(index_path, cosine=cosine)
+            self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+    def search(self, query, k=None, threshold=None, nprobe=None):
+        """
+        This function answers a query with one of the workers.
+
+        Args:
+            query (str): The query string.
+            k (int): The number of documents to return, None for every document with a score greater than or equal to the threshold.
+            threshold (float): The minimum similarity score of a document to be returned, None for the default threshold of the searcher.
+            nprobe (int): Answer the query approximately with the ANN index, searching that many clusters (see Searcher.search_ann), None for an exact search.
+
+        Returns:
+            results (list): (docID, score) tuples ranked by score.
+
+        Raises:
+            concurrent.futures.TimeoutError: If the query is not answered within the timeout.
+            NoANNIndex: If nprobe is given but the index has no ANN index.
+        """
+
+        if self.searcher is None:
+            future = self.executor.submit(_search_in_process, query, k, threshold, nprobe)
+        else:
+            future = self.executor.submit(_search, self.searcher, query, k, threshold, nprobe)
+        return future.result(timeout=self.timeout)
+
+    def stats(self):
+        """
+        This function returns the generation, the pruning counters and the cache statistics of the searcher, None with a process pool.
+        When tracing is enabled, the time spent in every stage of the searches so far is included as 'traces', see instrumentation.summary.
+        """
+
+        if self.searcher is None:
+            return None
+        cache = self.searcher.cache.stats() if self.searcher.cache is not None else None
+        stats = {'generation': self.searcher.generation, 'counters': dict(self.searcher.counters), 'cache': cache}
+        if tracing_enabled():
+            stats['traces'] = summary()
+        return stats
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def _search(searcher, query, k, threshold, nprobe=None):
+    """
+    This function answers a query with a searcher, pruning the search when only the k best documents are needed, or approximately with the ANN index when nprobe is given.
+    """
+
+    with profile('search'): # does nothing unless a profiling mode is set
+        if nprobe is not None:
+            if searcher.ann is None: # checked in the worker, as only the worker holds the searcher with a process pool
+                raise NoANNIndex("The index has no ANN index, build one with 'python weights_calculation.py --ann {}'".format(DIMENSIONS))
+            return searcher.search_ann(query, k if k is not None else 10, nprobe)
+        if k is None:
+            return searcher.search(query, threshold)
+        return searcher.search_topk(query, k, threshold)
+
+
+_process_searcher = None # the searcher of a worker process, created by _init_process
+
+
+def _init_process(index_path, cosine):
+    """
+    This function opens the searcher of a worker process.
+    """
+
+    global _process_searcher
+    _process_searcher = Searcher(index_path, cosine=cosine)
+
+
+def _search_in_process(query, k, threshold, nprobe=None):
+    """
+    This function answers a query in a worker process, with the searcher of that process.
+    """
+
+    return _search(_process_searcher, query, k, threshold, nprobe)
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP/JSON interface of the search service.
+
+    GET /search?q=<query>[&k=<k>][&threshold=<threshold>] answers a query with {'query': query, 'results': [{'docID': docID, 'score': score}, ...]}.
+    Adding &nprobe=<nprobe> answers it approximately with the ANN index instead, e.g. for a long query, see Searcher.search_ann.
+    GET /stats returns the statistics of the searcher, and GET /health returns {'status': 'ok'}.
+    """
+
+    service = None # the SearchService answering the queries, set by serve
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parameters = parse_qs(url.query)
+
+        if url.path == '/health':
+            return self._reply(200, {'status': 'ok'})
+        if url.path == '/stats':
+            return self._reply(200, self.service.stats())
+        if url.path != '/search':
+            return self._reply(404, {'error': 'Unknown path ' + url.path})
+
+        try:
+            query = parameters.get('q', [''])[0]
+            k = int(parameters['k'][0]) if 'k' in parameters else None
+            threshold = float(parameters['threshold'][0]) if 'threshold' in parameters else None
+            nprobe = int(parameters['nprobe'][0]) if 'nprobe' in parameters else None
+        except ValueError:
+            return self._reply(400, {'error': 'k and nprobe must be integers and threshold a number'})
+        if (k is not None and k < 1) or (nprobe is not None and nprobe < 1):
+            return self._reply(400, {'error': 'k and nprobe must be at least 1'})
+
+        try:
+            results = self.service.search(query, k, threshold, nprobe)
+        except NoANNIndex as error:
+            return self._reply(400, {'error': str(error)})
+        except concurrent.futures.TimeoutError:
+            return self._reply(504, {'error': 'The search took longer than {} seconds'.format(self.service.timeout)})
+        except Exception: # a bug, not a bad request
+            traceback.print_exc()
+            return self._reply(500, {'error': 'The search failed'})
+        self._reply(200, {'query': query, 'results': [{'docID': docID, 'score': score} for docID, score in results]})
+
+    def _reply(self, status, body):
+        """
+        This function sends a JSON response.
+        """
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # do not log every request to stderr
+
+
+def serve(host='127.0.0.1', port=8000, **options):
+    """
+    This function runs the search service until it is interrupted.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+        options: The options of the SearchService.
+    """
+
+    service = SearchService(**options)
+    SearchHandler.service = service
+    server = ThreadingHTTPServer((host, port), SearchHandler) # every connection is handled by its own thread, which waits for a worker
+    print("Search service listening on http://{}:{}".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the index over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=4, help='the number of search workers')
+    parser.add_argument('--processes', action='store_true', help='search in worker processes instead of threads')
+    parser.add_argument('--timeout', type=float, default=5.0, help='the number of seconds a search may take')
+    parser.add_argument('--legacy-scores', action='store_true', help='score with the unnormalized document vectors, as before cosine scoring')
+    parser.add_argument('--trace', metavar='PATH', help="log the time taken by every stage of every query to PATH, '-' for stderr")
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], help='profile the searches, the profile is reported when the service stops')
+    args = parser.parse_args()
+    if args.trace:
+        os.environ[TRACE_ENV] = args.trace # the worker processes turn tracing on when they import the instrumentation module
+        enable_tracing(args.trace)
+    if args.profile:
+        os.environ[PROFILE_ENV] = args.profile
+        set_profile_mode(args.profile)
+    serve(args.host, args.port, workers=args.workers, processes=args.processes, timeout=args.timeout, cosine=not args.legacy_scores)
+
+
+if __name__ == '__main__':
+    main() # execute the main function
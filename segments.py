@@ -0,0 +1,279 @@
+import os
+import json
+import math as m
+import threading
+import contextlib
+import numpy as np
+from sparse_index import SparseIndex
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+
+_thread_lock = threading.Lock() # the threads of a process wait here, so only one of them at a time waits for the lock file
+
+
+def _lock_file(f):
+    """
+    This function waits until it holds the exclusive lock of an open file, which other processes wait for in turn.
+    """
+
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0) # msvcrt locks the bytes from the current position
+    while True:
+        try:
+            return msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        except OSError: # LK_LOCK gives up after 10 seconds, keep waiting
+            continue
+
+
+def _unlock_file(f):
+    """
+    This function releases the lock taken by _lock_file.
+    """
+
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def manifest_lock(directory='segments'):
+    """
+    This function holds the lock of the manifest of a segments directory while the manifest is read, changed and written back,
+    so an update and a background merge never overwrite each other's changes.
+
+    The lock is a lock file of the directory, 'manifest.lock', so it also keeps apart the updates and merges of separate processes,
+    e.g. two runs of 'python weights_calculation.py --update'. The lock is not reentrant.
+
+    Args:
+        directory (str): The segments directory, created if it does not exist yet.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    with _thread_lock, open(os.path.join(directory, 'manifest.lock'), 'a+b') as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def load_manifest(directory='segments'):
+    """
+    This function reads the manifest of the segments directory.
+
+    The manifest lists the segments, as {'name': name, 'postings': number of postings}, and the state of every indexed document,
+    as {docID: {'segment': name, 'size': bytes, 'mtime_ns': modification time, 'sha1': content hash}}. The segment of a document
+    is the one holding its current postings; any postings of the document in other (older) segments are dead.
+
+    Args:
+        directory (str): The segments directory.
+
+    Returns:
+        manifest (dict): The manifest, None if there is no manifest yet.
+    """
+
+    path = os.path.join(directory, 'manifest.json')
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    manifest['documents'] = {int(docID): state for docID, state in manifest['documents'].items()} # JSON object keys are always strings
+    return manifest
+
+
+def save_manifest(manifest, directory='segments'):
+    """
+    This function writes the manifest of the segments directory, replacing the previous one atomically.
+
+    Args:
+        manifest (dict): The manifest, see load_manifest.
+        directory (str): The segments directory.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def write_segment(counts, name, directory='segments', positions=None):
+    """
+    This function saves a segment, the raw term counts of a set of documents.
+
+    Args:
+        counts (SparseIndex): The postings holding the number of occurrences of each term in each document of the segment.
+        name (str): The name of the segment.
+        directory (str): The segments directory.
+        positions (ndarray): The positions of the terms of every posting, back to back in postings order, None if they were not recorded.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + '.npz')
+    arrays = {'terms': np.array(list(counts.terms), dtype=str), 'docIDs': counts.docIDs, 'offsets': counts.offsets, 'doc_index': counts.doc_index, 'counts': counts.weights}
+    if positions is not None:
+        arrays['positions'] = np.asarray(positions, dtype=np.int32)
+    with open(path + '.tmp', 'wb') as f: # written under a temporary name first, so a crash never leaves a partial segment behind
+        np.savez(f, **arrays)
+    os.replace(path + '.tmp', path)
+
+
+def read_segment(name, directory='segments', positions=False):
+    """
+    This function loads a segment saved by write_segment.
+
+    Args:
+        name (str): The name of the segment.
+        directory (str): The segments directory.
+        positions (bool): Also return the positions of the terms saved with the segment.
+
+    Returns:
+        counts (SparseIndex): The postings holding the term counts of the documents of the segment.
+        positions (ndarray): The positions of the terms of every posting, None if the segment has none. Only returned if positions is True.
+    """
+
+    with np.load(os.path.join(directory, name + '.npz'), allow_pickle=False) as data:
+        counts = SparseIndex(data['terms'].tolist(), data['docIDs'], data['offsets'], data['doc_index'], data['counts'])
+        if not positions:
+            return counts
+        return counts, (data['positions'] if 'positions' in data.files else None)
+
+
+def delete_segment(name, directory='segments'):
+    """
+    This function deletes the file of a segment.
+    """
+
+    path = os.path.join(directory, name + '.npz')
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def merge_counts(segments, live, positions=None):
+    """
+    This function merges the term counts of several segments into one SparseIndex, dropping the dead postings.
+
+    The vocabulary of the result is sorted, and every postings list is in docID order, so merging the segments of a corpus
+    gives the same postings as counting the whole corpus at once.
+
+    Args:
+        segments (dict): The segments to merge, {name: counts}.
+        live (dict): {docID: name} for every document of the result, the name is the segment holding the current postings of the document.
+        positions (dict): The positions of the terms of every segment, {name: positions}, None to only merge the counts.
+
+    Returns:
+        counts (SparseIndex): The merged term counts of the documents in live.
+        positions (ndarray): The merged positions, in the postings order of the merged counts. Only returned if positions are given.
+    """
+
+    terms, docs, values = [], [], []
+    position_starts, position_arrays, base = [], [], 0 # where the positions of every kept posting start, in the concatenated positions of the segments
+    for name, segment in segments.items():
+        segment_docs = segment.docIDs[segment.doc_index] # the docID of every posting
+        keep = np.array([live.get(int(docID)) == name for docID in segment.docIDs], dtype=bool)[segment.doc_index] # only the postings of the documents whose current version is in this segment
+        terms.append(np.repeat(np.array(list(segment.terms), dtype=str), segment.df)[keep])
+        docs.append(segment_docs[keep])
+        values.append(segment.weights[keep])
+        if positions is not None:
+            starts = np.cumsum(segment.weights.astype(np.int64)) - segment.weights.astype(np.int64) # every posting has as many positions as its count
+            position_starts.append(base + starts[keep])
+            position_arrays.append(np.asarray(positions[name], dtype=np.int32))
+            base += len(positions[name])
+
+    terms = np.concatenate(terms) if terms else np.zeros(0, dtype=str)
+    docs = np.concatenate(docs) if docs else np.zeros(0, dtype=np.int64)
+    values = np.concatenate(values) if values else np.zeros(0)
+
+    vocabulary, term_ids = np.unique(terms, return_inverse=True) # the sorted vocabulary and the term ID of every posting
+    docIDs = np.array(sorted(live), dtype=np.int64)
+    doc_index = np.searchsorted(docIDs, docs)
+    order = np.lexsort((doc_index, term_ids)) # sort the postings by term, and by docID within each term
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+
+    counts = SparseIndex(vocabulary.tolist(), docIDs, offsets, doc_index[order], values[order])
+    if positions is None:
+        return counts
+    starts = np.concatenate(position_starts + [np.zeros(0, dtype=np.int64)])[order]
+    lengths = counts.weights.astype(np.int64)
+    merged = np.concatenate(position_arrays + [np.zeros(0, dtype=np.int32)])[np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(int(lengths.sum()))]
+    return counts, merged
+
+
+def plan_merge(manifest, merge_factor=4):
+    """
+    This function picks the segments to merge, using a size tiered policy.
+
+    The segments are grouped into tiers by the order of magnitude (in base merge_factor) of their number of postings.
+    As soon as a tier holds merge_factor segments, they are merged into a single segment of the next tier, so every
+    posting is only rewritten a logarithmic number of times.
+
+    Args:
+        manifest (dict): The manifest, see load_manifest.
+        merge_factor (int): The number of segments of a tier that triggers a merge.
+
+    Returns:
+        names (list): The names of the segments to merge, empty if no merge is needed.
+    """
+
+    tiers = {}
+    for segment in manifest['segments']:
+        tier = int(m.log(max(segment['postings'], 1), merge_factor))
+        tiers.setdefault(tier, []).append(segment['name'])
+
+    for tier in sorted(tiers): # merge the smallest segments first
+        if len(tiers[tier]) >= merge_factor:
+            return tiers[tier]
+    return []
+
+
+def merge_segments(directory='segments', merge_factor=4):
+    """
+    This function merges the segments picked by plan_merge into one segment, until no more merges are needed.
+
+    The merged segment only holds the current postings of its documents. The merge itself runs without holding the manifest lock,
+    so it can run in the background while documents are being updated: a document updated during the merge keeps pointing
+    to its newer segment, and its postings in the merged segment are dead.
+
+    Args:
+        directory (str): The segments directory.
+        merge_factor (int): The number of segments of a tier that triggers a merge.
+    """
+
+    while True:
+        with manifest_lock(directory):
+            manifest = load_manifest(directory)
+            names = plan_merge(manifest, merge_factor) if manifest is not None else []
+            if not names:
+                return
+            live = {docID: state['segment'] for docID, state in manifest['documents'].items() if state['segment'] in names}
+            merged_name = 'segment-{}'.format(manifest['generation'])
+            manifest['generation'] += 1 # reserve the name of the merged segment
+            save_manifest(manifest, directory)
+
+        segments = {name: read_segment(name, directory, positions=True) for name in names}
+        if all(positions is not None for _, positions in segments.values()): # the merged segment keeps the positions only if every segment has them
+            merged, positions = merge_counts({name: counts for name, (counts, _) in segments.items()}, live, {name: positions for name, (_, positions) in segments.items()})
+        else:
+            merged, positions = merge_counts({name: counts for name, (counts, _) in segments.items()}, live), None
+        write_segment(merged, merged_name, directory, positions)
+
+        with manifest_lock(directory):
+            manifest = load_manifest(directory)
+            for docID, state in manifest['documents'].items():
+                if live.get(docID) == state['segment']: # the document was not updated during the merge
+                    state['segment'] = merged_name
+            manifest['segments'] = [segment for segment in manifest['segments'] if segment['name'] not in names]
+            manifest['segments'].append({'name': merged_name, 'postings': int(len(merged.weights))})
+            save_manifest(manifest, directory)
+
+        for name in names:
+            delete_segment(name, directory)
@@ -0,0 +1,247 @@
+import os
+import json
+import heapq
+import argparse
+import itertools
+import concurrent.futures
+import numpy as np
+from sparse_index import SparseIndex, write_index
+from postings_codec import quantize
+from text_analysis import Analyzer, get_stopwords, load_stem_table
+from search import Searcher
+
+
+def partition(docIDs, shards):
+    """
+    This function assigns the documents to shards, round robin in docID order, so that every shard gets about the same number of documents.
+
+    Args:
+        docIDs (ndarray): The sorted docIDs of all the documents.
+        shards (int): The number of shards.
+
+    Returns:
+        shard_of (ndarray): The shard of each document, in docIDs order.
+    """
+
+    return np.arange(len(docIDs)) % shards
+
+
+def split_index(index, shards):
+    """
+    This function splits an index into shards, each holding the postings of a subset of the documents.
+
+    Every shard keeps the whole vocabulary and the IDF weights calculated over all the documents (so postings lists may be empty
+    in a shard), and the weights and norms of its documents are the ones of the whole index. A query vector is therefore the same
+    on every shard, and every document gets exactly the score it would get from the whole index.
+
+    Args:
+        index (SparseIndex): The TF-IDF postings of all the documents.
+        shards (int): The number of shards.
+
+    Returns:
+        parts (list): A SparseIndex for each shard.
+    """
+
+    shard_of = partition(index.docIDs, shards)
+    posting_shard = shard_of[index.doc_index] # the shard of every posting
+    posting_term = np.repeat(np.arange(len(index.terms)), index.df) # the term ID of every posting
+    norms = index.norms
+
+    parts = []
+    for shard in range(shards):
+        docs = np.flatnonzero(shard_of == shard) # the positions of the documents of the shard in the whole index
+        position = np.full(len(index.docIDs), -1, dtype=np.int64)
+        position[docs] = np.arange(len(docs)) # the position of each of those documents in the shard
+        keep = posting_shard == shard # the postings keep their term and docID order
+        offsets = np.zeros(len(index.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_term[keep], minlength=len(index.terms)), out=offsets[1:])
+        parts.append(SparseIndex(index.terms, index.docIDs[docs], offsets, position[index.doc_index[keep]], index.weights[keep], index.idf, norms[docs], normalized=index.normalized))
+    return parts
+
+
+def write_shards(index, shards, directory='shards', weight_bits=0):
+    """
+    This function splits an index into shards and saves every shard as an index file of the shards directory.
+
+    The files are 'shard-0.vsm' to 'shard-<shards - 1>.vsm', and 'shards.json' records the number of shards and documents.
+    Shard files left over from a build with more shards are deleted. Compressed shards quantize the weights with the scales of the
+    whole index, so every posting is quantized to the same weight as in the unsharded compressed index.
+
+    Args:
+        index (SparseIndex): The TF-IDF postings of all the documents.
+        shards (int): The number of shards.
+        directory (str): The shards directory.
+        weight_bits (int): 8 or 16 to compress the postings of the shards, see sparse_index.CompressedIndex, 0 to save them uncompressed.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    previous = load_shards(directory)
+    scales = quantize(index.weights, index.offsets, weight_bits)[1] if weight_bits else None
+    for shard, part in enumerate(split_index(index, shards)):
+        write_index(part.compress(weight_bits, scales=scales) if weight_bits else part, os.path.join(directory, 'shard-{}.vsm'.format(shard)))
+
+    path = os.path.join(directory, 'shards.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'shards': shards, 'documents': len(index.docIDs)}, f)
+    os.replace(path + '.tmp', path)
+
+    if previous is not None:
+        for shard in range(shards, previous['shards']): # the shards that are not part of the new build
+            os.remove(os.path.join(directory, 'shard-{}.vsm'.format(shard)))
+
+
+def delete_shards(directory='shards'):
+    """
+    This function deletes the shard files and the description of the shards directory, when the index is no longer sharded.
+    """
+
+    description = load_shards(directory)
+    if description is None:
+        return
+    os.remove(os.path.join(directory, 'shards.json')) # removed first, so the directory is never described with missing shard files
+    for shard in range(description['shards']):
+        os.remove(os.path.join(directory, 'shard-{}.vsm'.format(shard)))
+
+
+def load_shards(directory='shards'):
+    """
+    This function reads the description of the shards saved by write_shards.
+
+    Args:
+        directory (str): The shards directory.
+
+    Returns:
+        description (dict): {'shards': number of shards, 'documents': number of documents}, None if there are no shards.
+    """
+
+    path = os.path.join(directory, 'shards.json')
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def merge_results(results, k=None):
+    """
+    This function merges the ranked results of the shards into the ranked results of the whole index.
+
+    The results of every shard are already ranked, so they are merged with a heap, by score in descending order and then by docID,
+    which is the order the whole index ranks documents with equal scores in.
+
+    Args:
+        results (list): The (docID, score) results of each shard.
+        k (int): The number of documents to return, None to return all of them.
+
+    Returns:
+        results (list): The k best (docID, score) tuples over all the shards.
+    """
+
+    merged = heapq.merge(*results, key=lambda result: (-result[1], result[0]))
+    return list(itertools.islice(merged, k))
+
+
+_shard_searcher = None # the searcher of a shard worker process, created by _init_shard
+
+
+def _init_shard(path, cosine):
+    """
+    This function opens the searcher of a shard worker process.
+    """
+
+    global _shard_searcher
+    _shard_searcher = Searcher(path, cache_bytes=0, cosine=cosine)
+
+
+def _search_shard(terms, k, threshold):
+    """
+    This function answers a query on the shard of a worker process.
+    """
+
+    return _shard_searcher.search_terms(terms, k, threshold)
+
+
+class ShardedSearcher:
+    """
+    A searcher that scatters every query to the shards of the index and gathers their results.
+
+    The query is analyzed once, then every shard finds its own k best documents in its own worker (a process by default, so the shards
+    are scored in parallel), and the results of the shards are merged with a heap. Since the shards share the vocabulary and IDF weights
+    of the whole index, the results are identical to the ones a Searcher returns for the unsharded index. Every worker reopens its shard
+    when it is rebuilt, like a Searcher does.
+
+    Attributes:
+        directory (str): The shards directory.
+        shards (int): The number of shards.
+        analyzer (Analyzer): The text analysis pipeline of the queries.
+    """
+
+    def __init__(self, directory='shards', processes=True, cosine=True):
+        description = load_shards(directory)
+        if description is None:
+            raise ValueError("{} does not hold a sharded index".format(directory))
+        self.directory = directory
+        self.shards = description['shards']
+        self.analyzer = Analyzer(get_stopwords(), stem_table=load_stem_table(os.path.join(directory, 'index.stems')))
+        paths = [os.path.join(directory, 'shard-{}.vsm'.format(shard)) for shard in range(self.shards)]
+
+        if processes: # one single worker process per shard, so every query of a shard goes to the process that opened it
+            self._searchers = None
+            self._executors = [concurrent.futures.ProcessPoolExecutor(1, initializer=_init_shard, initargs=(path, cosine)) for path in paths]
+        else:
+            self._searchers = [Searcher(path, cache_bytes=0, cosine=cosine) for path in paths]
+            self._executors = [concurrent.futures.ThreadPoolExecutor(1) for _ in paths]
+
+    def search(self, query, k=None, threshold=None):
+        """
+        This function answers a query with all the shards.
+
+        Args:
+            query (str): The query string to be processed.
+            k (int): The number of documents to return, None to return every document with a score greater than or equal to the threshold.
+            threshold (float): The minimum similarity score of a document to be returned, None for the default threshold of the shard searchers (see Searcher).
+
+        Returns:
+            results (list): (docID, score) tuples ranked by score, the same as Searcher.search_topk (or Searcher.search if k is None) returns for the unsharded index.
+        """
+
+        terms = self.analyzer.terms(query)
+        if self._searchers is None:
+            futures = [executor.submit(_search_shard, terms, k, threshold) for executor in self._executors]
+        else:
+            futures = [executor.submit(searcher.search_terms, terms, k, threshold) for executor, searcher in zip(self._executors, self._searchers)]
+        return merge_results([future.result() for future in futures], k)
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search a sharded index.')
+    parser.add_argument('query')
+    parser.add_argument('--directory', default='shards')
+    parser.add_argument('-k', type=int, default=None, help='the number of documents to return')
+    parser.add_argument('--threshold', type=float, default=None, help='the minimum score of a document, by default the one of the kind of scores')
+    parser.add_argument('--threads', action='store_true', help='search the shards in threads instead of worker processes')
+    parser.add_argument('--compare', action='store_true', help='also search the unsharded index and check that the results are identical')
+    args = parser.parse_args()
+
+    with ShardedSearcher(args.directory, processes=not args.threads) as searcher:
+        results = searcher.search(args.query, args.k, args.threshold)
+    for docID, score in results:
+        print(docID, score)
+
+    if args.compare:
+        single = Searcher(cache_bytes=0)
+        expected = single.search(args.query, args.threshold) if args.k is None else single.search_topk(args.query, args.k, args.threshold)
+        print("Results are identical to the unsharded index" if results == expected else "Results differ from the unsharded index")
+
+
+if __name__ == '__main__':
+    main() # execute the main function
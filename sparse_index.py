@@ -0,0 +1,540 @@
+import os
+import json
+import struct
+import numpy as np
+from term_dictionary import TermDictionary
+from postings_codec import BLOCK_SIZE, block_offsets, encode_postings, decode_blocks, decode_postings, quantize, encode_positions, decode_positions
+
+
+INDEX_MAGIC = b'VSMINDEX' # the first bytes of every index file
+INDEX_VERSION = 7 # bumped whenever the layout of the index file changes
+
+
+class SparseIndex:
+    """
+    A sparse, postings based representation of the term-document weights.
+
+    Every term in the vocabulary owns a postings list, i.e. the documents the term occurs in and the weight the term has in each of them.
+    The postings lists of all the terms are packed back to back into flat numpy arrays (CSR layout), so the memory used by the index
+    grows with the number of non-zero weights instead of with the size of the vocabulary x documents matrix.
+
+    Attributes:
+        terms (TermDictionary): The sorted vocabulary. The position of a term in the vocabulary is its term ID. A sorted list of terms given to the constructor is front coded.
+        docIDs (ndarray): The sorted document IDs. Postings refer to documents by their position in this array.
+        offsets (ndarray): The postings of the term with term ID t are stored at positions offsets[t] to offsets[t + 1] of the postings arrays.
+        doc_index (ndarray): The document positions of all the postings.
+        weights (ndarray): The weight of the term in the document for all the postings.
+        idf (ndarray): The Inverse Document Frequency weight of each term, None if it has not been calculated yet.
+        norms (ndarray): The L2 norm of each document vector, calculated from the weights when first needed. For a normalized index, the norms of the vectors before they were normalized.
+        max_weights (ndarray): The largest weight in the postings list of each term, calculated from the weights when first needed.
+        normalized (bool): True if the weights of every document vector were divided by its norm, so the dot product with a normalized query vector is the cosine similarity.
+        positions (PositionalPostings): The positions of the terms in the documents, None if they were not recorded.
+    """
+
+    def __init__(self, terms, docIDs, offsets, doc_index, weights, idf=None, norms=None, max_weights=None, normalized=False, positions=None):
+        self.terms = TermDictionary.from_terms(terms)
+        self.docIDs = np.asarray(docIDs, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_index = np.asarray(doc_index, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float64)
+        self._norms = None if norms is None else np.asarray(norms, dtype=np.float64)
+        self._max_weights = None if max_weights is None else np.asarray(max_weights, dtype=np.float64)
+        self.normalized = normalized
+        self.positions = positions
+
+    @classmethod
+    def from_dict(cls, weights, docIDs):
+        """
+        This function packs a nested dictionary of weights into a SparseIndex. The terms are sorted, so the term IDs do not depend on the order the terms were found in.
+
+        Args:
+            weights (dict): A dictionary of the form {term: {docID: weight}}.
+            docIDs (list): A sorted list of all the document IDs.
+
+        Returns:
+            index (SparseIndex): The packed postings.
+        """
+
+        positions = {docID: i for i, docID in enumerate(docIDs)} # map each docID to its position in the docIDs list
+        offsets = np.zeros(len(weights) + 1, dtype=np.int64)
+        doc_index = []
+        values = []
+
+        for t, term in enumerate(sorted(weights)): # append the postings of each term in docID order
+            for docID in sorted(weights[term]):
+                doc_index.append(positions[docID])
+                values.append(weights[term][docID])
+            offsets[t + 1] = len(doc_index)
+
+        return cls(sorted(weights), docIDs, offsets, doc_index, values)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    @property
+    def df(self):
+        """
+        The document frequency of each term, which is the length of its postings list.
+        """
+
+        return np.diff(self.offsets)
+
+    def normalize(self):
+        """
+        This function returns the index with every document vector divided by its L2 norm.
+
+        Returns:
+            index (SparseIndex): The normalized index, holding the norms of the document vectors before normalization. The index itself if it is already normalized.
+        """
+
+        if self.normalized:
+            return self
+        norms = self.norms
+        weights = self.weights / np.where(norms > 0, norms, 1.0)[self.doc_index] # a document whose terms all have an IDF of 0 has a norm of 0, and keeps its zero weights
+        return SparseIndex(self.terms, self.docIDs, self.offsets, self.doc_index, weights, self.idf, norms, normalized=True, positions=self.positions)
+
+    def denormalize(self):
+        """
+        This function returns the index with every document vector multiplied back by its L2 norm, i.e. with the weights as they were before normalize.
+
+        Returns:
+            index (SparseIndex): The index with the original weights, up to floating point rounding. The index itself if it is not normalized.
+        """
+
+        if not self.normalized:
+            return self
+        weights = self.weights * self.norms[self.doc_index]
+        return SparseIndex(self.terms, self.docIDs, self.offsets, self.doc_index, weights, self.idf, self.norms, positions=self.positions)
+
+    @property
+    def norms(self):
+        """
+        The L2 norm of each document vector, in docIDs order.
+        """
+
+        if self._norms is None: # calculated once, from the squared weights of the postings of each document
+            self._norms = np.sqrt(np.bincount(self.doc_index, weights=self.weights ** 2, minlength=len(self.docIDs)))
+        return self._norms
+
+    @property
+    def max_weights(self):
+        """
+        The largest weight in the postings list of each term, which bounds the contribution the term can make to the score of any document.
+        """
+
+        if self._max_weights is None:
+            self._max_weights = np.zeros(len(self.terms))
+            nonempty = self.df > 0 # the postings list of a term can be empty in a shard of the index
+            if nonempty.any(): # the postings of each non-empty list run up to the start of the next non-empty one
+                self._max_weights[nonempty] = np.maximum.reduceat(self.weights, self.offsets[:-1][nonempty])
+        return self._max_weights
+
+    def term_postings(self, t):
+        """
+        This function returns the postings list of the term with term ID t, as views into the postings arrays.
+
+        Args:
+            t (int): The term ID.
+
+        Returns:
+            doc_index (ndarray): The positions of the documents containing the term in the docIDs array.
+            weights (ndarray): The weight of the term in each of those documents.
+        """
+
+        start, end = self.offsets[t], self.offsets[t + 1]
+        return self.doc_index[start:end], self.weights[start:end]
+
+    def find_documents(self, t, doc_index):
+        """
+        This function looks documents up in the postings list of the term with term ID t, by binary search.
+
+        Args:
+            t (int): The term ID.
+            doc_index (ndarray): The sorted positions of the documents in the docIDs array.
+
+        Returns:
+            ranks (ndarray): The position of each document in the postings list of the term, -1 for the documents that do not contain the term.
+        """
+
+        postings = self.doc_index[self.offsets[t]:self.offsets[t + 1]]
+        ranks = np.searchsorted(postings, doc_index)
+        found = ranks < len(postings)
+        found[found] = postings[ranks[found]] == doc_index[found]
+        return np.where(found, ranks, -1)
+
+    def posting_weights(self, t, ranks):
+        """
+        This function returns the weights of some postings of the term with term ID t, by their positions in its postings list, e.g. as found by find_documents.
+        """
+
+        return self.weights[self.offsets[t] + ranks]
+
+    def compress(self, weight_bits=8, block_size=BLOCK_SIZE, scales=None):
+        """
+        This function returns the index with compressed postings, see CompressedIndex.
+
+        Args:
+            weight_bits (int): 8 or 16, the number of bits the weights are quantized to.
+            block_size (int): The number of postings in a block.
+            scales (ndarray): The quantization scale of each term, None to calculate them from the weights, see postings_codec.quantize.
+
+        Returns:
+            index (CompressedIndex): The compressed index.
+        """
+
+        encoded, block_first, block_bytes = encode_postings(self.doc_index, self.offsets, block_size)
+        quantized, scales = quantize(self.weights, self.offsets, weight_bits, scales)
+        return CompressedIndex(self.terms, self.docIDs, self.offsets, encoded, block_first, block_bytes, quantized, scales, self.idf, self.norms, self.normalized, block_size, self.positions)
+
+
+class CompressedIndex:
+    """
+    A SparseIndex whose postings are compressed, to make the index file smaller and scoring read less memory.
+
+    The document positions of every postings list are stored as variable byte gaps in blocks of block_size postings, with skip data
+    recording the first document and the first byte of every block, see postings_codec.encode_postings. The weights are quantized to
+    8 or 16 bit integers with a scale per term, see postings_codec.quantize, so the scores are close to (but not exactly) the scores of
+    the uncompressed index. Postings lists are decoded block-wise, when term_postings is called, and the rest of the attributes are the
+    same as the ones of a SparseIndex.
+
+    Attributes:
+        terms, docIDs, offsets, idf, norms, max_weights, normalized, positions: See SparseIndex. The max_weights are the largest weights the scales can represent.
+        weight_bits (int): The number of bits of a quantized weight.
+        block_size (int): The number of postings in a block.
+    """
+
+    def __init__(self, terms, docIDs, offsets, encoded, block_first, block_bytes, quantized, scales, idf, norms, normalized=False, block_size=BLOCK_SIZE, positions=None):
+        self.terms = TermDictionary.from_terms(terms)
+        self.docIDs = np.asarray(docIDs, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.encoded = np.asarray(encoded, dtype=np.uint8)
+        self.block_offsets = block_offsets(self.offsets, block_size) # not stored, it only depends on the lengths of the postings lists
+        self.block_first = np.asarray(block_first)
+        self.block_bytes = np.asarray(block_bytes)
+        self.quantized = np.asarray(quantized)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.norms = np.asarray(norms, dtype=np.float64)
+        self.normalized = normalized
+        self.block_size = block_size
+        self.weight_bits = self.quantized.dtype.itemsize * 8
+        self.max_weights = self.scales * (2 ** self.weight_bits - 1) # the largest weight of every term is quantized to the largest integer, or less in a shard
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    @property
+    def df(self):
+        """
+        The document frequency of each term, which is the length of its postings list.
+        """
+
+        return np.diff(self.offsets)
+
+    def term_postings(self, t):
+        """
+        This function decodes the postings list of the term with term ID t, all its blocks at once.
+
+        Args:
+            t (int): The term ID.
+
+        Returns:
+            doc_index (ndarray): The positions of the documents containing the term in the docIDs array.
+            weights (ndarray): The dequantized weight of the term in each of those documents.
+        """
+
+        start, end = self.offsets[t], self.offsets[t + 1]
+        doc_index = decode_blocks(self.encoded, self.block_first, self.block_bytes, self.block_offsets[t], self.block_offsets[t + 1], end - start, self.block_size)
+        return doc_index, self.quantized[start:end] * self.scales[t]
+
+    def find_documents(self, t, doc_index):
+        """
+        This function looks documents up in the postings list of the term with term ID t, see SparseIndex.find_documents.
+
+        The skip data is searched first, and only the blocks that may hold one of the documents are decoded, so looking a few documents up in a long postings list stays cheap.
+        """
+
+        first_block, last_block = self.block_offsets[t], self.block_offsets[t + 1]
+        df = self.offsets[t + 1] - self.offsets[t]
+        doc_index = np.asarray(doc_index)
+        blocks = np.searchsorted(self.block_first[first_block:last_block], doc_index, side='right') - 1 # the only block of the term that can hold each document
+        ranks = np.full(len(doc_index), -1, dtype=np.int64)
+        wanted = np.unique(blocks[blocks >= 0])
+        for run in np.split(wanted, np.flatnonzero(np.diff(wanted) > 1) + 1): # the runs of consecutive blocks, each decoded at once
+            if len(run) == 0:
+                continue
+            start, end = run[0] * self.block_size, min((run[-1] + 1) * self.block_size, df) # the ranks of the postings of the run
+            postings = decode_blocks(self.encoded, self.block_first, self.block_bytes, first_block + run[0], first_block + run[-1] + 1, end - start, self.block_size)
+            inside = (blocks >= run[0]) & (blocks <= run[-1])
+            local = np.searchsorted(postings, doc_index[inside])
+            found = local < len(postings)
+            found[found] = postings[local[found]] == doc_index[inside][found]
+            ranks[np.flatnonzero(inside)[found]] = start + local[found]
+        return ranks
+
+    def posting_weights(self, t, ranks):
+        """
+        This function returns the dequantized weights of some postings of the term with term ID t, see SparseIndex.posting_weights. No block is decoded.
+        """
+
+        return self.quantized[self.offsets[t] + ranks] * self.scales[t]
+
+    def decompress(self):
+        """
+        This function decodes all the postings into a SparseIndex, with the dequantized weights.
+
+        Returns:
+            index (SparseIndex): The uncompressed index.
+        """
+
+        doc_index = decode_postings(self.encoded, self.block_first, self.offsets, self.block_size)
+        weights = self.quantized * np.repeat(self.scales, self.df)
+        return SparseIndex(self.terms, self.docIDs, self.offsets, doc_index, weights, self.idf, self.norms, self.max_weights, self.normalized, self.positions)
+
+    def normalize(self):
+        """
+        This function returns the index with normalized document vectors: the index itself if it is already normalized, else a normalized SparseIndex.
+        """
+
+        return self if self.normalized else self.decompress().normalize()
+
+    def denormalize(self):
+        """
+        This function returns the index with unnormalized document vectors: the index itself if it is not normalized, else an unnormalized SparseIndex.
+        """
+
+        return self.decompress().denormalize() if self.normalized else self
+
+
+class PositionalPostings:
+    """
+    The positions of the terms in the documents, i.e. the token numbers at which each term occurs in each document of its postings list.
+
+    The positions are compressed in the blocks of block_size postings of the postings lists, see postings_codec.encode_positions,
+    so the positions of a few documents of a long postings list are found by decoding only the blocks holding those documents.
+    The postings are in the same order as the postings of the index they belong to, so the i-th posting of a term here is the i-th posting of the term there.
+
+    Attributes:
+        offsets (ndarray): The postings of the term with term ID t are postings offsets[t] to offsets[t + 1].
+        block_size (int): The number of postings in a block.
+    """
+
+    def __init__(self, offsets, encoded_counts, count_bytes, encoded_positions, position_bytes, block_size=BLOCK_SIZE):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.encoded_counts = np.asarray(encoded_counts, dtype=np.uint8)
+        self.count_bytes = np.asarray(count_bytes)
+        self.encoded_positions = np.asarray(encoded_positions, dtype=np.uint8)
+        self.position_bytes = np.asarray(position_bytes)
+        self.block_size = block_size
+        self.block_offsets = block_offsets(self.offsets, block_size) # not stored, it only depends on the lengths of the postings lists
+
+    @classmethod
+    def encode(cls, positions, counts, block_size=BLOCK_SIZE):
+        """
+        This function compresses the positions of the postings of a term counts index.
+
+        Args:
+            positions (ndarray): The positions of all the postings, back to back in postings order, see weights_calculation.collect_positions.
+            counts (SparseIndex): The postings holding the number of times each term occurs in each document, i.e. the number of positions of each posting.
+            block_size (int): The number of postings in a block.
+
+        Returns:
+            positions (PositionalPostings): The compressed positions.
+        """
+
+        return cls(counts.offsets, *encode_positions(positions, counts.weights.astype(np.int64), counts.offsets, block_size), block_size)
+
+    def term_positions(self, t, ranks):
+        """
+        This function decodes the positions of some of the postings of the term with term ID t.
+
+        Args:
+            t (int): The term ID.
+            ranks (ndarray): The sorted positions in the postings list of the term of the postings whose positions are needed.
+
+        Returns:
+            position_offsets (ndarray): The positions of the posting ranks[i] are positions[position_offsets[i]:position_offsets[i + 1]].
+            positions (ndarray): The positions of those postings, back to back.
+        """
+
+        ranks = np.asarray(ranks, dtype=np.int64)
+        blocks = np.unique(ranks // self.block_size)
+        runs = np.split(blocks, np.flatnonzero(np.diff(blocks) > 1) + 1) # the runs of consecutive blocks, each decoded at once
+        lengths, parts = [], []
+        for run in runs:
+            if len(run) == 0:
+                continue
+            run_offsets, run_positions = decode_positions(self.encoded_counts, self.count_bytes, self.encoded_positions, self.position_bytes,
+                                                          self.block_offsets[t] + run[0], self.block_offsets[t] + run[-1] + 1)
+            wanted = ranks[(ranks >= run[0] * self.block_size) & (ranks < (run[-1] + 1) * self.block_size)] - run[0] * self.block_size
+            starts, counts = run_offsets[wanted], run_offsets[wanted + 1] - run_offsets[wanted]
+            lengths.append(counts)
+            parts.append(run_positions[np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(int(counts.sum()))])
+
+        position_offsets = np.zeros(len(ranks) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(lengths + [np.zeros(0, dtype=np.int64)]), out=position_offsets[1:])
+        return position_offsets, np.concatenate(parts + [np.zeros(0, dtype=np.int64)])
+
+
+def write_index(index, path='index.vsm'):
+    """
+    This function saves a SparseIndex to a binary index file that can be memory-mapped by open_index.
+
+    The file starts with the INDEX_MAGIC bytes, the format version and the length of a JSON header, followed by the header itself.
+    The header records whether the document vectors are normalized, the codec of the postings, and the dtype, the byte offset and the number of items of every array stored in the file.
+    The arrays are the sorted docIDs, the postings offsets, document positions and weights, the IDF weights, the document norms,
+    the largest weight of each term and the vocabulary, stored as the front coded blocks of its TermDictionary and their offsets. Each array starts at a multiple of 64 bytes.
+    For a CompressedIndex the document positions, weights and largest weights are replaced by the encoded postings, their skip data, the quantized weights and the scales.
+    If the index records the positions of the terms in the documents, the encoded positions and their skip data are stored as well, see PositionalPostings.
+
+    The file is written next to its final path first and then renamed, so readers never see a partially written index.
+
+    Args:
+        index (SparseIndex or CompressedIndex): The index to save.
+        path (str): The path of the index file.
+    """
+
+    sections = {'docIDs': index.docIDs.astype('<i8'), 'offsets': index.offsets.astype('<i8')} # the arrays stored in the file, in little endian byte order
+    if isinstance(index, CompressedIndex):
+        codec = {'block_size': index.block_size, 'weight_bits': index.weight_bits}
+        sections['encoded'] = index.encoded
+        sections['block_first'] = index.block_first.astype('<i4')
+        sections['block_bytes'] = index.block_bytes.astype('<u4' if len(index.encoded) < 2 ** 32 else '<i8') # the skip data of a small index takes half the space
+        sections['quantized'] = index.quantized.astype('<u{}'.format(index.weight_bits // 8))
+        sections['scales'] = index.scales.astype('<f8')
+    else:
+        codec = None
+        sections['doc_index'] = index.doc_index.astype('<i4')
+        sections['weights'] = index.weights.astype('<f8')
+        sections['max_weights'] = index.max_weights.astype('<f8')
+    sections['idf'] = index.idf.astype('<f8')
+    sections['norms'] = index.norms.astype('<f8')
+    sections['term_data'] = index.terms.data
+    sections['term_blocks'] = index.terms.block_offsets.astype('<i8')
+    positions = None
+    if index.positions is not None:
+        positions = {'block_size': index.positions.block_size}
+        sections['encoded_counts'] = index.positions.encoded_counts
+        sections['count_bytes'] = index.positions.count_bytes.astype('<i8')
+        sections['encoded_positions'] = index.positions.encoded_positions
+        sections['position_bytes'] = index.positions.position_bytes.astype('<i8')
+
+    terms = {'count': len(index.terms), 'block_size': index.terms.block_size}
+    header = {'normalized': index.normalized, 'codec': codec, 'positions': positions, 'terms': terms, 'arrays': {}}
+    position = 0
+    for name, array in sections.items(): # lay the arrays out one after the other, relative to the end of the header
+        header['arrays'][name] = [array.dtype.str, position, len(array)]
+        position = _align(position + array.nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(len(INDEX_MAGIC) + 8 + len(header_bytes)) # the arrays start after the magic bytes, the version, the header length and the header
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        f.write(struct.pack('<II', INDEX_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in sections.items():
+            f.seek(data_start + header['arrays'][name][1]) # skip the padding before the array
+            f.write(array.tobytes())
+    os.replace(temp_path, path) # atomically replace any previous index
+
+
+def read_header(path='index.vsm'):
+    """
+    This function reads the header of a binary index file.
+
+    Args:
+        path (str): The path of the index file.
+
+    Returns:
+        header (dict): A dictionary of the form {'normalized': normalized, 'codec': codec, 'positions': positions, 'terms': terms, 'arrays': {name: [dtype, offset, length]}}, where the offsets are relative to the start of the arrays,
+                       codec is None for uncompressed postings or {'block_size': block_size, 'weight_bits': weight_bits}, positions is None if the positions of the terms were not recorded or {'block_size': block_size},
+                       and terms is {'count': the number of terms, 'block_size': the number of terms in a block of the term dictionary}.
+        data_start (int): The byte offset at which the arrays start.
+
+    Raises:
+        ValueError: If the file is not an index file, or was written with a different version of the format.
+    """
+
+    with open(path, 'rb') as f:
+        magic = f.read(len(INDEX_MAGIC))
+        if magic != INDEX_MAGIC:
+            raise ValueError("'{}' is not an index file".format(path))
+        version, header_length = struct.unpack('<II', f.read(8))
+        if version != INDEX_VERSION:
+            raise ValueError("'{}' has index format version {}, expected version {}".format(path, version, INDEX_VERSION))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+
+    return header, _align(len(INDEX_MAGIC) + 8 + header_length)
+
+
+def is_index(path='index.vsm'):
+    """
+    This function checks if a file exists and is an index file of the current format version.
+
+    Args:
+        path (str): The path of the index file.
+
+    Returns:
+        exists (bool): True if the file can be opened by open_index.
+    """
+
+    if not os.path.isfile(path):
+        return False
+    try:
+        read_header(path)
+    except ValueError: # an index written by another version of the format has to be rebuilt
+        return False
+    return True
+
+
+def open_index(path='index.vsm'):
+    """
+    This function opens a binary index file written by write_index.
+
+    The file is memory-mapped instead of read, so opening it is fast regardless of its size, and processes
+    that open the same file share its pages in the operating system's page cache. The arrays of the returned
+    index are read-only views into the mapping, including the front coded vocabulary, of which only the first term of every block is decoded.
+
+    Args:
+        path (str): The path of the index file.
+
+    Returns:
+        index (SparseIndex or CompressedIndex): The index stored in the file, a CompressedIndex if its postings are compressed.
+    """
+
+    header, data_start = read_header(path)
+    data = np.memmap(path, dtype='u1', mode='r') # map the whole file once, the arrays are views into it
+
+    arrays = {}
+    for name, (dtype, offset, length) in header['arrays'].items():
+        start = data_start + offset
+        arrays[name] = data[start:start + length * np.dtype(dtype).itemsize].view(dtype)
+
+    terms = TermDictionary(arrays['term_data'], arrays['term_blocks'], header['terms']['count'], header['terms']['block_size'])
+
+    positions = None
+    if header['positions'] is not None:
+        positions = PositionalPostings(arrays['offsets'], arrays['encoded_counts'], arrays['count_bytes'], arrays['encoded_positions'], arrays['position_bytes'], header['positions']['block_size'])
+
+    codec = header['codec']
+    if codec is not None:
+        return CompressedIndex(terms, arrays['docIDs'], arrays['offsets'], arrays['encoded'], arrays['block_first'], arrays['block_bytes'],
+                               arrays['quantized'], arrays['scales'], arrays['idf'], arrays['norms'], header['normalized'], codec['block_size'], positions)
+    return SparseIndex(terms, arrays['docIDs'], arrays['offsets'], arrays['doc_index'], arrays['weights'], arrays['idf'], arrays['norms'], arrays['max_weights'], header['normalized'], positions)
+
+
+def _align(position, alignment=64):
+    """
+    This function rounds a byte offset up to the next multiple of the alignment.
+    """
+
+    return -(-position // alignment) * alignment
@@ -0,0 +1,204 @@
+import re
+import bisect
+import functools
+import numpy as np
+
+
+TERMS_BLOCK_SIZE = 16 # the number of terms in a front coded block
+CACHED_BLOCKS = 1024 # the number of decoded blocks kept for the lookups, the blocks of the frequent query terms stay decoded
+
+
+class TermDictionary:
+    """
+    The sorted vocabulary of an index, front coded and mapping every term to its term ID, the position of the term in sorted order.
+
+    The terms are stored in blocks of block_size terms. The first term of a block is stored whole, and every other term as the length of the
+    prefix it shares with the previous term followed by the rest of the term, so the long shared prefixes of sorted terms are stored once.
+    The bytes of all the blocks are a single uint8 array, which open_index memory-maps from the index file instead of decoding every term.
+
+    Only the first term of every block is decoded, when the dictionary is created: a term is looked up by a binary search over those
+    terms, O(log V), followed by a binary search of a single block. The most recently used decoded blocks are kept in an LRU cache of
+    cached_blocks blocks, so the lookups of frequent terms do not decode their block again. Since the terms are sorted, the terms
+    starting with a prefix are a range of term IDs, which makes prefix and wildcard expansion cheap, see prefix_range and expand.
+
+    The dictionary can be used like the list of the terms in term ID order: len(terms), terms[t], iteration, term in terms and terms.index(term).
+
+    Attributes:
+        data (ndarray): The uint8 front coded blocks. A term is stored as a byte holding the length of the shared prefix, a byte holding the length of the rest, and the rest, in UTF-8.
+        block_offsets (ndarray): Block b is stored at bytes block_offsets[b] to block_offsets[b + 1] of data.
+        block_size (int): The number of terms in a block.
+    """
+
+    def __init__(self, data, block_offsets, count, block_size=TERMS_BLOCK_SIZE, cached_blocks=CACHED_BLOCKS):
+        self.data = np.asarray(data, dtype=np.uint8)
+        self.block_offsets = np.asarray(block_offsets, dtype=np.int64)
+        self.block_size = block_size
+        self._count = count
+        self._heads = [self._block(b, 1)[0] for b in range(len(self.block_offsets) - 1)] # the first term of every block, the in-memory index of the blocks
+        self._cached_block = functools.lru_cache(maxsize=cached_blocks)(self._block) # thread safe, the dictionary may be shared by several threads
+
+    @classmethod
+    def from_terms(cls, terms, block_size=TERMS_BLOCK_SIZE):
+        """
+        This function front codes a sorted vocabulary.
+
+        Args:
+            terms (iterable): The terms, sorted and distinct. A TermDictionary is returned as it is.
+            block_size (int): The number of terms in a block.
+
+        Returns:
+            dictionary (TermDictionary): The front coded terms.
+
+        Raises:
+            ValueError: If the terms are not sorted and distinct, or a term is longer than 255 bytes.
+        """
+
+        if isinstance(terms, TermDictionary):
+            return terms
+        data = bytearray()
+        block_offsets = []
+        previous = b''
+        count = 0
+        for count, term in enumerate(terms, 1):
+            encoded = term.encode('utf-8')
+            if count > 1 and encoded <= previous: # UTF-8 bytes sort in the same order as the code points of the terms
+                raise ValueError("the terms of a dictionary must be sorted and distinct, {!r} comes after {!r}".format(term, previous.decode('utf-8')))
+            if len(encoded) > 255:
+                raise ValueError("the term {!r} is longer than 255 bytes".format(term))
+            shared = 0
+            if (count - 1) % block_size == 0: # the first term of a block is stored whole
+                block_offsets.append(len(data))
+            else:
+                limit = min(len(encoded), len(previous))
+                while shared < limit and encoded[shared] == previous[shared]:
+                    shared += 1
+            data += bytes((shared, len(encoded) - shared)) + encoded[shared:]
+            previous = encoded
+        block_offsets.append(len(data))
+        return cls(np.frombuffer(bytes(data), dtype=np.uint8), np.array(block_offsets, dtype=np.int64), count, block_size)
+
+    def _block(self, b, limit=None):
+        """
+        This function decodes the terms of block b, or only its first limit terms.
+        """
+
+        raw = self.data[self.block_offsets[b]:self.block_offsets[b + 1]].tobytes()
+        terms = []
+        previous = b''
+        position = 0
+        while position < len(raw) and len(terms) != limit:
+            shared, length = raw[position], raw[position + 1]
+            previous = previous[:shared] + raw[position + 2:position + 2 + length]
+            terms.append(previous.decode('utf-8'))
+            position += 2 + length
+        return terms
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, t):
+        if not 0 <= t < self._count:
+            raise IndexError("term ID {} is out of range".format(t))
+        return self._cached_block(t // self.block_size)[t % self.block_size]
+
+    def __iter__(self):
+        for b in range(len(self._heads)):
+            yield from self._block(b)
+
+    def __contains__(self, term):
+        return self.lookup(term) is not None
+
+    def __eq__(self, other):
+        return isinstance(other, TermDictionary) and self.block_size == other.block_size and np.array_equal(self.data, other.data)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes taken by the front coded terms.
+        """
+
+        return self.data.nbytes + self.block_offsets.nbytes
+
+    def lookup(self, term):
+        """
+        This function returns the term ID of a term.
+
+        Args:
+            term (str): The term to look up.
+
+        Returns:
+            t (int): The term ID, None if the term is not in the dictionary.
+        """
+
+        b = bisect.bisect_right(self._heads, term) - 1 # the only block that can hold the term
+        if b < 0:
+            return None
+        if self._heads[b] == term:
+            return b * self.block_size
+        block = self._cached_block(b)
+        i = bisect.bisect_left(block, term)
+        return b * self.block_size + i if i < len(block) and block[i] == term else None
+
+    def index(self, term):
+        """
+        This function returns the term ID of a term, like list.index.
+
+        Raises:
+            ValueError: If the term is not in the dictionary.
+        """
+
+        t = self.lookup(term)
+        if t is None:
+            raise ValueError("{!r} is not in the dictionary".format(term))
+        return t
+
+    def _lower_bound(self, term):
+        """
+        This function returns the term ID of the first term that is not smaller than term.
+        """
+
+        b = bisect.bisect_right(self._heads, term) - 1
+        if b < 0:
+            return 0
+        return b * self.block_size + bisect.bisect_left(self._cached_block(b), term)
+
+    def prefix_range(self, prefix):
+        """
+        This function finds the terms starting with a prefix.
+
+        Args:
+            prefix (str): The prefix.
+
+        Returns:
+            start, end (int): The terms starting with the prefix are the terms with term IDs start to end - 1.
+        """
+
+        return self._lower_bound(prefix), self._lower_bound(prefix + '\U0010ffff') # no term continues the prefix with a larger code point
+
+    def expand(self, pattern):
+        """
+        This function finds the terms matching a wildcard pattern, where '*' matches any number of characters, e.g. 'retriev*'.
+
+        The terms starting with the part of the pattern before the first '*' are found with prefix_range, and only those are matched against the rest of the pattern.
+
+        Args:
+            pattern (str): The wildcard pattern.
+
+        Returns:
+            term_ids (ndarray): The term IDs of the matching terms, in increasing order.
+        """
+
+        prefix, star, rest = pattern.partition('*')
+        start, end = self.prefix_range(prefix)
+        if not star:
+            return np.arange(start, end)[:1] if start < end and self[start] == prefix else np.zeros(0, dtype=np.int64)
+        if rest.strip('*') == '': # a prefix query, every term of the range matches
+            return np.arange(start, end)
+
+        regex = re.compile('.*'.join(re.escape(part) for part in pattern.split('*')), re.DOTALL)
+        matches = []
+        for b in range(start // self.block_size, -(-end // self.block_size)):
+            for i, term in enumerate(self._block(b), b * self.block_size):
+                if start <= i < end and regex.fullmatch(term):
+                    matches.append(i)
+        return np.array(matches, dtype=np.int64)
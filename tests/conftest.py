@@ -0,0 +1,97 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # the modules live at the root of the repository
+
+from weights_calculation import collect_counts, collect_positions
+from text_analysis import word_tokenize
+
+
+def has_tokenizer():
+    """
+    This function returns True if the NLTK tokenizer data is installed, see the README.
+    """
+
+    try:
+        word_tokenize('vector space')
+    except LookupError:
+        return False
+    return True
+
+
+requires_tokenizer = pytest.mark.skipif(not has_tokenizer(), reason="the NLTK tokenizer data is not installed, run nltk.download('punkt')") # for the tests that analyze text
+
+
+def make_documents(seed=0, documents=300, vocabulary=60):
+    """
+    This function generates a small corpus of already analyzed documents, so the tests do not depend on the tokenizer data of nltk.
+
+    The words are drawn with Zipf like frequencies, so the postings lists of the common words are longer than a block of the codec,
+    and a few docIDs are skipped, so that the docIDs differ from the positions of the documents in the docIDs array.
+
+    Args:
+        seed (int): The seed of the random generator.
+        documents (int): The number of documents.
+        vocabulary (int): The number of distinct words.
+
+    Returns:
+        documents (dict): {docID: terms} where terms is the list of the terms of the document, in order.
+    """
+
+    rng = np.random.default_rng(seed)
+    words = ['w{:02d}'.format(i) for i in range(vocabulary)]
+    probabilities = 1 / np.arange(1, vocabulary + 1)
+    probabilities /= probabilities.sum()
+    docIDs = np.sort(rng.choice(np.arange(1, 2 * documents), documents, replace=False))
+    return {int(docID): [words[i] for i in rng.choice(vocabulary, int(rng.integers(1, 80)), p=probabilities)] for docID in docIDs}
+
+
+def count_documents(documents):
+    """
+    This function collects the term counts and the positions of the terms of a corpus, the way weights_calculation does for the files of a corpus.
+
+    Args:
+        documents (dict): {docID: terms}, see make_documents.
+
+    Returns:
+        counts (SparseIndex): The term counts, see weights_calculation.collect_counts.
+        positions (ndarray): The positions of the terms of every posting, see weights_calculation.collect_positions.
+    """
+
+    doc_positions = {}
+    for docID, terms in documents.items():
+        doc_positions[docID] = {}
+        for position, term in enumerate(terms):
+            doc_positions[docID].setdefault(term, []).append(position)
+    counts = collect_counts(((docID, {term: len(positions) for term, positions in doc_positions[docID].items()}) for docID in sorted(documents)), sorted(documents))
+    return counts, collect_positions(doc_positions, counts)
+
+
+@pytest.fixture
+def documents():
+    return make_documents()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    A temporary working directory with an empty stopword list, as the index files and the searchers use paths relative to the working directory.
+    """
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'Stopword-List.txt').write_text('')
+    return tmp_path
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    """
+    A temporary working directory holding a small synthetic corpus laid out like the real one, see benchmark.generate_corpus, for the tests that index text.
+    """
+
+    import benchmark
+    monkeypatch.chdir(tmp_path)
+    benchmark.generate_corpus(str(tmp_path), documents=60, vocabulary=300, length=40)
+    return tmp_path
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from conftest import count_documents
+from ann_index import ANNIndex, ann_path, load_ann
+from sparse_index import open_index
+from search import calculate_QueryVector, score_documents, topk_maxscore
+from weights_calculation import build_index
+
+
+def random_queries(index, queries=50, seed=4):
+    """
+    This function returns the query vectors of random queries of 5 to 30 terms of the vocabulary of an index.
+    """
+
+    rng = np.random.default_rng(seed)
+    terms = list(index.terms)
+    return [calculate_QueryVector([terms[i] for i in rng.choice(len(terms), int(rng.integers(5, 31)))], index) for _ in range(queries)]
+
+
+@pytest.mark.parametrize('weight_bits', [0, 8])
+@pytest.mark.parametrize('normalize', [True, False])
+def test_ann_rerank_scores_are_exact(documents, workdir, weight_bits, normalize):
+    """
+    Probing every cluster and reranking every candidate must give the cosine similarities of an exact search, read from the postings of the index.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', normalize=normalize, weight_bits=weight_bits, ann=16)
+    index = open_index('index.vsm')
+    ann = load_ann(ann_path('index.vsm'), index)
+    assert ann is not None
+    cosine = index.normalize()
+    clusters = ann.settings['clusters']
+
+    for term_ids, query_vector in random_queries(index):
+        scores = score_documents(term_ids, query_vector, cosine)
+        order = np.lexsort((cosine.docIDs, -scores))[:10]
+        expected = [(int(cosine.docIDs[i]), float(scores[i])) for i in order if scores[i] > 0]
+        found = ann.search(term_ids, query_vector, index, 10, clusters, len(index.docIDs))
+        assert [docID for docID, _ in found] == [docID for docID, _ in expected]
+        assert [score for _, score in found] == pytest.approx([score for _, score in expected], rel=1e-6)
+
+
+def test_ann_recall(documents, workdir):
+    """
+    With the default nprobe and rerank, the ANN search must find most of the 10 best documents of the exact search.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', ann=32)
+    index = open_index('index.vsm')
+    ann = load_ann(ann_path('index.vsm'), index)
+
+    recalls = []
+    for term_ids, query_vector in random_queries(index):
+        expected = {docID for docID, _ in topk_maxscore(term_ids, query_vector, index, 10, 0.0)[0]}
+        found = {docID for docID, _ in ann.search(term_ids, query_vector, index, 10)}
+        recalls.append(len(expected & found) / len(expected))
+    assert np.mean(recalls) >= 0.85
+
+
+def test_ann_index_of_another_index_is_ignored(documents, workdir):
+    """
+    An ANN index is only loaded with the TF-IDF index it was built from, since it is reranked from its postings.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', ann=16)
+    other, _ = count_documents({docID: terms[:-1] for docID, terms in documents.items()})
+    build_index(other, 'other.vsm')
+    assert load_ann(ann_path('index.vsm'), open_index('other.vsm')) is None
+
+
+def test_ann_refresh(documents, workdir):
+    """
+    After documents are changed without changing the vocabulary, refreshing the ANN index must keep its projection and clusters
+    and give an ANN index of the new weights, as if it was built again with them.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', ann=32)
+    previous = ANNIndex.load(ann_path('index.vsm'))
+
+    docIDs = sorted(documents)
+    changed = dict(documents)
+    for docID in docIDs[:30]: # the same words, with other counts
+        changed[docID] = documents[docID] + documents[docID][:5]
+    for docID in docIDs[-10:]: # deleted
+        del changed[docID]
+    counts, _ = count_documents(changed)
+    assert list(counts.terms) == list(open_index('index.vsm').terms)
+    build_index(counts, 'index.vsm', ann=32, refresh_ann=True)
+    index = open_index('index.vsm')
+    ann = load_ann(ann_path('index.vsm'), index)
+    assert ann is not None # the signature of the new weights
+    assert np.array_equal(ann.projection, previous.projection) and np.array_equal(ann.centroids, previous.centroids)
+    assert len(ann.list_documents) == len(changed)
+
+    rebuilt = ANNIndex.build(index, 32)
+    clusters = ann.settings['clusters']
+    for term_ids, query_vector in random_queries(index, 20):
+        assert ann.search(term_ids, query_vector, index, 10, clusters, len(changed)) == rebuilt.search(term_ids, query_vector, index, 10, clusters, len(changed))
+
+    changed[docIDs[0]] = changed[docIDs[0]] + ['zebra'] # a new term, the projection has no row for it
+    counts, _ = count_documents(changed)
+    build_index(counts, 'index.vsm', ann=32, refresh_ann=True)
+    ann = load_ann(ann_path('index.vsm'), open_index('index.vsm'))
+    assert ann is not None and len(ann.projection) == len(counts.terms)
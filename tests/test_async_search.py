@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+
+from conftest import requires_tokenizer
+from async_search import AsyncSearcher
+from benchmark import generate_queries
+from search import Searcher
+from weights_calculation import save_weights
+
+
+@pytest.fixture
+def searcher(corpus):
+    """
+    A searcher of the synthetic corpus, recording the queries of every search_batch call.
+    """
+
+    save_weights(shards=0, weight_bits=0, positions=False, ann=0)
+    searcher = Searcher('index.vsm', cache_bytes=0)
+    searcher.batch_calls = []
+    search_batch = searcher.search_batch
+
+    def recording_search_batch(queries, *args, **kwargs):
+        searcher.batch_calls.append(list(queries))
+        return search_batch(queries, *args, **kwargs)
+
+    searcher.search_batch = recording_search_batch
+    return searcher
+
+
+def answer(async_searcher, queries, k=None):
+    """
+    This function answers queries concurrently with an AsyncSearcher, in a new event loop.
+    """
+
+    async def search_all():
+        return await asyncio.gather(*(async_searcher.search(query, k) for query in queries), return_exceptions=True)
+
+    return asyncio.run(search_all())
+
+
+@requires_tokenizer
+def test_identical_queries_are_coalesced(searcher):
+    """
+    Concurrent queries with the same terms must share a single computation, and each get the results of the query.
+    """
+
+    queries = ['zebra ' + generate_queries(1, 300)[0]] * 10 + [generate_queries(1, 300)[0] + ' ZEBRA!']
+    async_searcher = AsyncSearcher(searcher, batch_window=0.05)
+    results = answer(async_searcher, queries, 10)
+    assert searcher.batch_calls == [queries[:1]]
+    assert async_searcher.coalesced == len(queries) - 1
+    assert all(result == searcher.search_topk(queries[0], 10) for result in results)
+
+
+@requires_tokenizer
+@pytest.mark.parametrize('max_batch_size, batches', [(64, 1), (8, 3)])
+def test_distinct_queries_are_batched(searcher, max_batch_size, batches):
+    """
+    Distinct concurrent queries must be scored together, in batches of at most max_batch_size queries, with the results of answering them one at a time.
+    """
+
+    queries = list(dict.fromkeys(generate_queries(40, 300)))[:20]
+    async_searcher = AsyncSearcher(searcher, batch_window=0.05, max_batch_size=max_batch_size)
+    for k in (None, 10):
+        searcher.batch_calls.clear()
+        results = answer(async_searcher, queries, k)
+        assert len(searcher.batch_calls) == batches and max(map(len, searcher.batch_calls)) <= max_batch_size
+        assert sorted(query for call in searcher.batch_calls for query in call) == sorted(queries)
+        assert results == [searcher.search(query)[:k] for query in queries]
+
+
+@requires_tokenizer
+def test_failed_batch_fails_every_query(searcher):
+    """
+    An error of the batch must be raised by every query waiting for it, and the queries must not stay in flight.
+    """
+
+    def fail(queries, *args):
+        raise MemoryError('the scores of the batch do not fit')
+
+    searcher.search_batch = fail
+    async_searcher = AsyncSearcher(searcher, batch_window=0.05)
+    results = answer(async_searcher, ['zebra', 'zebra', 'quagga'])
+    assert all(isinstance(result, MemoryError) for result in results)
+    assert async_searcher._in_flight == {}
@@ -0,0 +1,17 @@
+from conftest import requires_tokenizer
+import benchmark
+
+
+@requires_tokenizer
+def test_benchmark_run(tmp_path):
+    """
+    The benchmark harness must run end to end with its own settings, on a tiny corpus.
+    """
+
+    results = benchmark.run(documents=40, vocabulary=300, length=60, queries=30, batch_size=8, processes=1, directory=str(tmp_path), ann_queries=5)
+    assert results['indexing']['terms'] > 0
+    for name in ('find_sim', 'search', 'search_topk', 'search_batch'):
+        assert results['queries'][name]['calls'] > 0
+    assert results['memory']['single_query_bytes'] > 0
+    assert results['ann'] is not None
+    assert benchmark.compare(results, results) == []
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from conftest import count_documents
+from search import Searcher, COSINE_THRESHOLD, LEGACY_THRESHOLD
+from weights_calculation import build_index, calculate_TF, calculate_IDF, calculate_TFIDF
+
+
+def random_queries(terms, queries=50, seed=7):
+    """
+    This function returns random queries of 1 to 5 terms of a vocabulary.
+    """
+
+    rng = np.random.default_rng(seed)
+    return [[terms[i] for i in rng.choice(len(terms), int(rng.integers(1, 6)))] for _ in range(queries)]
+
+
+@pytest.mark.parametrize('normalize', [True, False])
+def test_cosine_and_legacy_scores(documents, workdir, normalize):
+    """
+    Whichever way the index was saved, a cosine searcher must score with the normalized document vectors, i.e. the legacy score of
+    a document divided by the norm of its vector, and a legacy searcher with the raw TF-IDF weights. Each has its own default threshold.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', normalize=normalize)
+    tf = calculate_TF(counts)
+    raw = calculate_TFIDF(tf, calculate_IDF(tf))
+    norms = dict(zip(raw.docIDs.tolist(), raw.norms.tolist()))
+
+    cosine = Searcher('index.vsm', cache_bytes=0)
+    legacy = Searcher('index.vsm', cache_bytes=0, cosine=False)
+    assert (cosine.threshold, legacy.threshold) == (COSINE_THRESHOLD, LEGACY_THRESHOLD)
+    assert cosine.index.normalized and not legacy.index.normalized
+
+    for query in random_queries(list(raw.terms)):
+        legacy_scores = dict(legacy.search_terms(query, threshold=0.0))
+        cosine_scores = dict(cosine.search_terms(query, threshold=0.0))
+        assert cosine_scores == pytest.approx({docID: score / norms[docID] for docID, score in legacy_scores.items()}, rel=1e-9)
+        assert all(score >= COSINE_THRESHOLD for _, score in cosine.search_terms(query))
+        assert all(score >= LEGACY_THRESHOLD for _, score in legacy.search_terms(query))
+        assert [docID for docID, _ in cosine.search_terms(query, 10)] == [docID for docID, _ in cosine.search_terms(query)][:10]
+
+
+def test_cosine_ranks_short_documents_first(workdir):
+    """
+    A short document about the query must outrank a long document mentioning it as often among many other terms, which the legacy scores rank first.
+    """
+
+    filler = ['w{:02d}'.format(i) for i in range(40)]
+    documents = {1: ['vector', 'space'], 2: ['vector', 'space'] + filler, 3: ['model'] + filler[:10], 4: ['index'] + filler[10:]}
+    documents[2] = documents[2] + ['vector'] # one more occurrence of a query term, lost among the other terms
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm')
+
+    assert [docID for docID, _ in Searcher('index.vsm', cache_bytes=0).search_terms(['vector', 'space'])] == [1, 2]
+    assert [docID for docID, _ in Searcher('index.vsm', cache_bytes=0, cosine=False).search_terms(['vector', 'space'])] == [2, 1]
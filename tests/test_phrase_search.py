@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from conftest import count_documents
+from phrase_search import parse_query, phrase_occurrences, near_documents, matching_documents
+from search import extract_weights
+from weights_calculation import build_index
+
+
+def brute_force_occurrences(documents, phrase):
+    """
+    This function finds every occurrence of a phrase by comparing it with the terms at every position of every document.
+
+    Returns:
+        occurrences (list): (docID, start) tuples, sorted.
+    """
+
+    return [(docID, start) for docID in sorted(documents) for start in range(len(documents[docID]) - len(phrase) + 1)
+            if documents[docID][start:start + len(phrase)] == list(phrase)]
+
+
+def brute_force_near(left, right, distance):
+    """
+    This function finds the documents where two phrases start at most distance positions apart, and at different positions, by comparing every pair of occurrences in every document.
+
+    Args:
+        left, right (list): The occurrences of each phrase, as returned by brute_force_occurrences.
+        distance (int): The largest number of positions between the phrases.
+    """
+
+    right_starts = {}
+    for docID, start in right:
+        right_starts.setdefault(docID, []).append(start)
+    return sorted({docID for docID, start in left if any(0 < abs(other - start) <= distance for other in right_starts.get(docID, []))})
+
+
+@pytest.fixture(params=[0, 8])
+def index(request, documents, workdir):
+    counts, positions = count_documents(documents)
+    build_index(counts, 'index.vsm', weight_bits=request.param, positions=positions)
+    return extract_weights('index.vsm')
+
+
+def random_phrases(documents, count, seed):
+    """
+    This function picks phrases of one to three terms, half of them taken from the documents so that they occur, and half made of random terms.
+    """
+
+    rng = np.random.default_rng(seed)
+    docIDs = sorted(documents)
+    terms = sorted({term for document in documents.values() for term in document})
+    phrases = []
+    for i in range(count):
+        length = int(rng.integers(1, 4))
+        document = documents[docIDs[int(rng.integers(len(docIDs)))]]
+        if i % 2 == 0 and len(document) >= length:
+            start = int(rng.integers(len(document) - length + 1))
+            phrases.append(tuple(document[start:start + length]))
+        else:
+            phrases.append(tuple(terms[j] for j in rng.choice(len(terms), length)))
+    return phrases
+
+
+def test_phrase_occurrences(documents, index):
+    """
+    The occurrences of a phrase must be exactly the ones found by brute force.
+    """
+
+    for phrase in random_phrases(documents, 200, seed=4):
+        doc_index, starts = phrase_occurrences(index, [index.terms.index(term) for term in phrase])
+        assert list(zip(index.docIDs[doc_index].tolist(), starts.tolist())) == brute_force_occurrences(documents, phrase)
+
+
+def test_near_documents(documents, index):
+    """
+    The documents matching NEAR/k must be exactly the ones found by brute force, in either order and with the same phrase on both sides.
+    """
+
+    phrases = random_phrases(documents, 100, seed=5)
+    occurrences = {phrase: brute_force_occurrences(documents, phrase) for phrase in phrases}
+    for left, right in zip(phrases, phrases[1:] + phrases[:1]):
+        for distance in (1, 2, 5, 20):
+            for first, second in ((left, right), (right, left), (left, left)):
+                found = near_documents(index, [index.terms.index(term) for term in first], [index.terms.index(term) for term in second], distance)
+                assert index.docIDs[found].tolist() == brute_force_near(occurrences[first], occurrences[second], distance)
+
+
+def test_matching_documents(documents, index):
+    """
+    The documents matching all the operators of a query must be the intersection of the documents matching each of them.
+    """
+
+    phrases = random_phrases(documents, 60, seed=6)
+    for phrase, left, right in zip(phrases[0::3], phrases[1::3], phrases[2::3]):
+        constraints = (('phrase', phrase), ('near', left, right, 10))
+        near = brute_force_near(brute_force_occurrences(documents, left), brute_force_occurrences(documents, right), 10)
+        expected = sorted({docID for docID, _ in brute_force_occurrences(documents, phrase)} & set(near))
+        assert index.docIDs[matching_documents(index, constraints)].tolist() == expected
+    assert len(matching_documents(index, (('phrase', ('w00', 'unknown')),))) == 0
+
+
+def test_parse_query():
+    """
+    Chained operators all match, and the words of the operators stay in the free text of the query.
+    """
+
+    text, phrases, nears = parse_query('"vector space" model NEAR/3 "retrieval system" NEAR/2 cosine')
+    assert phrases == ['vector space', 'retrieval system']
+    assert nears == [('model', 'retrieval system', 3), ('retrieval system', 'cosine', 2)]
+    assert text.split() == ['vector', 'space', 'model', 'retrieval', 'system', 'cosine']
@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+
+from conftest import count_documents
+from postings_codec import BLOCK_SIZE, varint_encode, varint_decode, encode_postings, decode_blocks, decode_postings, block_offsets, quantize
+from sparse_index import SparseIndex, PositionalPostings, open_index
+from segments import write_segment, save_manifest
+from weights_calculation import build_index, compare_formats
+
+
+def random_postings(seed=0, terms=40, documents=2000):
+    """
+    This function generates random postings lists, from empty ones to ones several blocks long.
+
+    Returns:
+        doc_index (ndarray): The document positions of all the postings, in increasing order within each postings list.
+        offsets (ndarray): The postings of term t are at positions offsets[t] to offsets[t + 1].
+    """
+
+    rng = np.random.default_rng(seed)
+    lists = [np.sort(rng.choice(documents, int(size), replace=False)) for size in rng.choice([0, 1, 5, BLOCK_SIZE - 1, BLOCK_SIZE, BLOCK_SIZE + 1, 3 * BLOCK_SIZE + 7, 1500], terms)]
+    offsets = np.zeros(terms + 1, dtype=np.int64)
+    np.cumsum([len(postings) for postings in lists], out=offsets[1:])
+    return np.concatenate(lists).astype(np.int64), offsets
+
+
+def test_varint_round_trip():
+    """
+    Values of every encoded length must decode to themselves.
+    """
+
+    values = np.array([0, 1, 127, 128, 255, 16383, 16384, 2 ** 21, 2 ** 28 - 1, 2 ** 28, 2 ** 35 - 1], dtype=np.int64)
+    assert np.array_equal(varint_decode(varint_encode(values)), values)
+    assert len(varint_decode(varint_encode(np.zeros(0, dtype=np.int64)))) == 0
+
+
+def test_postings_round_trip():
+    """
+    Every postings list must decode to the same document positions, as a whole index and one run of blocks at a time.
+    """
+
+    doc_index, offsets = random_postings()
+    encoded, block_first, block_bytes = encode_postings(doc_index, offsets)
+    assert np.array_equal(decode_postings(encoded, block_first, offsets), doc_index)
+
+    blocks = block_offsets(offsets)
+    for t in range(len(offsets) - 1):
+        postings = doc_index[offsets[t]:offsets[t + 1]]
+        assert np.array_equal(decode_blocks(encoded, block_first, block_bytes, blocks[t], blocks[t + 1], len(postings)), postings)
+        if len(postings) > BLOCK_SIZE: # a run of blocks that does not start at the first block of the list
+            assert np.array_equal(decode_blocks(encoded, block_first, block_bytes, blocks[t] + 1, blocks[t + 1], len(postings) - BLOCK_SIZE), postings[BLOCK_SIZE:])
+
+
+@pytest.mark.parametrize('bits', [8, 16])
+def test_quantize_error(bits):
+    """
+    A quantized weight times the scale of its term must be within half a scale of the weight.
+    """
+
+    doc_index, offsets = random_postings()
+    weights = np.random.default_rng(1).random(len(doc_index))
+    quantized, scales = quantize(weights, offsets, bits)
+    scale = np.repeat(scales, np.diff(offsets))
+    assert np.all(np.abs(quantized * scale - weights) <= scale / 2 + 1e-12)
+
+
+@pytest.mark.parametrize('weight_bits', [8, 16])
+def test_compressed_index_round_trip(weight_bits):
+    """
+    A compressed index must find the same postings as the index it was compressed from, with the quantized weights.
+    """
+
+    doc_index, offsets = random_postings()
+    weights = np.random.default_rng(1).random(len(doc_index))
+    index = SparseIndex(['t{:02d}'.format(t) for t in range(len(offsets) - 1)], np.arange(2000) * 3, offsets, doc_index, weights)
+    compressed = index.compress(weight_bits)
+    assert np.array_equal(compressed.decompress().doc_index, index.doc_index)
+
+    lookups = np.arange(0, 2000, 7) # the sorted documents looked up in every postings list
+    for t in range(len(offsets) - 1):
+        postings, term_weights = compressed.term_postings(t)
+        assert np.array_equal(postings, index.term_postings(t)[0])
+        assert np.allclose(term_weights, index.term_postings(t)[1], atol=compressed.scales[t] / 2 + 1e-12)
+        ranks = compressed.find_documents(t, lookups)
+        assert np.array_equal(ranks, index.find_documents(t, lookups))
+        assert np.array_equal(compressed.posting_weights(t, ranks[ranks >= 0]), term_weights[ranks[ranks >= 0]])
+
+
+def test_positions_round_trip(documents):
+    """
+    The positions of any postings of a term must decode to the positions that were encoded.
+    """
+
+    counts, positions = count_documents(documents)
+    encoded = PositionalPostings.encode(positions, counts)
+    starts = np.cumsum(counts.weights.astype(np.int64)) - counts.weights.astype(np.int64) # where the positions of every posting start
+    rng = np.random.default_rng(3)
+    for t in range(len(counts.terms)):
+        df = int(counts.offsets[t + 1] - counts.offsets[t])
+        for ranks in (np.arange(df), np.sort(rng.choice(df, min(df, 5), replace=False))):
+            position_offsets, term_positions = encoded.term_positions(t, ranks)
+            for i, rank in enumerate(ranks.tolist()):
+                posting = counts.offsets[t] + rank
+                expected = positions[starts[posting]:starts[posting] + int(counts.weights[posting])]
+                assert np.array_equal(term_positions[position_offsets[i]:position_offsets[i + 1]], expected)
+
+
+@pytest.mark.parametrize('weight_bits', [0, 8])
+def test_index_file_round_trip(documents, workdir, weight_bits):
+    """
+    An index saved by build_index must be read back by open_index with the postings and positions of the term counts it was built from.
+    """
+
+    counts, positions = count_documents(documents)
+    build_index(counts, 'index.vsm', weight_bits=weight_bits, positions=positions)
+    index = open_index('index.vsm')
+    expected = PositionalPostings.encode(positions, counts)
+
+    assert list(index.terms) == list(counts.terms)
+    assert np.array_equal(index.docIDs, counts.docIDs)
+    for t in range(len(counts.terms)):
+        assert np.array_equal(index.term_postings(t)[0], counts.term_postings(t)[0])
+        ranks = np.arange(int(counts.df[t]))
+        assert all(np.array_equal(read, written) for read, written in zip(index.positions.term_positions(t, ranks), expected.term_positions(t, ranks)))
+
+
+@pytest.mark.parametrize('saved_bits', [0, 8])
+def test_compare_formats(documents, workdir, saved_bits):
+    """
+    compare_formats must measure the error of the quantized weights against the exact weights, also when the saved index is compressed,
+    with the exact weights calculated from the term counts or from the segments of the index.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', weight_bits=saved_bits)
+    report = compare_formats('index.vsm', 8, queries=50, repeat=1, counts=counts)
+    assert 0 < report['max_score_error'] < 0.01
+    assert report['compressed']['bytes'] < report['uncompressed']['bytes']
+
+    write_segment(counts, 'segment-0', 'segments')
+    save_manifest({'generation': 1, 'segments': [{'name': 'segment-0', 'postings': int(len(counts.weights))}],
+                   'documents': {int(docID): {'segment': 'segment-0'} for docID in counts.docIDs}}, 'segments')
+    assert compare_formats('index.vsm', 8, queries=50, repeat=1)['max_score_error'] == report['max_score_error']
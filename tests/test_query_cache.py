@@ -0,0 +1,105 @@
+import query_cache
+from conftest import requires_tokenizer
+from query_cache import QueryCache
+from search import Searcher
+from weights_calculation import save_weights
+
+
+class Clock:
+    """
+    A monotonic clock that only moves when it is told to.
+    """
+
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+def results(docIDs):
+    """
+    This function returns (docID, score) results ranking the documents in the given order.
+    """
+
+    return [(docID, 1.0 / (rank + 1)) for rank, docID in enumerate(docIDs)]
+
+
+def test_key_ignores_term_order():
+    assert QueryCache.make_key(['vector', 'space', 'vector'], 10) == QueryCache.make_key(['space', 'vector', 'vector'], 10)
+    assert QueryCache.make_key(['vector', 'space'], 10) != QueryCache.make_key(['vector', 'space'], 5)
+    assert QueryCache.make_key(['vector', 'space'], 10) != QueryCache.make_key(['vector', 'space', 'space'], 10)
+
+
+def test_ttl(monkeypatch):
+    """
+    An entry must be returned until it is ttl seconds old, and never after.
+    """
+
+    clock = Clock()
+    monkeypatch.setattr(query_cache, 'time', clock)
+    cache = QueryCache(ttl=10)
+    key = QueryCache.make_key(['vector'], 10)
+    cache.put(key, 1, results([1, 2]))
+    clock.now += 10
+    assert cache.get(key, 1) == results([1, 2])
+    clock.now += 0.5
+    assert cache.get(key, 1) is None
+    assert cache.stats()['expirations'] == 1 and cache.stats()['entries'] == 0
+
+
+def test_lru_eviction():
+    """
+    Going over the memory budget must evict the least recently used entries, a hit making an entry the most recently used one.
+    """
+
+    keys = [QueryCache.make_key(['term{}'.format(i)], 10) for i in range(4)]
+    size = query_cache._estimate_size(keys[0], results(range(10)))
+    cache = QueryCache(max_bytes=3 * size)
+    for key in keys[:3]:
+        cache.put(key, 1, results(range(10)))
+    assert cache.get(keys[0], 1) is not None
+    cache.put(keys[3], 1, results(range(10))) # evicts keys[1], the least recently used
+    assert cache.get(keys[1], 1) is None
+    assert all(cache.get(key, 1) is not None for key in (keys[0], keys[2], keys[3]))
+    assert cache.stats()['evictions'] == 1 and cache.stats()['bytes'] <= cache.max_bytes
+
+    cache.put(QueryCache.make_key(['huge'], None), 1, results(range(10000))) # larger than the whole budget, not cached
+    assert cache.stats()['entries'] == 3
+
+
+def test_generation_invalidation():
+    """
+    Asking for the results of another index generation must drop every entry.
+    """
+
+    cache = QueryCache()
+    key = QueryCache.make_key(['vector'], 10)
+    cache.put(key, 1, results([1, 2]))
+    assert cache.get(key, 2) is None
+    assert cache.stats()['invalidations'] == 1 and cache.stats()['entries'] == 0
+    cache.put(key, 1, results([1, 2])) # results of an older generation replace the newer ones, and are only returned for that generation
+    assert cache.get(key, 1) == results([1, 2])
+    assert cache.get(key, 2) is None
+
+
+@requires_tokenizer
+def test_searcher_cache_follows_the_index(corpus):
+    """
+    A searcher must answer a repeated query from its cache, and answer it again once the index was rebuilt.
+    """
+
+    save_weights(shards=0, weight_bits=0, positions=False, ann=0)
+    searcher = Searcher('index.vsm', check_interval=0)
+    uncached = Searcher('index.vsm', cache_bytes=0)
+    query = 'zebra quagga'
+    assert searcher.search(query) == []
+    assert searcher.search('Quagga, zebra!') == [] # the same terms
+    assert searcher.cache.stats()['hits'] == 1
+
+    (corpus / 'ResearchPapers' / '61.txt').write_text('zebra quagga\n')
+    save_weights(shards=0, weight_bits=0, positions=False, ann=0)
+    uncached.reload(force=True)
+    assert [docID for docID, _ in searcher.search(query)] == [61]
+    assert searcher.search(query) == uncached.search(query)
+    assert searcher.cache.stats()['invalidations'] == 1
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from conftest import count_documents, requires_tokenizer
+from benchmark import generate_queries
+from search import Searcher, extract_weights, calculate_QueryVector, score_documents, score_batch
+from weights_calculation import build_index, save_weights
+
+
+@pytest.mark.parametrize('weight_bits', [0, 8])
+def test_score_batch_matches_score_documents(documents, workdir, weight_bits):
+    """
+    The score matrix of a batch must hold exactly the scores score_documents calculates for each query on its own,
+    including for queries without any term of the vocabulary and an empty batch.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', weight_bits=weight_bits)
+    index = extract_weights('index.vsm')
+    terms = list(index.terms)
+
+    rng = np.random.default_rng(5)
+    queries = [[terms[i] for i in rng.choice(len(terms), int(rng.integers(1, 8)))] for _ in range(40)] + [[], ['zebra']]
+    query_vectors = [calculate_QueryVector(query, index) for query in queries]
+    scores = score_batch(query_vectors, index)
+    assert scores.shape == (len(queries), len(index.docIDs))
+    for row, (term_ids, query_vector) in zip(scores, query_vectors):
+        assert np.array_equal(row, score_documents(term_ids, query_vector, index))
+    assert score_batch([], index).shape == (0, len(index.docIDs))
+
+
+@requires_tokenizer
+@pytest.mark.parametrize('max_chunk_bytes', [1, 8 * 60 * 7, 64 * 2 ** 20])
+def test_search_batch_matches_search(corpus, max_chunk_bytes):
+    """
+    Answering queries in batches must give the results of answering them one at a time, whatever the number of queries of a chunk.
+    """
+
+    save_weights(shards=0, weight_bits=0, positions=False, ann=0)
+    queries = generate_queries(30, 300) + ['', 'zebra']
+    single = Searcher('index.vsm', cache_bytes=0)
+    batch = Searcher('index.vsm', cache_bytes=0)
+    for k in (None, 1, 10):
+        for threshold in (None, 0.0):
+            expected = [single.search(query, threshold)[:k] for query in queries]
+            assert batch.search_batch(queries, k, threshold, max_chunk_bytes) == expected
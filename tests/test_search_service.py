@@ -0,0 +1,66 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import pytest
+
+import search_service
+from conftest import count_documents
+from search_service import SearchService, SearchHandler
+from weights_calculation import build_index
+
+
+@pytest.fixture(params=[False, True], ids=['threads', 'processes'])
+def service_url(request, documents, workdir):
+    """
+    The URL of a search service answering from an index without an ANN index, with a thread pool or a process pool.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm')
+    SearchHandler.service = SearchService('index.vsm', workers=2, processes=request.param)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SearchHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    SearchHandler.service.close()
+
+
+def get(url):
+    """
+    This function sends a GET request and returns the status and the JSON body of the response.
+    """
+
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, json.load(error)
+
+
+def test_bad_requests(service_url):
+    assert get(service_url + '/health') == (200, {'status': 'ok'})
+    assert get(service_url + '/search?q=vector&k=0')[0] == 400
+    assert get(service_url + '/search?q=vector&nprobe=0')[0] == 400
+    assert get(service_url + '/search?q=vector&k=ten')[0] == 400
+    status, body = get(service_url + '/search?q=vector&nprobe=4') # the index has no ANN index
+    assert status == 400 and '--ann' in body['error']
+
+
+def test_internal_error(service_url, monkeypatch):
+    """
+    An unexpected error of a search is an internal error of the service, even a ValueError, not a bad request.
+    """
+
+    if SearchHandler.service.searcher is None:
+        pytest.skip('the worker processes do not see the patched function')
+
+    def fail(*args):
+        raise ValueError('need at least one array to concatenate')
+
+    monkeypatch.setattr(search_service, '_search', fail)
+    assert get(service_url + '/search?q=vector&k=10') == (500, {'error': 'The search failed'})
@@ -0,0 +1,96 @@
+import os
+import time
+import multiprocessing
+import numpy as np
+
+from conftest import make_documents, count_documents
+from segments import manifest_lock, save_manifest, load_manifest, write_segment, read_segment, merge_counts, merge_segments
+from weights_calculation import build_index
+
+
+def assert_same_counts(counts, positions, expected, expected_positions):
+    """
+    This function checks that two term counts indexes and their positions are identical.
+    """
+
+    assert list(counts.terms) == list(expected.terms)
+    assert np.array_equal(counts.docIDs, expected.docIDs)
+    assert np.array_equal(counts.offsets, expected.offsets)
+    assert np.array_equal(counts.doc_index, expected.doc_index)
+    assert np.array_equal(counts.weights, expected.weights)
+    assert np.array_equal(positions, expected_positions)
+
+
+def test_merged_segments_match_rebuild(documents, workdir):
+    """
+    Merging segments must give the term counts, the positions and the index file of indexing the current documents from scratch, as --rebuild does.
+
+    The documents are indexed in four segments, and the later ones hold new versions of documents of the earlier segments as well,
+    whose older postings are dead. A few documents are deleted. The segments are then merged by merge_segments, into a single one.
+    """
+
+    docIDs = sorted(documents)
+    updates = iter(make_documents(seed=1, documents=len(docIDs)).values()) # the new contents of the updated documents
+    batches = [(docIDs[:100], []), (docIDs[100:175], docIDs[0:20]), (docIDs[175:240], docIDs[10:30] + docIDs[100:105]), (docIDs[240:], [])] # the new and the updated documents of every segment, of about the same size so they are merged together
+    batches = [dict([(docID, documents[docID]) for docID in new] + [(docID, next(updates)) for docID in updated]) for new, updated in batches]
+    deleted = set(docIDs[40:45] + docIDs[15:17] + docIDs[260:262]) # documents of the first, updated and last segments
+
+    manifest = {'generation': len(batches), 'segments': [], 'documents': {}}
+    current = {}
+    for generation, batch in enumerate(batches):
+        name = 'segment-{}'.format(generation)
+        counts, positions = count_documents(batch)
+        write_segment(counts, name, 'segments', positions)
+        manifest['segments'].append({'name': name, 'postings': int(len(counts.weights))})
+        for docID, terms in batch.items():
+            manifest['documents'][docID] = {'segment': name}
+            current[docID] = terms
+    for docID in deleted:
+        manifest['documents'].pop(docID)
+        current.pop(docID)
+    save_manifest(manifest, 'segments')
+
+    expected, expected_positions = count_documents(current) # what --rebuild counts
+    build_index(expected, 'rebuilt.vsm', positions=expected_positions)
+
+    def merged_counts():
+        manifest = load_manifest('segments')
+        segments = {segment['name']: read_segment(segment['name'], 'segments', positions=True) for segment in manifest['segments']}
+        live = {docID: state['segment'] for docID, state in manifest['documents'].items()}
+        return merge_counts({name: counts for name, (counts, _) in segments.items()}, live, {name: positions for name, (_, positions) in segments.items()})
+
+    counts, positions = merged_counts() # how update_index counts the documents before the segments are merged
+    assert_same_counts(counts, positions, expected, expected_positions)
+    build_index(counts, 'merged.vsm', positions=positions)
+    assert (workdir / 'merged.vsm').read_bytes() == (workdir / 'rebuilt.vsm').read_bytes()
+
+    merge_segments('segments', merge_factor=4)
+    assert len(load_manifest('segments')['segments']) == 1
+    counts, positions = merged_counts() # and after they are merged
+    assert_same_counts(counts, positions, expected, expected_positions)
+
+
+def append_locked(path):
+    """
+    This function appends a line to a file while holding the manifest lock, in a separate process.
+    """
+
+    with manifest_lock('segments'):
+        with open(path, 'a') as f:
+            f.write('locked\n')
+
+
+def test_manifest_lock_between_processes(workdir):
+    """
+    The manifest lock must keep another process waiting until it is released, not only the other threads of the process.
+    """
+
+    with manifest_lock('segments'):
+        process = multiprocessing.get_context('spawn').Process(target=append_locked, args=(os.path.abspath('log.txt'),))
+        process.start()
+        time.sleep(1.0)
+        assert not os.path.exists('log.txt') # still waiting for the lock
+    process.join(30)
+    assert process.exitcode == 0
+    with open('log.txt') as f:
+        assert f.read() == 'locked\n'
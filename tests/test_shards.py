@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import pytest
+
+from conftest import count_documents, requires_tokenizer
+from benchmark import generate_queries, make_word
+from search import Searcher
+from shards import ShardedSearcher, load_shards, merge_results
+from weights_calculation import build_index, save_weights
+
+
+@pytest.mark.parametrize('weight_bits', [0, 8])
+@pytest.mark.parametrize('cosine', [True, False])
+def test_sharded_search_matches_unsharded(documents, workdir, weight_bits, cosine):
+    """
+    Merging the results of every shard must give exactly the results of the unsharded index, the way ShardedSearcher gathers them.
+
+    The shards are searched with Searcher.search_terms, which is what the shard workers of ShardedSearcher run, so the queries do not need the tokenizer.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', shards=3, weight_bits=weight_bits)
+    assert load_shards('shards') == {'shards': 3, 'documents': len(documents)}
+
+    whole = Searcher('index.vsm', cache_bytes=0, cosine=cosine)
+    shards = [Searcher(os.path.join('shards', 'shard-{}.vsm'.format(shard)), cache_bytes=0, cosine=cosine) for shard in range(3)]
+    terms = list(whole.index.terms)
+
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        query = [terms[i] for i in rng.choice(len(terms), int(rng.integers(1, 6)))]
+        for k in (None, 1, 10, 1000):
+            for threshold in (None, 0.0, 0.05):
+                expected = whole.search_terms(query, k, threshold)
+                assert merge_results([shard.search_terms(query, k, threshold) for shard in shards], k) == expected
+
+
+def test_sharded_search_term_missing_from_a_shard(documents, workdir):
+    """
+    A term missing from a shard has an empty postings list and an upper bound of zero there, and the shard returns no document for it.
+    """
+
+    documents = dict(documents)
+    docID = sorted(documents)[0]
+    documents[docID] = documents[docID] + ['zebra'] # only in the first shard
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', shards=3)
+
+    whole = Searcher('index.vsm', cache_bytes=0)
+    shards = [Searcher(os.path.join('shards', 'shard-{}.vsm'.format(shard)), cache_bytes=0) for shard in range(3)]
+    for terms in (['zebra'], ['zebra', 'zebra']):
+        for k in (None, 1, 5):
+            results = [shard.search_terms(terms, k) for shard in shards]
+            assert results[1] == results[2] == []
+            assert merge_results(results, k) == whole.search_terms(terms, k)
+            assert [result[0] for result in merge_results(results, k)] == [docID]
+
+
+@requires_tokenizer
+@pytest.mark.parametrize('weight_bits', [0, 8])
+def test_sharded_searcher_processes(corpus, weight_bits):
+    """
+    ShardedSearcher, with a worker process per shard, must return the results of a Searcher of the unsharded index, including for a term missing from some shards.
+    """
+
+    (corpus / 'ResearchPapers' / '61.txt').write_text('zebra quagga\n') # the only document with these words, in a single shard
+    save_weights(shards=3, weight_bits=weight_bits, positions=False, ann=0)
+    whole = Searcher('index.vsm', cache_bytes=0)
+    queries = generate_queries(30, 300) + ['zebra', 'zebra quagga', 'zebra ' + make_word(0), 'unknownword']
+    with ShardedSearcher('shards', processes=True) as sharded:
+        for query in queries:
+            assert sharded.search(query) == whole.search(query)
+            for k in (1, 10):
+                assert sharded.search(query, k) == whole.search_topk(query, k)
+        assert [docID for docID, _ in sharded.search('zebra', 5)] == [61]
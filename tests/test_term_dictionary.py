@@ -0,0 +1,66 @@
+import re
+import numpy as np
+import pytest
+
+from term_dictionary import TermDictionary
+
+
+def make_vocabulary(seed=0, size=500):
+    """
+    This function generates a sorted vocabulary with long shared prefixes, so the terms starting with a prefix span several blocks.
+    """
+
+    rng = np.random.default_rng(seed)
+    letters = list('abcdeé')
+    terms = {''.join(rng.choice(letters, int(rng.integers(1, 9)))) for _ in range(size)}
+    terms |= {'retriev' + suffix for suffix in ('al', 'als', 'e', 'ed', 'er', 'ing', 'es')} | {'zzz'}
+    return sorted(terms)
+
+
+@pytest.mark.parametrize('block_size', [1, 4, 16])
+def test_lookup(block_size):
+    """
+    Every term must be found at its position in sorted order, by lookup, index and term in terms, and no other string must be found.
+    """
+
+    terms = make_vocabulary()
+    dictionary = TermDictionary.from_terms(terms, block_size)
+    assert len(dictionary) == len(terms) and list(dictionary) == terms
+    assert [dictionary[t] for t in range(len(terms))] == terms
+    for t, term in enumerate(terms):
+        assert dictionary.lookup(term) == t and dictionary.index(term) == t and term in dictionary
+    for missing in ('', '0', 'aaaaaaaaaa', 'retrieva', 'retrievx', 'zzzz', 'éééééééééé'):
+        assert dictionary.lookup(missing) is None and missing not in dictionary
+    with pytest.raises(ValueError):
+        dictionary.index('retrieva')
+    with pytest.raises(IndexError):
+        dictionary[len(terms)]
+
+
+@pytest.mark.parametrize('block_size', [1, 4, 16])
+def test_prefix_range_and_expand(block_size):
+    """
+    prefix_range must find exactly the terms starting with a prefix, and expand the terms matching a wildcard pattern, across block boundaries.
+    """
+
+    terms = make_vocabulary()
+    dictionary = TermDictionary.from_terms(terms, block_size)
+    prefixes = ['', 'a', 'ab', 'abc', 'é', 'ce', 'retriev', 'retrieve', 'retrievx', 'zzz', 'zzzz', '0'] + terms[::37]
+    for prefix in prefixes:
+        start, end = dictionary.prefix_range(prefix)
+        assert list(range(start, end)) == [t for t, term in enumerate(terms) if term.startswith(prefix)]
+
+    patterns = ['retriev*', 'a*', '*', 'a*b', 'retriev*e*', '*ing', 'c*é*', 'retrieve', 'retrievx', 'ab**c']
+    for pattern in patterns:
+        regex = re.compile('.*'.join(re.escape(part) for part in pattern.split('*')), re.DOTALL)
+        assert dictionary.expand(pattern).tolist() == [t for t, term in enumerate(terms) if regex.fullmatch(term)]
+
+
+def test_from_terms_rejects_unsorted_terms():
+    with pytest.raises(ValueError):
+        TermDictionary.from_terms(['space', 'model'])
+    with pytest.raises(ValueError):
+        TermDictionary.from_terms(['model', 'model'])
+    with pytest.raises(ValueError):
+        TermDictionary.from_terms(['a' * 256])
+    assert len(TermDictionary.from_terms([])) == 0 and TermDictionary.from_terms([]).lookup('model') is None
@@ -0,0 +1,61 @@
+from nltk.stem import PorterStemmer
+
+from conftest import requires_tokenizer
+from text_analysis import Analyzer, StemCache, get_stopwords, save_stem_table, load_stem_table
+
+
+@requires_tokenizer
+def test_analyzer_terms():
+    """
+    Tokens must be stripped of symbols and numbers, case folded, split at '.' or else '-', filtered and stemmed with the Porter stemmer.
+    """
+
+    analyzer = Analyzer(['the', 'of'])
+    tokens = analyzer.tokens('The Retrieval of 3 U.S. documents: vector-space models, e.g. BM25 and x 2023')
+    assert tokens == ['retrieval', 'documents', 'vector', 'space', 'models', 'bm', 'and'] # 'u', 's', 'e', 'g' and 'x' are too short
+    stemmer = PorterStemmer()
+    assert analyzer.terms('The Retrieval of 3 U.S. documents: vector-space models, e.g. BM25 and x 2023') == [stemmer.stem(token) for token in tokens]
+
+
+@requires_tokenizer
+def test_stem_table_round_trip(workdir):
+    """
+    The stem table saved with the index must load back as the same table, and an analyzer using it must give the terms of an analyzer stemming every token.
+    """
+
+    text = 'Indexing indexed documents, retrieving the retrieved résumés and naïve rankings'
+    stemming = Analyzer([])
+    stem_table = {token: stemming.stem(token) for token in stemming.tokens(text)}
+    save_stem_table(stem_table, 'index.stems')
+    assert load_stem_table('index.stems') == stem_table
+    assert load_stem_table('missing.stems') == {}
+
+    analyzer = Analyzer([], stem_table=load_stem_table('index.stems'))
+    assert analyzer.terms(text) == stemming.terms(text)
+    assert analyzer.stats()['table_hits'] == len(stemming.tokens(text))
+    assert analyzer.stats()['misses'] == 0 # every stem came from the table
+
+
+def test_stem_cache_evicts_least_recently_used():
+    """
+    A full cache must drop the least recently used stem, a lookup making a stem the most recently used one.
+    """
+
+    cache = StemCache(maxsize=2)
+    cache.put('indexing', 'index')
+    cache.put('retrieval', 'retriev')
+    assert cache.get('indexing') == 'index'
+    cache.put('documents', 'document') # evicts 'retrieval', the least recently used
+    assert cache.get('retrieval') is None
+    assert cache.get('indexing') == 'index' and cache.get('documents') == 'document'
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2, 'maxsize': 2}
+
+
+def test_get_stopwords(workdir):
+    """
+    The stopwords are the non-empty lines of 'Stopword-List.txt', without their trailing spaces.
+    """
+
+    with open('Stopword-List.txt', 'w') as f:
+        f.write('a\nis \n\nthe\n')
+    assert get_stopwords() == ['a', 'is', 'the']
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from conftest import count_documents
+from search import Searcher, extract_weights, calculate_QueryVector, score_documents, rank_documents, topk_maxscore
+from weights_calculation import build_index
+
+
+@pytest.mark.parametrize('weight_bits', [0, 8])
+@pytest.mark.parametrize('cosine', [True, False])
+def test_topk_maxscore_matches_full_scoring(documents, workdir, weight_bits, cosine):
+    """
+    MaxScore top-k must return exactly the first k results of scoring and ranking every document, with the same scores and the same order of ties,
+    leaving out the documents that contain none of the query terms (which only full scoring returns, with a threshold of zero).
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', weight_bits=weight_bits)
+    index = extract_weights('index.vsm')
+    index = index.normalize() if cosine else index.denormalize()
+    terms = list(index.terms)
+
+    rng = np.random.default_rng(1)
+    for _ in range(100):
+        query = [terms[i] for i in rng.choice(len(terms), int(rng.integers(1, 6)))] # repeated terms included
+        term_ids, query_vector = calculate_QueryVector(query, index)
+        scores = score_documents(term_ids, query_vector, index)
+        containing = {docID for docID, document in documents.items() if set(query) & set(document)}
+        for threshold in (0.0, 0.002, 0.05):
+            for k in (1, 5, 10, 1000):
+                results, counters = topk_maxscore(term_ids, query_vector, index, k, threshold)
+                assert results == [result for result in rank_documents(scores, index, threshold) if result[0] in containing][:k]
+                assert counters['postings_scored'] + counters['postings_skipped'] <= counters['postings']
+
+
+def test_topk_maxscore_without_results(documents, workdir):
+    """
+    A k of zero or a query without any term of the vocabulary returns no documents.
+    """
+
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm')
+    index = extract_weights('index.vsm')
+
+    term_ids, query_vector = calculate_QueryVector(['w00', 'w01'], index)
+    assert topk_maxscore(term_ids, query_vector, index, 0)[0] == []
+    term_ids, query_vector = calculate_QueryVector(['unknown'], index)
+    assert topk_maxscore(term_ids, query_vector, index, 10)[0] == []
+
+
+@pytest.mark.parametrize('weight_bits', [0, 8])
+def test_topk_maxscore_below_threshold(documents, workdir, weight_bits):
+    """
+    When even a document containing every query term cannot reach the threshold, every term is non-essential and no document is returned,
+    e.g. for a term of every document, whose IDF is zero, or a threshold above the sum of the upper bounds of the terms.
+    """
+
+    documents = {docID: terms + ['common'] for docID, terms in documents.items()}
+    counts, _ = count_documents(documents)
+    build_index(counts, 'index.vsm', weight_bits=weight_bits)
+    searcher = Searcher('index.vsm', cache_bytes=0)
+    assert searcher.index.idf[searcher.index.terms.index('common')] == 0
+
+    for terms, threshold in ((['common'], None), (['common', 'common'], 0.05), (['w00', 'w10', 'w20'], 10.0)):
+        assert searcher.search_terms(terms, 10, threshold) == searcher.search_terms(terms, None, threshold) == []
+    term_ids, query_vector = calculate_QueryVector(['w00', 'w10'], searcher.index)
+    results, counters = topk_maxscore(term_ids, query_vector, searcher.index, 10, 10.0)
+    assert results == [] and counters['postings_skipped'] == counters['postings'] > 0 and counters['docs_scored'] == 0
@@ -0,0 +1,67 @@
+import os
+import json
+import numpy as np
+import pytest
+
+from conftest import requires_tokenizer
+from weights_calculation import collect_counts, calculate_TF, calculate_IDF, calculate_TFIDF, reference_weights, compare_reference, save_weights, check_weights
+
+
+@pytest.fixture
+def baseline():
+    """
+    The weights calculated by the first version of weights_calculation.py (dense pandas DataFrames) for a small corpus of analyzed documents, see baseline_weights.json.
+    """
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_weights.json'), 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    documents = {int(docID): terms for docID, terms in baseline['documents'].items()}
+    counts = collect_counts(((docID, {term: documents[docID].count(term) for term in documents[docID]}) for docID in sorted(documents)), sorted(documents))
+    return counts, baseline
+
+
+def test_weights_match_baseline(baseline):
+    """
+    The vectorized TF, IDF and TF-IDF calculation must give the weights of the first version, up to floating point rounding.
+    """
+
+    counts, baseline = baseline
+    tf_idf = calculate_TFIDF(calculate_TF(counts), calculate_IDF(calculate_TF(counts)))
+    assert list(tf_idf.terms) == sorted(baseline['tf_idf'])
+    assert np.allclose(tf_idf.idf, [baseline['idf'][term] for term in tf_idf.terms], rtol=1e-12, atol=0)
+    for t, term in enumerate(tf_idf.terms):
+        doc_index, weights = tf_idf.term_postings(t)
+        assert dict(zip(tf_idf.docIDs[doc_index].tolist(), weights.tolist())) == pytest.approx({int(docID): weight for docID, weight in baseline['tf_idf'][term].items()}, rel=1e-12)
+
+
+def test_reference_weights_match_baseline(baseline):
+    """
+    reference_weights, the reference of --check, must give the weights of the first version, and the vectorized weights must match it.
+    """
+
+    pytest.importorskip('pandas')
+    counts, baseline = baseline
+    reference_tf_idf, reference_idf = reference_weights(counts)
+    assert reference_idf.to_dict() == pytest.approx(baseline['idf'], rel=1e-12)
+    for term, row in reference_tf_idf.iterrows():
+        assert {docID: weight for docID, weight in row.items() if weight != 0} == pytest.approx({int(docID): weight for docID, weight in baseline['tf_idf'][term].items()}, rel=1e-12)
+
+    tf = calculate_TF(counts)
+    tf_idf = calculate_TFIDF(tf, calculate_IDF(tf))
+    assert compare_reference(tf_idf, (reference_tf_idf, reference_idf))
+    tf_idf.weights[0] *= 1 + 1e-9 # a weight off by more than the rounding is reported
+    assert not compare_reference(tf_idf, (reference_tf_idf, reference_idf))
+
+
+@requires_tokenizer
+def test_check_weights(corpus):
+    """
+    --check must pass right after the weights are saved, and fail once a document changed.
+    """
+
+    pytest.importorskip('pandas')
+    save_weights(shards=0, weight_bits=0, positions=False, ann=0)
+    assert check_weights()
+    with open(os.path.join('ResearchPapers', '1.txt'), 'a') as f:
+        f.write('zebra\n')
+    assert not check_weights() # the saved index is out of date, the reference weights still match
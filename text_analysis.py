@@ -0,0 +1,212 @@
+import os
+import threading
+from collections import OrderedDict
+from nltk.stem import PorterStemmer
+from nltk.tokenize import word_tokenize
+
+
+PUNCTUATION = '0123456789!@#$%^&*()-_=+[{]}\\|;:\'",<.>/?`~' # the symbols and numbers removed from the start and end of the tokens
+
+
+def get_stopwords():
+    """
+    This function is used to extract stopwords from 'Stopword-List.txt' file.
+
+    It reads each line from the file, and if the line is not empty, it appends the line to the stopwords list.
+    The function continues this process until it reaches the end of the file. Assumes the file is in your current working directory.
+
+    Returns:
+        stopwords (list): A list of stopwords extracted from the file.
+    """
+
+    stopwords = []
+    with open('Stopword-List.txt', 'r') as f: # the 'Stopword-List.txt' file is opened in read mode
+        while True:
+            text = f.readline() # each line from the file is read one by one
+            if not text: # if the line read is empty (which means end of file), the loop is broken
+                break
+            stopwords.append(text) # else append the read line to the stopwords list
+
+    stopwords = [c.rstrip(' \n') for c in stopwords if c != '\n'] # a new list is created from stopwords, excluding any newline characters. Newline characters are also removed from the strings.
+    return stopwords
+
+
+class StemCache:
+    """
+    A bounded, least recently used cache of stems.
+
+    Attributes:
+        maxsize (int): The largest number of stems kept in the cache.
+        hits (int): The number of lookups answered from the cache.
+        misses (int): The number of lookups that had to stem the token.
+        evictions (int): The number of stems dropped to make room for new ones.
+    """
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stems = OrderedDict() # the least recently used stem is first
+        self._lock = threading.Lock() # the query side may stem from several threads
+
+    def get(self, token):
+        """
+        This function returns the cached stem of a token, None if it is not cached.
+        """
+
+        with self._lock:
+            stem = self._stems.get(token)
+            if stem is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._stems.move_to_end(token) # the stem is now the most recently used one
+            return stem
+
+    def put(self, token, stem):
+        """
+        This function caches the stem of a token, evicting the least recently used stem if the cache is full.
+        """
+
+        with self._lock:
+            self._stems[token] = stem
+            if len(self._stems) > self.maxsize:
+                self._stems.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        This function returns the hit, miss and eviction counts and the current size of the cache.
+        """
+
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._stems), 'maxsize': self.maxsize}
+
+
+class Analyzer:
+    """
+    The text analysis pipeline shared by the indexer and the query side, so that documents and queries are turned into terms the same way.
+
+    A text is tokenized with word_tokenize, symbols and numbers are removed from the start and end of every token, and the token is case folded.
+    Tokens containing '.' (or else '-') are split at that point and the parts are analyzed the same way. Tokens that are not alphabetic,
+    shorter than 2 or longer than 45 characters, or stopwords, are dropped. The remaining tokens are stemmed with the Porter stemmer.
+
+    The stems are looked up first in the stem table (a fixed token to stem dictionary, e.g. the one persisted with the index), then in a bounded LRU cache.
+
+    Attributes:
+        stopwords (set): The stopwords.
+        cache (StemCache): The LRU cache of the stems.
+        stem_table (dict): The fixed token to stem table, may be empty.
+        table_hits (int): The number of stems found in the stem table.
+    """
+
+    def __init__(self, stopwords, cache_size=65536, stem_table=None):
+        self.stopwords = set(stopwords) # a set, so that every lookup takes constant time
+        self.stemmer = PorterStemmer()
+        self.cache = StemCache(cache_size)
+        self.stem_table = stem_table if stem_table is not None else {}
+        self.table_hits = 0
+
+    def tokens(self, text):
+        """
+        This function tokenizes a text and normalizes the tokens, see the class documentation.
+
+        Args:
+            text (str): The text to tokenize, e.g. a line of a document or a query.
+
+        Returns:
+            tokens (list): The normalized tokens, before stemming.
+        """
+
+        tokens = []
+        pending = word_tokenize(text)
+        pending.reverse() # used as a stack, so the parts of a split token are analyzed in place of the token
+        while pending:
+            token = pending.pop()
+            if len(token) > 45: # filter out tokens with length greater than 45
+                continue
+            token = token.strip(PUNCTUATION).casefold() # remove symbols and numbers from the start and end of the token and also apply case folding
+            if '.' in token or '-' in token: # if '.' (or else '-') exists in a word, split the word at that point and analyze the splitted words
+                pending.extend(reversed(token.split('.' if '.' in token else '-')))
+            elif token.isalpha() and len(token) >= 2 and token not in self.stopwords: # filter out any strings that contain symbols, numbers, etc.
+                tokens.append(token)
+        return tokens
+
+    def stem(self, token):
+        """
+        This function returns the stem of a normalized token, from the stem table or the cache when possible.
+
+        Args:
+            token (str): A token returned by tokens.
+
+        Returns:
+            term (str): The stemmed term.
+        """
+
+        term = self.stem_table.get(token)
+        if term is not None:
+            self.table_hits += 1
+            return term
+        term = self.cache.get(token)
+        if term is None: # stem the token and remember its stem
+            term = self.stemmer.stem(token)
+            self.cache.put(token, term)
+        return term
+
+    def terms(self, text):
+        """
+        This function turns a text into its stemmed terms.
+
+        Args:
+            text (str): The text to analyze.
+
+        Returns:
+            terms (list): The stemmed terms, in the order they occur in the text.
+        """
+
+        return [self.stem(token) for token in self.tokens(text)]
+
+    def stats(self):
+        """
+        This function returns the statistics of the stem lookups.
+        """
+
+        stats = self.cache.stats()
+        stats['table_hits'] = self.table_hits
+        return stats
+
+
+def save_stem_table(stem_table, path='index.stems'):
+    """
+    This function saves a stem table next to the index, one tab separated token and stem per line.
+
+    Args:
+        stem_table (dict): The token to stem table.
+        path (str): The path of the stem table file.
+    """
+
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        for token in sorted(stem_table):
+            f.write(token + '\t' + stem_table[token] + '\n')
+    os.replace(path + '.tmp', path) # atomically replace any previous stem table
+
+
+def load_stem_table(path='index.stems'):
+    """
+    This function loads a stem table saved by save_stem_table.
+
+    Args:
+        path (str): The path of the stem table file.
+
+    Returns:
+        stem_table (dict): The token to stem table, empty if there is no stem table file.
+    """
+
+    if not os.path.isfile(path):
+        return {}
+    stem_table = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            token, _, term = line.rstrip('\n').partition('\t')
+            stem_table[token] = term
+    return stem_table
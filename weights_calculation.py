@@ -1,31 +1,18 @@
 import os
+import sys
+import hashlib
+import threading
+import multiprocessing
 import math as m
-import pandas as pd
-from nltk.stem import PorterStemmer
-from nltk.tokenize import word_tokenize
-
-
-def get_stopwords():
-    """
-    This function is used to extract stopwords from 'Stopword-List.txt' file.
-
-    It reads each line from the file, and if the line is not empty, it appends the line to the stopwords list.
-    The function continues this process until it reaches the end of the file. Assumes the file is in your current working directory.
-
-    Returns:
-        stopwords (list): A list of stopwords extracted from the file.
-    """
-
-    stopwords = []
-    with open('Stopword-List.txt', 'r') as f: # the 'Stopword-List.txt' file is opened in read mode
-        while True:
-            text = f.readline() # each line from the file is read one by one
-            if not text: # if the line read is empty (which means end of file), the loop is broken
-                break
-            stopwords.append(text) # else append the read line to the stopwords list
-
-    stopwords = [c.rstrip(' \n') for c in stopwords if c != '\n'] # a new list is created from stopwords, excluding any newline characters. Newline characters are also removed from the strings.
-    return stopwords
+import time
+import numpy as np
+from sparse_index import SparseIndex, CompressedIndex, PositionalPostings, write_index, open_index, is_index, read_header
+from search import score_documents
+from instrumentation import trace, span, count, profile, enable_tracing, set_profile_mode
+from text_analysis import Analyzer, get_stopwords, save_stem_table, load_stem_table
+from shards import write_shards, delete_shards, load_shards
+from ann_index import ANNIndex, ann_path, read_settings, delete_ann
+from segments import manifest_lock, load_manifest, save_manifest, write_segment, read_segment, delete_segment, merge_counts, merge_segments
 
 
 def get_docIDs():
@@ -41,47 +28,76 @@ def get_docIDs():
     """
 
     curr_dir = os.getcwd() # get the current directory
-    docID = [int(c.rstrip('.txt')) for c in os.listdir(curr_dir + '\ResearchPapers')] # extract the docIDs from the names of the files in the ResearchPapers directory
+    docID = [int(c.rstrip('.txt')) for c in os.listdir(os.path.join(curr_dir, 'ResearchPapers'))] # extract the docIDs from the names of the files in the ResearchPapers directory
     docID.sort()
     return docID
 
 
-def calculate_TF(total_tokens):
+def collect_counts(doc_counts, docIDs):
     """
-    This function calculates the Term Frequency weights for the terms and saves it in a DataFrame.
+    This function collects the term counts of the documents into postings.
 
     Args:
-        total_tokens (list): A list of processed tokens.
+        doc_counts (iterable): (docID, counts) tuples in docID order, where counts maps each term of the document to the number of times it occurs, as yielded by preprocessing.
+        docIDs (list): The sorted docIDs of all the documents, including the ones without any terms.
 
     Returns:
-        tf (DataFrame): A pandas DataFrame representing the Term Frequency weights.
+        counts (SparseIndex): The postings of every term holding the number of times it occurs in each document.
     """
 
-    tf = {} # declare an empty dictionary for the term frequency weights
-    porter_stemmer = PorterStemmer() # initialize the stemmer
-    doc = get_docIDs() # get the docIDs
+    tf = {} # declare an empty dictionary for the term counts
 
-    for i, tokens in enumerate(total_tokens): # loop through each token in total_tokens, and then loop through each word in the token
-        for word in tokens:
-            word = porter_stemmer.stem(word) # stem the word
-            if word[-1] == "'": # if the word ends with an apostrophe, remove it
-                word = word.rstrip("'")
+    for docID, counts in doc_counts: # the documents arrive one at a time, in docID order, so every postings list is built in docID order
+        for word, term_count in counts.items():
             if word in tf: # if the word is already in the index, add the docID to the index
-                if doc[i] in tf[word]:
-                    freq = tf[word][doc[i]]
-                    tf[word][doc[i]] = freq + 1
-                else:
-                    tf[word][doc[i]] = 1
+                tf[word][docID] = term_count
             else: # add the word in the index along with the docID and the frequency
-                tf[word] = {doc[i]: 1}
+                tf[word] = {docID: term_count}
+
+    return SparseIndex.from_dict(tf, docIDs) # pack the raw counts into postings, only the non-zero counts are stored
+
+
+def collect_positions(positions, counts):
+    """
+    This function collects the positions of the terms in the documents in the postings order of the term counts.
+
+    Args:
+        positions (dict): {docID: {term: positions}} for every document of the counts, as collected by preprocessing.
+        counts (SparseIndex): The term counts of the same documents, as returned by collect_counts.
+
+    Returns:
+        positions (ndarray): The positions of the term of every posting in its document, back to back in postings order.
+    """
+
+    doc_positions = {docID: i for i, docID in enumerate(counts.docIDs.tolist())} # map each docID to its position in the docIDs array
+    vocabulary = {term: i for i, term in enumerate(counts.terms)} # a dictionary, as every posting looks its term up
+    term_ids, doc_index, parts = [], [], []
+    for docID, document in positions.items():
+        for term, term_positions in document.items():
+            term_ids.append(vocabulary[term])
+            doc_index.append(doc_positions[docID])
+            parts.append(term_positions)
+
+    lengths = np.array([len(part) for part in parts], dtype=np.int64)
+    flat = np.fromiter((position for part in parts for position in part), dtype=np.int32, count=int(lengths.sum()))
+    order = np.lexsort((doc_index, term_ids)) # the postings are sorted by term, and by document within each term
+    lengths, starts = lengths[order], (np.cumsum(lengths) - lengths)[order]
+    return flat[np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(int(lengths.sum()))]
 
-    for word in tf.keys(): # calculate the log term frequency weights
-        for doc in tf[word].keys():
-            tf[word][doc] = 1 + m.log(tf[word][doc], 10) # normalize the term frequency weights
 
-    tf = pd.DataFrame(tf) # convert the dictionary to a Pandas DataFrame
-    tf = tf.transpose() # since the DataFrame will be in the form of words as columns and docIDs as rows, we transpose it to have docIDs as columns and words as rows
-    tf.fillna(0, inplace=True) # fill the NaN values with 0
+def calculate_TF(counts):
+    """
+    This function calculates the Term Frequency weights for the terms and saves them as postings in a SparseIndex.
+
+    Args:
+        counts (SparseIndex): The postings holding the number of times each term occurs in each document, as returned by collect_counts.
+
+    Returns:
+        tf (SparseIndex): The postings of every term holding its Term Frequency weights.
+    """
+
+    weights = 1 + np.log(counts.weights) / m.log(10) # calculate the log term frequency weights of all the postings at once, the same as m.log(count, 10)
+    tf = SparseIndex(counts.terms, counts.docIDs, counts.offsets, counts.doc_index, weights) # the TF postings share the layout of the counts
 
     print("Term Frequency Weights created")
     return tf
@@ -89,75 +105,145 @@ def calculate_TF(total_tokens):
 
 def calculate_IDF(tf):
     """
-    This function calculates the Inverse Document Frequency weights for the terms and saves it in a DataFrame.
+    This function calculates the Inverse Document Frequency weights for the terms.
 
     Args:
-        total_tokens (list): A list of processed tokens.
+        tf (SparseIndex): The postings holding the Term Frequency weights.
 
     Returns:
-        idf (DataFrame): A pandas DataFrame representing the Inverse Document Frequency weights.
+        idf (ndarray): The Inverse Document Frequency weight of each term, in term ID order.
     """
 
-    df = {} # a dictionary to store the document frequency of each word
-    idf = {} # a dictionary to store the inverse document frequency of each word
-    doc = get_docIDs() # get the docIDs
+    N = len(tf.docIDs) # the total number of documents
+    df = tf.df # the document frequency of a term is the length of its postings list
+    idf = np.log(N / df) / m.log(10) # calculate the inverse document frequency of all the terms at once, the same as m.log(N/df, 10)
 
-    for keys in tf.index: # loop through each word in the index
-        frequency = list(tf.loc[keys].value_counts()) # get the frequency of each word in the document
-        df[keys] = len(doc) - frequency[0] # calculate the document frequency of each word
+    print("Inverse Document Frequency Weights calculated")
+    return idf
 
-    for keys in tf.index: # loop through each word in the document frequency index
-        idf[keys] = m.log(len(doc)/df[keys], 10) # calculate the inverse document frequency of each word
 
-    idf = pd.DataFrame(idf, index=[0]) # convert the dictionary to a Pandas DataFrame
+_analyzer = None # the text analysis pipeline of a preprocessing worker, set by _init_worker
+_collect_stems = False # whether the workers return the stems they calculate
+_collect_positions = False # whether the workers return the positions of the terms
 
-    print("Inverse Document Frequency Weights calculated")
-    return idf
+
+def _init_worker(stopwords, collect_stems=False, collect_positions=False):
+    """
+    This function initializes a preprocessing worker with its own text analysis pipeline.
+
+    Args:
+        stopwords (set): The stopwords.
+        collect_stems (bool): Return the stem of every token along with the term counts.
+        collect_positions (bool): Return the positions of every term along with the term counts.
+    """
+
+    global _analyzer, _collect_stems, _collect_positions
+    _analyzer = Analyzer(stopwords)
+    _collect_stems = collect_stems
+    _collect_positions = collect_positions
 
 
-def preprocessing():
+def tokenize_document(docID, analyzer):
     """
-    This function is used to preprocess the text files in the 'ResearchPapers' directory.
+    This function is used to preprocess the text of a single document in the 'ResearchPapers' directory.
 
-    It reads each file, tokenizes the text, removes punctuation and converts the text to lowercase. 
-    It also splits the tokens at '.' and '-'. Assumes the 'ResearchPapers' folder is in your current working directory.
+    It reads the file line by line and turns each line into normalized tokens with the analyzer.
+
+    Args:
+        docID (int): The docID of the document.
+        analyzer (Analyzer): The text analysis pipeline.
 
     Returns:
-        total_tokens (list): A list of preprocessed tokens from all the files.
+        tokens (list): The preprocessed tokens of the document, before stemming.
     """
 
-    total_tokens = [] # an empty list to store the tokens from all the files
-    doc = get_docIDs() # get the docIDs
-    stopwords = get_stopwords() # get the stopwords
-    stemmer = PorterStemmer() # create a stemmer object
-
-    for i in doc: # iterate through each doc
-        tokens = []
-        with open('ResearchPapers/' + str(i) + '.txt', 'r') as f: # open the file corresponding to the current document ID
-            while True:
-                text = f.readline() # read a line from the file
-                if not text: # if the line is empty (which means end of file), break the loop
-                    break
-                tokens += word_tokenize(text) # tokenize the line and add the tokens to the list
-
-        j = 0
-        while j < len(tokens): # loop through each token
-            if tokens[j] not in stopwords and len(tokens[j]) <= 45: # filter out the stopwords and tokens with length greater than 45
-                # remove symbols and numbers from the start and end of the token and also apply case folding
-                tokens[j] = tokens[j].strip('0123456789!@#$%^&*()-_=+[{]}\|;:\'",<.>/?`~').casefold()
-                if '.' in tokens[j]: # if '.' exists in a word, split the word at that point and add the splitted words at the end of the tokens list while removing the original word
-                    word = tokens[j].split('.')
-                    del tokens[j]
-                    tokens.extend(word)
-                elif '-' in tokens[j]: # do the same for words with '-'
-                    word = tokens[j].split('-')
-                    del tokens[j]
-                    tokens.extend(word)
-            j += 1 # move the index forward
-        tokens = [stemmer.stem(c) for c in tokens if c.isalpha() and c not in stopwords and len(c) >= 2] # filter out any strings that contain symbols, numbers, etc.
-        total_tokens.append(tokens) # add the processed tokens as a seperate list. Did this to keep track of which tokens appear in which docs (needed to construct indexes). List at index 0 indicate tokens found in doc 1 and so on.
-
-    return total_tokens
+    tokens = []
+    with open('ResearchPapers/' + str(docID) + '.txt', 'r') as f: # open the file corresponding to the document ID
+        for text in f: # read the file one line at a time
+            tokens += analyzer.tokens(text) # tokenize the line and add the tokens to the list
+    return tokens
+
+
+def count_terms(docID):
+    """
+    This function preprocesses a document and counts how many times each index term occurs in it. It is run by the preprocessing workers.
+
+    Args:
+        docID (int): The docID of the document.
+
+    The position of a term is the number of the token in the preprocessed document, so the tokens dropped by the analyzer (e.g. stopwords) do not
+    take a position, and the terms of a phrase are at consecutive positions even if a stopword separates them, as they are in the analyzed query.
+
+    Returns:
+        counts (dict): The number of occurrences of each term, in the order the terms first occur in the document.
+        stems (dict): The stem of every distinct token of the document, only returned if the worker collects stems or positions.
+        positions (dict): The increasing positions of every term in the document, only returned if the worker collects stems or positions.
+    """
+
+    counts = {}
+    stems = {}
+    positions = {}
+    for position, token in enumerate(tokenize_document(docID, _analyzer)):
+        term = _analyzer.stem(token) # every token is stemmed exactly once, the same way the query terms are
+        counts[term] = counts.get(term, 0) + 1
+        if _collect_stems:
+            stems[token] = term
+        if _collect_positions:
+            positions.setdefault(term, []).append(position)
+    return (counts, stems, positions) if _collect_stems or _collect_positions else counts
+
+
+def preprocessing(processes=None, docIDs=None, stem_table=None, positions=None):
+    """
+    This function is used to preprocess the text files in the 'ResearchPapers' directory, and count the terms of each document.
+
+    The documents are fanned out to a pool of worker processes, that each preprocess a document with tokenize_document and count its terms.
+    Every worker has its own text_analysis.Analyzer, with its own LRU stem cache.
+    The term counts are yielded in docID order as soon as they are ready, so the tokens of the whole corpus are never held in memory at once.
+    Assumes the 'ResearchPapers' folder is in your current working directory.
+
+    Args:
+        processes (int): The number of worker processes, None for one per CPU. With a single process the documents are preprocessed in this process.
+        docIDs (list): The sorted docIDs of the documents to preprocess, None for all the documents.
+        stem_table (dict): If given, the stem of every token of the documents is added to it, see text_analysis.save_stem_table.
+        positions (dict): If given, the positions of the terms of every document are added to it, as {docID: {term: positions}}, see collect_positions.
+
+    Yields:
+        docID (int): The docID of a document.
+        counts (dict): The number of occurrences of each term of the document.
+    """
+
+    doc = get_docIDs() if docIDs is None else docIDs # get the docIDs
+    stopwords = set(get_stopwords()) # a set, so that every lookup takes constant time
+
+    collect_stems = stem_table is not None
+    collect_positions = positions is not None
+
+    if processes == 1:
+        _init_worker(stopwords, collect_stems, collect_positions)
+        results = map(count_terms, doc)
+        for docID, result in zip(doc, results):
+            yield docID, _take_extras(docID, result, stem_table, positions)
+        return
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(stopwords, collect_stems, collect_positions)) as pool:
+        for docID, result in zip(doc, pool.imap(count_terms, doc, chunksize=4)): # imap returns the counts in docID order
+            yield docID, _take_extras(docID, result, stem_table, positions)
+
+
+def _take_extras(docID, result, stem_table, positions):
+    """
+    This function adds the stems and the positions returned by count_terms to the stem table and the positions, if they are being collected, and returns the term counts.
+    """
+
+    if stem_table is None and positions is None:
+        return result
+    counts, stems, doc_positions = result
+    if stem_table is not None:
+        stem_table.update(stems)
+    if positions is not None:
+        positions[docID] = doc_positions
+    return counts
 
 
 def calculate_TFIDF(TF, IDF):
@@ -165,53 +251,562 @@ def calculate_TFIDF(TF, IDF):
     This function calculates the TF-IDF weights for the terms.
 
     Args:
-        TF (DataFrame): The Term Frequency weights.
-        IDF (DataFrame): The Inverse Document Frequency weights.
+        TF (SparseIndex): The postings holding the Term Frequency weights.
+        IDF (ndarray): The Inverse Document Frequency weights.
 
     Returns:
-        vectors (DataFrame): A pandas DataFrame representing the TF-IDF weights.
+        vectors (SparseIndex): The postings holding the TF-IDF weights.
     '''
 
-    vectors = pd.DataFrame(index=TF.index, columns=TF.columns) # create a DataFrame with the same index and columns as the TF DataFrame
-    for term in TF.index: # loop through each term in the index
-        if pd.isna(term): # special case of 'nan' term
-            vectors.loc[term] = TF.loc[term] * IDF.loc[0, 'nan']
-        else: # calculate the TF-IDF weights
-            vectors.loc[term] = TF.loc[term] * IDF.loc[0, term]
-    vectors.transpose() # transpose the DataFrame
+    weights = TF.weights * np.repeat(IDF, TF.df) # repeat the IDF weight of each term once per posting, and multiply it with the TF weights of all the postings at once
+
+    vectors = SparseIndex(TF.terms, TF.docIDs, TF.offsets, TF.doc_index, weights, IDF) # the TF-IDF postings share the layout of the TF postings
 
     print("TF-IDF Weights calculated")
     return vectors
 
 
-def save_weights():
+def document_state(docID):
     """
-    This function calls the preprocessing function for the processed terms, calculates the TF and IDF weights for each term, using the calculate_TF and calculate_IDF function, and then saves the DataFrame to 'tf.csv' and 'idf.csv' respectively.
+    This function returns the state of a document file, used to find the documents that changed since they were indexed.
 
-    The preprocessing function is expected to return a list of tokens.
-    The calculate_TF function takes the tokens as input and returns a DataFrame where each row represent the TF weights for each term.
-    The calculate_IDF function also takes the tokens as input and returns a DataFrame where each value represent the IDF weight for each term.
+    Args:
+        docID (int): The docID of the document.
 
-    The output files 'tf-idf.csv' and 'idf.csv' contain the comma seperated values of the term frequency and inverse document frequency weights for each term.
+    Returns:
+        state (dict): The size, the modification time and the SHA-1 hash of the contents of the file.
     """
 
-    tokens = preprocessing() # preprocessing function is called, returns the processed tokens
-    tf = calculate_TF(tokens) # calculate_TF function is called, returns the TF weights
-    idf = calculate_IDF(tf) # create_positional_index function is called, returns the IDF weights
-    tf_idf = calculate_TFIDF(tf, idf) # calculate the TF-IDF weights
+    path = 'ResearchPapers/' + str(docID) + '.txt'
+    stat = os.stat(path)
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): # hash the file in blocks of 1 MB
+            sha1.update(block)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1.hexdigest()}
 
-    tf_idf.to_csv('tf-idf.csv') # output TF-IDF DataFrame to CSV including the index
+
+def build_index(counts, path='index.vsm', normalize=True, shards=0, weight_bits=0, positions=None, ann=0, refresh_ann=False):
+    """
+    This function calculates the TF, IDF and TF-IDF weights from the term counts of all the documents, and saves them to the index file.
+
+    The L2 norm of every document vector is saved with the index. By default the document vectors are also divided by their norms
+    before they are saved, so that the dot product of a normalized query vector with a document vector is their cosine similarity,
+    without any work per document at query time.
+
+    With shards, the index is also split into that many shards of the 'shards' directory, see shards.write_shards. The IDF weights
+    are calculated over all the documents before the index is split, so a sharded search gives exactly the same scores.
+    With weight_bits, the postings of the index (and of the shards) are compressed, see sparse_index.CompressedIndex.
+    With positions, the positions of the terms are saved in the index as well, for phrase and proximity queries (see phrase_search.py). The shards do not get them.
+    With ann, an approximate nearest neighbour index of the document vectors reduced to that many dimensions is saved next to the index, see ann_index.ANNIndex.
+    With refresh_ann, an ANN index of the same dimensions and vocabulary saved by a previous build is refreshed instead (see ANNIndex.refresh),
+    which is much cheaper than building it again.
+
+    Args:
+        counts (SparseIndex): The postings holding the term counts of all the documents.
+        path (str): The path of the index file.
+        normalize (bool): Save the normalized document vectors instead of the raw TF-IDF weights.
+        shards (int): The number of shards to split the index into, 0 for no shards (any previous shards are deleted).
+        weight_bits (int): 8 or 16 to compress the postings and quantize the weights to that many bits, 0 to save the postings uncompressed.
+        positions (ndarray): The positions of the terms of every posting of the counts, see collect_positions, None to save an index without positions.
+        ann (int): The number of dimensions of the ANN index, 0 for no ANN index (any previous one is deleted).
+        refresh_ann (bool): Refresh the previous ANN index if it can be, instead of building a new one.
+    """
+
+    with span('tf'):
+        tf = calculate_TF(counts) # calculate_TF function is called, returns the TF weights
+    with span('idf'):
+        idf = calculate_IDF(tf) # calculate_IDF function is called, returns the IDF weights
+    with span('tf_idf'):
+        tf_idf = calculate_TFIDF(tf, idf) # calculate the TF-IDF weights
+    if normalize:
+        with span('normalize'):
+            tf_idf = tf_idf.normalize() # divide every document vector by its L2 norm
+    if positions is not None:
+        with span('positions'):
+            tf_idf.positions = PositionalPostings.encode(positions, counts) # the TF-IDF postings are in the postings order of the counts
+        count('positions', len(positions))
+    count('terms', len(tf_idf.terms))
+    count('postings', int(len(tf_idf.weights)))
+
+    with span('serialization'):
+        write_index(tf_idf.compress(weight_bits) if weight_bits else tf_idf, path) # output the TF-IDF postings and the IDF weights to the index file
     print("TF-IDF Weights saved")
+    with span('shards'):
+        if shards:
+            write_shards(tf_idf, shards, 'shards', weight_bits)
+            print("{} shards saved".format(shards))
+        else:
+            delete_shards('shards') # shards of a previous build would be out of date
+    with span('ann'):
+        previous = ANNIndex.load(ann_path(path)) if ann and refresh_ann and os.path.isfile(ann_path(path)) else None
+        if previous is not None and previous.settings['dimensions'] == ann and previous.can_refresh(tf_idf):
+            previous.refresh(tf_idf).save(ann_path(path))
+            print("ANN index refreshed")
+        elif ann:
+            ANNIndex.build(tf_idf, ann).save(ann_path(path)) # built from the exact weights, even if the postings are compressed
+            print("ANN index saved")
+        else:
+            delete_ann(ann_path(path)) # an ANN index of a previous build would be out of date
+
+
+def write_stem_tables(stem_table, shards=0):
+    """
+    This function saves the stem table to 'index.stems', and to the shards directory if the index is sharded.
+    """
+
+    save_stem_table(stem_table, 'index.stems')
+    if shards:
+        save_stem_table(stem_table, os.path.join('shards', 'index.stems'))
+
+
+def _previous_shards():
+    """
+    This function returns the number of shards of the previous build, 0 if it was not sharded.
+    """
+
+    description = load_shards('shards')
+    return description['shards'] if description is not None else 0
+
+
+def _previous_weight_bits():
+    """
+    This function returns the number of bits of the quantized weights of the previous build, 0 if its postings were not compressed.
+    """
+
+    if not is_index('index.vsm'):
+        return 0
+    codec = read_header('index.vsm')[0]['codec']
+    return codec['weight_bits'] if codec is not None else 0
+
+
+def _previous_positions():
+    """
+    This function returns True if the previous build saved the positions of the terms.
+    """
+
+    return is_index('index.vsm') and read_header('index.vsm')[0]['positions'] is not None
+
+
+def _previous_ann():
+    """
+    This function returns the number of dimensions of the ANN index of the previous build, 0 if it had none.
+    """
+
+    settings = read_settings(ann_path('index.vsm'))
+    return settings['dimensions'] if settings is not None else 0
+
+
+def save_weights(save_stems=True, shards=None, weight_bits=None, positions=None, ann=None):
+    """
+    This function calls the preprocessing function for the processed terms, calculates the TF and IDF weights for each term, using the calculate_TF and calculate_IDF function, and then saves the TF-IDF postings and the IDF weights to the 'index.vsm' index file.
+
+    The preprocessing function is expected to yield the term counts of each document.
+    The calculate_TF function takes the term counts as input and returns a SparseIndex where each postings list holds the TF weights of a term.
+    The calculate_IDF function takes the TF postings as input and returns an array where each value represent the IDF weight for each term.
+
+    The output file 'index.vsm' is a binary file holding the vocabulary, the TF-IDF postings, the IDF weights, the document norms and the docIDs, see sparse_index.write_index.
+    The term counts are also saved as the only segment of the 'segments' directory, so that later changes to the documents can be indexed incrementally by update_index.
+
+    Args:
+        save_stems (bool): Also save the stem of every token of the documents to 'index.stems', for the query side to look stems up in.
+        shards (int): The number of shards to also split the index into, 0 for no shards and None to keep the number of shards of the previous build.
+        weight_bits (int): 8 or 16 to compress the postings, 0 to save them uncompressed and None to keep the codec of the previous build.
+        positions (bool): Save the positions of the terms in the documents, for phrase and proximity queries, None to do what the previous build did.
+        ann (int): The number of dimensions of the ANN index, 0 for no ANN index and None to do what the previous build did.
+    """
+
+    if shards is None:
+        shards = _previous_shards()
+    if weight_bits is None:
+        weight_bits = _previous_weight_bits()
+    if positions is None:
+        positions = _previous_positions()
+    if ann is None:
+        ann = _previous_ann()
+    with manifest_lock('segments'):
+        previous = load_manifest('segments')
+        doc = get_docIDs() # get the docIDs
+        manifest = {'generation': 1, 'segments': [], 'documents': {docID: document_state(docID) for docID in doc}}
+        stem_table = {} if save_stems else None
+        doc_positions = {} if positions else None
+        with span('preprocessing'): # reading, tokenizing, stemming and counting, in the worker processes
+            counts = collect_counts(preprocessing(stem_table=stem_table, positions=doc_positions), doc) # preprocessing function is called, yields the term counts of each document
+            term_positions = collect_positions(doc_positions, counts) if positions else None
+        count('documents', len(doc))
+
+        with span('segments'):
+            write_segment(counts, 'segment-0', 'segments', term_positions)
+            manifest['segments'].append({'name': 'segment-0', 'postings': int(len(counts.weights))})
+            for state in manifest['documents'].values():
+                state['segment'] = 'segment-0'
+            save_manifest(manifest, 'segments')
+
+            if previous is not None: # the new segment replaces all the previous ones
+                for segment in previous['segments']:
+                    if segment['name'] != 'segment-0':
+                        delete_segment(segment['name'], 'segments')
+
+    build_index(counts, 'index.vsm', shards=shards, weight_bits=weight_bits, positions=term_positions, ann=ann)
+    if save_stems:
+        with span('stems'):
+            write_stem_tables(stem_table, shards)
+
+
+def update_index(background_merge=True, merge_factor=4, save_stems=True, shards=None, weight_bits=None, positions=None, ann=None):
+    """
+    This function indexes the documents that were added, changed or deleted since the index was last built, without reprocessing the other documents.
+
+    A document is considered changed if its size or modification time changed and the hash of its contents is different.
+    The new and changed documents are preprocessed into a new segment of the 'segments' directory, and the manifest is updated to point
+    to their new postings and to forget the deleted documents. The index file is then rebuilt from the term counts of all the segments,
+    so the document frequencies and IDF weights take every change into account. An ANN index is refreshed instead of built again when the
+    vocabulary is unchanged, see ANNIndex.refresh. Finally the segments are merged by merge_segments, in a background thread unless background_merge is False. Without a previous build, every document is indexed by save_weights.
+
+    Args:
+        background_merge (bool): Merge the segments in a background thread.
+        merge_factor (int): The number of segments of similar size that triggers a merge, see segments.plan_merge.
+        save_stems (bool): Add the stems of the tokens of the new and changed documents to 'index.stems'.
+        shards (int): The number of shards to split the index into, None to keep the number of shards of the previous build.
+        weight_bits (int): 8 or 16 to compress the postings, 0 to save them uncompressed and None to keep the codec of the previous build.
+        positions (bool): Save the positions of the terms, None to do what the previous build did. Turning positions on reindexes every document, as the segments of the previous build have none.
+        ann (int): The number of dimensions of the ANN index, 0 for no ANN index and None to do what the previous build did.
+
+    Returns:
+        merge (Thread): The thread merging the segments, None if the segments were merged in this thread or there was nothing to do.
+    """
+
+    if shards is None:
+        shards = _previous_shards()
+    if weight_bits is None:
+        weight_bits = _previous_weight_bits()
+    if positions is None:
+        positions = _previous_positions()
+    if ann is None:
+        ann = _previous_ann()
+    with manifest_lock('segments'):
+        manifest = load_manifest('segments')
+    if manifest is None or (positions and not _previous_positions()): # nothing was indexed yet, or the documents were indexed without their positions
+        save_weights(save_stems, shards, weight_bits, positions, ann)
+        return None
+
+    doc = get_docIDs() # get the docIDs
+    indexed = manifest['documents']
+    changed = {} # the states of the new and changed documents
+    touched = {} # the states of the documents whose file was touched without changing its contents
+    with span('scan'):
+        for docID in doc: # find the new and changed documents
+            stat = os.stat('ResearchPapers/' + str(docID) + '.txt')
+            if docID in indexed and indexed[docID]['size'] == stat.st_size and indexed[docID]['mtime_ns'] == stat.st_mtime_ns:
+                continue # the file was not touched, no need to hash it
+            state = document_state(docID)
+            if docID not in indexed or indexed[docID]['sha1'] != state['sha1']:
+                changed[docID] = state
+            else: # the file was touched but its contents are the same
+                touched[docID] = state
+    deleted = set(indexed) - set(doc)
+    count('documents', len(changed))
+
+    if not changed and not deleted and shards == _previous_shards() and weight_bits == _previous_weight_bits() and positions == _previous_positions() and ann == _previous_ann(): # a different number of shards, codec, positions or ANN setting still needs the index to be saved again
+        if touched:
+            with manifest_lock('segments'):
+                manifest = load_manifest('segments')
+                for docID, state in touched.items(): # remember the new modification times of the touched files
+                    manifest['documents'][docID].update(state)
+                save_manifest(manifest, 'segments')
+        print("Weights are already up to date")
+        return None
+
+    print("Indexing {} new or changed and {} deleted documents".format(len(changed), len(deleted)))
+    changed_doc = sorted(changed)
+    stem_table = load_stem_table('index.stems') if save_stems else None
+    doc_positions = {} if positions else None
+    with span('preprocessing'):
+        counts = collect_counts(preprocessing(docIDs=changed_doc, stem_table=stem_table, positions=doc_positions), changed_doc) # only the new and changed documents are preprocessed
+        term_positions = collect_positions(doc_positions, counts) if positions else None
+
+    with manifest_lock('segments'):
+        manifest = load_manifest('segments') # a background merge may have changed the manifest in the meantime
+        if changed: # deletions alone do not need a new segment
+            name = 'segment-{}'.format(manifest['generation'])
+            manifest['generation'] += 1
+            write_segment(counts, name, 'segments', term_positions)
+            manifest['segments'].append({'name': name, 'postings': int(len(counts.weights))})
+
+        for docID in deleted:
+            manifest['documents'].pop(docID, None)
+        for docID, state in changed.items():
+            manifest['documents'][docID] = dict(state, segment=name)
+        for docID, state in touched.items(): # remember the new modification times of the touched files
+            manifest['documents'][docID].update(state)
+
+        used = {state['segment'] for state in manifest['documents'].values()}
+        unused = [segment['name'] for segment in manifest['segments'] if segment['name'] not in used] # segments without any current postings
+        manifest['segments'] = [segment for segment in manifest['segments'] if segment['name'] in used]
+        save_manifest(manifest, 'segments')
+        for unused_name in unused:
+            delete_segment(unused_name, 'segments')
+
+        live = {docID: state['segment'] for docID, state in manifest['documents'].items()}
+        segments = {segment: read_segment(segment, 'segments', positions=True) for segment in used}
+
+    with span('merge_counts'):
+        if positions:
+            counts, term_positions = merge_counts({name: segment for name, (segment, _) in segments.items()}, live, {name: segment_positions for name, (_, segment_positions) in segments.items()})
+        else:
+            counts, term_positions = merge_counts({name: segment for name, (segment, _) in segments.items()}, live), None
+    build_index(counts, 'index.vsm', shards=shards, weight_bits=weight_bits, positions=term_positions, ann=ann, refresh_ann=True) # the weights depend on the document frequencies over all the documents, so the index file is rebuilt from all the segments
+    if save_stems:
+        with span('stems'):
+            write_stem_tables(stem_table, shards)
+
+    if not background_merge:
+        merge_segments('segments', merge_factor)
+        return None
+    merge = threading.Thread(target=merge_segments, args=('segments', merge_factor)) # not a daemon thread, so the script waits for the merge to finish before exiting
+    merge.start()
+    return merge
+
+
+def reference_weights(counts):
+    """
+    This function calculates the TF-IDF weights the way the first version of this module did, as the reference of check_weights.
+
+    The TF weights are held in a dense pandas DataFrame of every term and document, and the document frequency and IDF weight of every term
+    are calculated in a loop over the terms from the value counts of its row. The document frequency is the number of documents minus the
+    count of the zero weights of the row (the first version took the count of the most common weight instead, which is only the count of the
+    zeros for the terms that occur in fewer than half the documents). It takes memory in the number of terms times the number of documents,
+    so it is only meant for small corpora such as the bundled one, and pandas is only needed for it.
+
+    Args:
+        counts (SparseIndex): The postings holding the term counts of all the documents, as returned by collect_counts.
+
+    Returns:
+        tf_idf (DataFrame): The TF-IDF weights, with the terms as rows and the docIDs as columns.
+        idf (Series): The IDF weight of each term.
+    """
+
+    import pandas as pd
+
+    doc = counts.docIDs.tolist()
+    tf = {} # {term: {docID: TF weight}}
+    for t, term in enumerate(counts.terms):
+        doc_index, term_counts = counts.term_postings(t)
+        tf[term] = {doc[i]: 1 + m.log(term_count, 10) for i, term_count in zip(doc_index.tolist(), term_counts.tolist())}
+    tf = pd.DataFrame(tf).transpose().reindex(columns=doc).fillna(0) # the terms as rows and every document as a column, the absent terms have a weight of zero
+
+    idf = {}
+    for term in tf.index: # loop through each term
+        frequency = tf.loc[term].value_counts() # the number of documents with each weight
+        idf[term] = m.log(len(doc) / (len(doc) - frequency.get(0, 0)), 10)
+    idf = pd.Series(idf)
+
+    tf_idf = tf.mul(idf, axis=0) # multiply every row by the IDF weight of its term
+    return tf_idf, idf
+
+
+def compare_reference(tf_idf, reference):
+    """
+    This function compares TF-IDF weights with the weights of reference_weights.
+
+    Args:
+        tf_idf (SparseIndex): The unnormalized TF-IDF postings, with the IDF weights.
+        reference (tuple): The TF-IDF weights and the IDF weights returned by reference_weights for the same term counts.
+
+    Returns:
+        matches (bool): True if the vocabulary is the same and all the weights agree up to floating point rounding.
+    """
+
+    reference_tf_idf, reference_idf = reference
+    terms = list(tf_idf.terms)
+    if set(terms) != set(reference_tf_idf.index):
+        print("Vocabulary differs from the reference weights")
+        return False
+
+    dense = np.zeros((len(terms), len(tf_idf.docIDs))) # the postings as a dense matrix, in the layout of the reference
+    dense[np.repeat(np.arange(len(terms)), tf_idf.df), tf_idf.doc_index] = tf_idf.weights
+    expected = reference_tf_idf.reindex(index=terms, columns=tf_idf.docIDs.tolist()).to_numpy(dtype=np.float64)
+    expected_idf = reference_idf.reindex(terms).to_numpy(dtype=np.float64)
+
+    matches = True
+    if not np.allclose(tf_idf.idf, expected_idf, rtol=1e-12, atol=0):
+        print("IDF weights differ from the reference for {} terms".format(np.sum(~np.isclose(tf_idf.idf, expected_idf, rtol=1e-12, atol=0))))
+        matches = False
+    if not np.allclose(dense, expected, rtol=1e-12, atol=1e-15):
+        print("TF-IDF weights differ from the reference for {} postings".format(np.sum(~np.isclose(dense, expected, rtol=1e-12, atol=1e-15))))
+        matches = False
+    return matches
+
+
+def check_weights(path='index.vsm'):
+    """
+    This function is a regression check for the weight calculation.
+
+    It recalculates the weights of the documents in the 'ResearchPapers' directory and compares them with the weights calculated from the
+    same term counts by reference_weights, the dense pandas calculation of the first version of this module: the vocabulary, the IDF weights
+    and the TF-IDF weight of every term in every document must agree up to floating point rounding.
+    If there is a saved index, its weights are also compared with the recalculated ones: the vocabulary and the postings must be the same,
+    and the weights must agree up to floating point rounding. A compressed index is compared with the recalculated weights compressed the same way.
+
+    Args:
+        path (str): The path of the saved index file.
+
+    Returns:
+        matches (bool): True if the recalculated weights match the reference weights and the saved ones.
+    """
+
+    counts = collect_counts(preprocessing(), get_docIDs())
+    tf = calculate_TF(counts)
+    idf = calculate_IDF(tf)
+    tf_idf = calculate_TFIDF(tf, idf)
+    matches = compare_reference(tf_idf, reference_weights(counts))
+    if matches:
+        print("Recalculated weights match the reference weights")
+    if not os.path.isfile(path):
+        return matches
+
+    saved = open_index(path) # the weights calculated by the previous run
+    if saved.normalized: # compare the weights the same way they were saved
+        tf_idf = tf_idf.normalize()
+    if isinstance(saved, CompressedIndex):
+        tf_idf = tf_idf.compress(saved.weight_bits, saved.block_size).decompress()
+        saved = saved.decompress()
+
+    if set(saved.terms) != set(tf_idf.terms): # the vocabulary must be the same
+        missing = set(saved.terms) - set(tf_idf.terms)
+        extra = set(tf_idf.terms) - set(saved.terms)
+        print("Vocabulary differs: {} terms missing, {} terms added".format(len(missing), len(extra)))
+        return False # both vocabularies are sorted, so the same terms have the same term IDs
+
+    if not np.array_equal(saved.offsets, tf_idf.offsets) or not np.array_equal(saved.docIDs[saved.doc_index], tf_idf.docIDs[tf_idf.doc_index]): # the same documents must be found for every term
+        print("Postings differ")
+        return False
+
+    saved_matches = True
+    if not np.allclose(saved.idf, tf_idf.idf, rtol=1e-12, atol=0): # compare the IDF weights
+        print("IDF weights differ for {} terms".format(np.sum(~np.isclose(saved.idf, tf_idf.idf, rtol=1e-12, atol=0))))
+        saved_matches = False
+    if not np.allclose(saved.weights, tf_idf.weights, rtol=1e-12, atol=1e-15): # compare the TF-IDF weights of all the postings
+        print("TF-IDF weights differ for {} postings".format(np.sum(~np.isclose(saved.weights, tf_idf.weights, rtol=1e-12, atol=1e-15))))
+        saved_matches = False
+    if not np.allclose(saved.norms, tf_idf.norms, rtol=1e-12, atol=0): # compare the document norms
+        print("Document norms differ for {} documents".format(np.sum(~np.isclose(saved.norms, tf_idf.norms, rtol=1e-12, atol=0))))
+        saved_matches = False
+
+    if saved_matches:
+        print("Recalculated weights match the saved weights")
+    return matches and saved_matches
+
+
+def indexed_counts():
+    """
+    This function returns the term counts of the indexed documents, merged from the segments of the last build (see update_index),
+    or counted from the documents in the 'ResearchPapers' directory if there are no segments.
+
+    Returns:
+        counts (SparseIndex): The postings holding the term counts of all the indexed documents.
+    """
+
+    with manifest_lock('segments'):
+        manifest = load_manifest('segments')
+        if manifest is not None:
+            live = {docID: state['segment'] for docID, state in manifest['documents'].items()}
+            return merge_counts({segment['name']: read_segment(segment['name'], 'segments') for segment in manifest['segments']}, live)
+    return collect_counts(preprocessing(), get_docIDs())
+
+
+def compare_formats(path='index.vsm', weight_bits=8, queries=500, repeat=5, counts=None):
+    """
+    This function reports the size and the scoring throughput of the compressed and the uncompressed formats of an index.
+
+    Both formats are written to temporary files next to the index and memory-mapped, like a Searcher would, and the same
+    random queries (1 to 4 terms, picked in proportion to their document frequency) are scored term-at-a-time with each of them.
+    The scores of the compressed format are also compared with the exact scores, since its weights are quantized. The exact weights
+    are calculated again from the term counts of the indexed documents, as the weights of a compressed index are already quantized.
+
+    Args:
+        path (str): The path of the index file, either format.
+        weight_bits (int): The number of bits the weights of the compressed format are quantized to.
+        queries (int): The number of random queries.
+        repeat (int): The number of times every query is scored.
+        counts (SparseIndex): The term counts of the indexed documents, None for the ones returned by indexed_counts.
+
+    Returns:
+        report (dict): The size in bytes and the number of queries scored per second of each format, the largest score error and the overlap of the top 10 documents.
+    """
 
-    idf.to_csv('idf.csv') # output IDF DataFrame to CSV including the index
-    print("Inverse Document Frequency Weights saved")
+    normalized = open_index(path).normalized
+    tf = calculate_TF(indexed_counts() if counts is None else counts)
+    index = calculate_TFIDF(tf, calculate_IDF(tf)) # the exact weights
+    if normalized: # the weights the same way they were saved
+        index = index.normalize()
+    formats = {'uncompressed': index, 'compressed': index.compress(weight_bits)}
+
+    rng = np.random.default_rng(0) # the same queries every time
+    df = index.df.astype(np.float64)
+    query_vectors = []
+    for _ in range(queries):
+        term_ids = rng.choice(len(df), size=min(int(rng.integers(1, 5)), int(np.count_nonzero(df))), replace=False, p=df / df.sum())
+        query_vector = index.idf[term_ids]
+        norm = np.sqrt(np.sum(query_vector ** 2))
+        query_vectors.append((term_ids.tolist(), query_vector / norm if norm != 0 else query_vector))
+
+    report = {}
+    scores = {}
+    for name, formatted in formats.items():
+        temp_path = path + '.' + name + '.tmp'
+        write_index(formatted, temp_path)
+        try:
+            mapped = open_index(temp_path)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                scores[name] = [score_documents(term_ids, query_vector, mapped) for term_ids, query_vector in query_vectors]
+            elapsed = time.perf_counter() - start
+            report[name] = {'bytes': os.path.getsize(temp_path), 'queries_per_second': queries * repeat / elapsed}
+            del mapped
+        finally:
+            os.remove(temp_path)
+
+    errors = [np.max(np.abs(exact - approximate), initial=0.0) for exact, approximate in zip(scores['uncompressed'], scores['compressed'])]
+    overlaps = [len(set(np.argsort(-exact, kind='stable')[:10]) & set(np.argsort(-approximate, kind='stable')[:10])) / min(10, len(exact))
+                for exact, approximate in zip(scores['uncompressed'], scores['compressed'])]
+    report['max_score_error'] = float(max(errors))
+    report['top10_overlap'] = float(np.mean(overlaps))
+
+    for name in formats:
+        print("{:>12}: {:>10} bytes, {:>8.0f} queries/s".format(name, report[name]['bytes'], report[name]['queries_per_second']))
+    print("Compressed is {:.1%} of the size, largest score error {:.2e}, top 10 overlap {:.1%}".format(
+        report['compressed']['bytes'] / report['uncompressed']['bytes'], report['max_score_error'], report['top10_overlap']))
+    return report
 
 
 def main():
-    if (not os.path.isfile('tf-idf.csv') or not os.path.isfile('idf.csv')): # check if the indexes already exist, if they don't, call the save_indexes function
-        save_weights()
-    else:
-        print("Weights are already calculated")
+    if len(sys.argv) > 1 and sys.argv[1] == '--check': # 'python weights_calculation.py --check' compares freshly calculated weights with the reference and the saved ones
+        sys.exit(0 if check_weights() else 1)
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--compare-formats': # 'python weights_calculation.py --compare-formats' reports the size and speed of the compressed format
+        compare_formats()
+        return
+
+    if '--trace' in sys.argv: # 'python weights_calculation.py --trace trace.jsonl' logs the time taken by every stage, '-' logs to stderr
+        enable_tracing(sys.argv[sys.argv.index('--trace') + 1])
+    if '--profile' in sys.argv: # 'python weights_calculation.py --profile cprofile' (or tracemalloc) profiles the whole run
+        set_profile_mode(sys.argv[sys.argv.index('--profile') + 1])
+
+    shards = int(sys.argv[sys.argv.index('--shards') + 1]) if '--shards' in sys.argv else None # 'python weights_calculation.py --shards 4' also splits the index into 4 shards
+    weight_bits = int(sys.argv[sys.argv.index('--compress') + 1]) if '--compress' in sys.argv else None # 'python weights_calculation.py --compress 8' compresses the postings, '--compress 0' stops compressing them
+    positions = True if '--positions' in sys.argv else False if '--no-positions' in sys.argv else None # 'python weights_calculation.py --positions' also saves the positions of the terms, for phrase queries
+    ann = int(sys.argv[sys.argv.index('--ann') + 1]) if '--ann' in sys.argv else None # 'python weights_calculation.py --ann 128' also builds an ANN index of 128 dimensions, '--ann 0' stops building it
+
+    with trace('indexing', arguments=sys.argv[1:]), profile('indexing'):
+        if '--rebuild' in sys.argv[1:]: # 'python weights_calculation.py --rebuild' reindexes every document from scratch
+            save_weights(shards=shards, weight_bits=weight_bits, positions=positions, ann=ann)
+        elif not is_index('index.vsm'): # check if an index of the current format already exists, if it doesn't, call the save_weights function
+            save_weights(shards=shards, weight_bits=weight_bits, positions=positions, ann=ann)
+        else: # otherwise only index the documents that changed
+            merge = update_index(shards=shards, weight_bits=weight_bits, positions=positions, ann=ann)
+            if merge is not None:
+                merge.join() # the merge is part of the run
 
 
 if __name__ == '__main__':